@@ -264,4 +264,34 @@ def create_app(config_class=Config):
     app.register_blueprint(main)
     app.register_blueprint(auth_bp)
     
+    # Per-call LLM token/latency ledger, stored next to analysis_log
+    from app.llm_usage import LLMUsage
+    with app.app_context():
+        try:
+            LLMUsage.__table__.create(bind=db.engine, checkfirst=True)
+        except Exception as e:
+            app.logger.error("Could not ensure llm_usage table: %s", str(e))
+    
+    # analysis_log holds the analysis documents (JSONB) when ANALYSIS_STORAGE_BACKEND=postgres;
+    # its JSONB upgrade and indexes are applied by `flask migrate-analysis-log`
+    from app.analysis_log import AnalysisLog, migrate_analysis_log_command
+    from app.pg_storage import import_analyses_command
+    from app.storage import compress_analyses_command
+    from app.image_store import gc_images_command
+    with app.app_context():
+        try:
+            AnalysisLog.ensure_schema()
+        except Exception as e:
+            app.logger.error("Could not ensure analysis_log schema: %s", str(e))
+    app.cli.add_command(migrate_analysis_log_command)
+    app.cli.add_command(import_analyses_command)
+    app.cli.add_command(compress_analyses_command)
+    app.cli.add_command(gc_images_command)
+    
+    # Background generation worker (handlers are registered by the routes import); it starts
+    # with the first request, or runs on its own with `flask run-jobs`
+    from app.jobs import job_queue, run_jobs_command
+    job_queue.init_app(app)
+    app.cli.add_command(run_jobs_command)
+    
     return app
\ No newline at end of file
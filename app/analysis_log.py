@@ -1,24 +1,39 @@
 from datetime import datetime
+import logging
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import text
+from sqlalchemy.dialects.postgresql import JSONB
 from app import db
 import uuid
- 
+
+logger = logging.getLogger(__name__)
+
+# Indexes for listing and searching analyses on PostgreSQL (created by `flask migrate-analysis-log`)
+POSTGRES_INDEXES = {
+    "ix_analysis_log_useremail_created_at": "ON analysis_log (useremail, created_at DESC)",
+    "ix_analysis_log_created_at": "ON analysis_log (created_at DESC)",
+    "ix_analysis_log_course_topic": "ON analysis_log ((lower(data->>'course_topic')))",
+    "ix_analysis_log_data": "ON analysis_log USING gin (data jsonb_path_ops)",
+}
+
 class AnalysisLog(db.Model):
     __tablename__ = 'analysis_log'
- 
+
     id = db.Column(db.String, primary_key=True, default=lambda: str(uuid.uuid4()))
     useremail = db.Column(db.String, nullable=False)
     analysis_id = db.Column(db.String, nullable=False, unique=True)
-    data = db.Column(db.JSON)
+    data = db.Column(db.JSON().with_variant(JSONB(), 'postgresql'))
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
- 
+
     @classmethod
     def create(cls, useremail, analysis_id, data):
         log = cls(useremail=useremail, analysis_id=analysis_id, data=data)
         db.session.add(log)
         db.session.commit()
         return log
- 
+
     @classmethod
     def update_by_analysis_id(cls, analysis_id, useremail=None, data=None):
         log = cls.query.filter_by(analysis_id=analysis_id).first()
@@ -30,4 +45,80 @@ class AnalysisLog(db.Model):
             log.data = data
         log.updated_at = datetime.utcnow()
         db.session.commit()
-        return log
\ No newline at end of file
+        return log
+
+    @classmethod
+    def list_for_user(cls, useremail, course_topic=None, limit=50):
+        """A user's analyses, newest first, without loading their documents."""
+        topic = cls.data['course_topic'].as_string()
+        query = (db.session.query(cls.analysis_id, topic, cls.created_at, cls.updated_at)
+                 .filter(cls.useremail == useremail))
+        if course_topic:
+            query = query.filter(db.func.lower(topic) == course_topic.lower())
+        rows = query.order_by(cls.created_at.desc()).limit(limit).all()
+        return [{
+            'analysis_id': analysis_id,
+            'course_topic': topic_value,
+            'created_at': created_at.isoformat(),
+            'updated_at': updated_at.isoformat()
+        } for analysis_id, topic_value, created_at, updated_at in rows]
+
+    @classmethod
+    def ensure_schema(cls):
+        """
+        Create the table if missing. Cheap enough to run in every process at startup;
+        upgrading an existing table is left to migrate_schema().
+        """
+        cls.__table__.create(bind=db.engine, checkfirst=True)
+        if db.engine.dialect.name == 'postgresql' and cls._postgres_data_type() == 'json':
+            logger.warning("analysis_log.data is still json; run `flask migrate-analysis-log`")
+
+    @classmethod
+    def _postgres_data_type(cls):
+        with db.engine.connect() as conn:
+            return conn.execute(text(
+                "SELECT data_type FROM information_schema.columns"
+                " WHERE table_name = 'analysis_log' AND column_name = 'data'"
+            )).scalar()
+
+    @classmethod
+    def migrate_schema(cls, echo=print):
+        """
+        Upgrade analysis_log on PostgreSQL: convert data to JSONB and build the indexes.
+
+        Meant to be run once per deploy (see `flask migrate-analysis-log`), not at
+        startup: the type change rewrites the table under an exclusive lock. Indexes
+        are built CONCURRENTLY so reads and writes continue meanwhile; a build that
+        was interrupted leaves an invalid index, which is dropped and rebuilt.
+        """
+        cls.__table__.create(bind=db.engine, checkfirst=True)
+        if db.engine.dialect.name != 'postgresql':
+            echo("Not PostgreSQL, nothing to migrate")
+            return
+
+        if cls._postgres_data_type() == 'json':
+            echo("Converting analysis_log.data to jsonb...")
+            with db.engine.begin() as conn:
+                conn.execute(text("ALTER TABLE analysis_log ALTER COLUMN data TYPE jsonb USING data::jsonb"))
+
+        # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+        with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+            for name, definition in POSTGRES_INDEXES.items():
+                valid = conn.execute(text(
+                    "SELECT i.indisvalid FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid"
+                    " WHERE c.relname = :name"
+                ), {'name': name}).scalar()
+                if valid:
+                    continue
+                if valid is False:
+                    conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+                echo(f"Creating index {name}...")
+                conn.execute(text(f"CREATE INDEX CONCURRENTLY {name} {definition}"))
+        echo("analysis_log is up to date")
+
+
+@click.command('migrate-analysis-log')
+@with_appcontext
+def migrate_analysis_log_command():
+    """Convert analysis_log.data to JSONB and build its indexes (PostgreSQL)."""
+    AnalysisLog.migrate_schema(echo=click.echo)
@@ -0,0 +1,144 @@
+"""
+Prebuilt export archives.
+
+Building the materials download re-parses every component, so finished ZIPs
+are kept on disk under ``EXPORT_CACHE_DIR/<analysis_id>/<key>.zip``. The key
+is a content hash of everything the archive is built from (see
+``content_key``), so a stale archive is never served; app.storage also drops
+an analysis's archives whenever its course materials are written, to free the
+space early. The directory is bounded by EXPORT_CACHE_MAX_MB, evicting the
+least recently downloaded archives first.
+"""
+
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+import threading
+
+from models import json_codec
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', '.exports')
+
+
+def content_key(*parts):
+    """Hex digest identifying an export built from ``parts`` (JSON-serialisable values)."""
+    return hashlib.sha256(json_codec.dumps(list(parts))).hexdigest()
+
+
+class ExportCache:
+    """Finished export archives on disk, keyed by analysis id and content hash."""
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.stored = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    def path(self, analysis_id, key):
+        return os.path.join(self.directory, analysis_id, f"{key}.zip")
+
+    def get(self, analysis_id, key):
+        """Path of the cached archive, or None."""
+        if not self.max_bytes:
+            return None
+        filepath = self.path(analysis_id, key)
+        try:
+            # The mtime doubles as the last-used time for eviction
+            os.utime(filepath)
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return filepath
+
+    def tee(self, analysis_id, key, chunks):
+        """
+        Yield ``chunks`` while saving them as the archive for ``key``.
+
+        The archive is only stored if every chunk was produced and sent; a
+        failed build or a client that disconnects leaves nothing behind.
+        ``key`` may also be a callable, called once the archive is complete,
+        for archives whose inputs change while they are built; if it returns
+        None the archive is not stored.
+        """
+        if not self.max_bytes:
+            yield from chunks
+            return
+        directory = os.path.join(self.directory, analysis_id)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in chunks:
+                    f.write(chunk)
+                    yield chunk
+            if callable(key):
+                key = key()
+                if key is None:
+                    return
+            filepath = self.path(analysis_id, key)
+            try:
+                os.replace(tmp_path, filepath)
+            except FileNotFoundError:
+                # Invalidated while streaming: the archive is out of date anyway
+                logger.debug(f"Export for {analysis_id} invalidated while it was built")
+                return
+        finally:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+        with self._lock:
+            self.stored += 1
+        self._prune()
+
+    def invalidate(self, analysis_id):
+        """Drop every cached archive of one analysis."""
+        shutil.rmtree(os.path.join(self.directory, analysis_id), ignore_errors=True)
+
+    def _prune(self):
+        archives = []
+        for dirpath, _, filenames in os.walk(self.directory):
+            for name in filenames:
+                if name.endswith('.zip'):
+                    try:
+                        st = os.stat(os.path.join(dirpath, name))
+                    except FileNotFoundError:
+                        continue
+                    archives.append((st.st_mtime, st.st_size, os.path.join(dirpath, name)))
+        total = sum(size for _, size, _ in archives)
+        for _, size, filepath in sorted(archives):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.unlink(filepath)
+            except FileNotFoundError:
+                pass
+            total -= size
+            with self._lock:
+                self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "stored": self.stored,
+                "evictions": self.evictions,
+                "max_bytes": self.max_bytes
+            }
+
+
+export_cache = ExportCache(
+    os.environ.get('EXPORT_CACHE_DIR') or DEFAULT_DIR,
+    int(float(os.environ.get('EXPORT_CACHE_MAX_MB', 512)) * 1024 * 1024)
+)
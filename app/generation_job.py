@@ -0,0 +1,150 @@
+from datetime import datetime, timedelta
+from app import db
+import uuid
+
+class GenerationJob(db.Model):
+    __tablename__ = 'generation_job'
+
+    id = db.Column(db.String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    analysis_id = db.Column(db.String, nullable=False, index=True)
+    kind = db.Column(db.String, nullable=False)
+    params = db.Column(db.JSON)
+    status = db.Column(db.String, nullable=False, default='queued', index=True)  # queued | running | succeeded | failed
+    result = db.Column(db.JSON)
+    error = db.Column(db.Text)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    worker = db.Column(db.String)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    heartbeat_at = db.Column(db.DateTime)
+
+    ACTIVE_STATUSES = ('queued', 'running')
+
+    @classmethod
+    def create(cls, analysis_id, kind, params):
+        job = cls(analysis_id=analysis_id, kind=kind, params=params, status='queued')
+        db.session.add(job)
+        db.session.commit()
+        return job
+
+    @classmethod
+    def get(cls, job_id):
+        return cls.query.filter_by(id=job_id).first()
+
+    @classmethod
+    def find_active(cls, analysis_id, kind, params):
+        """Return a queued/running job with identical parameters, if any."""
+        jobs = cls.query.filter(cls.analysis_id == analysis_id,
+                                cls.kind == kind,
+                                cls.status.in_(cls.ACTIVE_STATUSES)).all()
+        for job in jobs:
+            if job.params == params:
+                return job
+        return None
+
+    @classmethod
+    def queued_ids(cls, limit):
+        rows = (cls.query.with_entities(cls.id)
+                .filter_by(status='queued')
+                .order_by(cls.created_at)
+                .limit(limit)
+                .all())
+        return [row.id for row in rows]
+
+    @classmethod
+    def claim(cls, job_id, worker):
+        """Atomically move a queued job to running; returns True if this worker won it."""
+        now = datetime.utcnow()
+        claimed = cls.query.filter_by(id=job_id, status='queued').update({
+            'status': 'running',
+            'worker': worker,
+            'started_at': now,
+            'heartbeat_at': now,
+            'attempts': cls.attempts + 1,
+        }, synchronize_session=False)
+        db.session.commit()
+        return claimed == 1
+
+    @classmethod
+    def heartbeat(cls, job_ids, worker):
+        """Refresh the heartbeat of jobs this worker still owns."""
+        if not job_ids:
+            return
+        cls.query.filter(cls.id.in_(job_ids), cls.worker == worker, cls.status == 'running').update(
+            {'heartbeat_at': datetime.utcnow()}, synchronize_session=False)
+        db.session.commit()
+
+    @classmethod
+    def requeue_stale(cls, stale_after_seconds, max_attempts):
+        """
+        Put running jobs whose worker stopped heartbeating back on the queue.
+
+        Jobs that already ran ``max_attempts`` times are failed instead, so a job
+        that kills its worker cannot loop forever. Returns (requeued, failed).
+        """
+        now = datetime.utcnow()
+        stale = (cls.status == 'running', cls.heartbeat_at < now - timedelta(seconds=stale_after_seconds))
+        failed = cls.query.filter(*stale, cls.attempts >= max_attempts).update({
+            'status': 'failed',
+            'error': f'Worker stopped responding ({max_attempts} attempts)',
+            'worker': None,
+            'finished_at': now,
+        }, synchronize_session=False)
+        requeued = cls.query.filter(*stale).update(
+            {'status': 'queued', 'worker': None}, synchronize_session=False)
+        db.session.commit()
+        return requeued, failed
+
+    @classmethod
+    def finish(cls, job_id, worker, result=None, error=None):
+        """
+        Record a job's outcome if ``worker`` still owns it.
+
+        Returns False when the job was requeued or failed in the meantime (the
+        worker was presumed dead), so a late worker cannot overwrite it.
+        """
+        finished = cls.query.filter_by(id=job_id, worker=worker, status='running').update({
+            'status': 'failed' if error else 'succeeded',
+            'result': result,
+            'error': error,
+            'finished_at': datetime.utcnow(),
+        }, synchronize_session=False)
+        db.session.commit()
+        return finished == 1
+
+    def to_dict(self):
+        return {
+            'job_id': self.id,
+            'analysis_id': self.analysis_id,
+            'kind': self.kind,
+            'status': self.status,
+            'result': self.result,
+            'error': self.error,
+            'attempts': self.attempts,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+
+class GenerationJobEvent(db.Model):
+    __tablename__ = 'generation_job_event'
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    job_id = db.Column(db.String, db.ForeignKey('generation_job.id'), nullable=False, index=True)
+    data = db.Column(db.JSON, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    @classmethod
+    def add(cls, job_id, data):
+        event = cls(job_id=job_id, data=data)
+        db.session.add(event)
+        db.session.commit()
+        return event
+
+    @classmethod
+    def since(cls, job_id, after_id=0):
+        return (cls.query.filter(cls.job_id == job_id, cls.id > after_id)
+                .order_by(cls.id)
+                .all())
@@ -0,0 +1,65 @@
+"""
+Analysis id allocation.
+
+New ids look like ``analysis_20261017063052123_0J5X8Q2M4R7TA``: the UTC time of
+creation to the millisecond, then 13 Crockford base32 characters (65 random
+bits). Like a ULID they sort by creation time, and ids made in the same
+millisecond by one process are strictly increasing. Because they keep the
+``analysis_<YYYYMMDDHHMMSS>`` prefix, they also sort after the older
+second-resolution ids (``analysis_20250703125358``), which stay valid.
+"""
+
+import random
+import re
+import threading
+from datetime import datetime, timezone
+
+_CROCKFORD = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+_RANDOM_CHARS = 13
+_RANDOM_BITS = _RANDOM_CHARS * 5
+
+_LEGACY_ID_RE = re.compile(r'^analysis_(\d{14})$')
+_ID_RE = re.compile(r'^analysis_(\d{17})_[0-9A-HJKMNP-TV-Z]{13}$')
+
+_random = random.SystemRandom()
+_lock = threading.Lock()
+_last = (None, 0)
+
+
+def _encode(value, length):
+    chars = []
+    for _ in range(length):
+        chars.append(_CROCKFORD[value & 31])
+        value >>= 5
+    return ''.join(reversed(chars))
+
+
+def new_analysis_id(now=None):
+    """Allocate a new, time-sortable analysis id."""
+    global _last
+    now = now or datetime.now(timezone.utc)
+    stamp = now.strftime('%Y%m%d%H%M%S') + f"{now.microsecond // 1000:03d}"
+    with _lock:
+        last_stamp, last_random = _last
+        if stamp == last_stamp and last_random + 1 < (1 << _RANDOM_BITS):
+            # Same millisecond: keep ids from this process in order
+            value = last_random + 1
+        else:
+            value = _random.getrandbits(_RANDOM_BITS)
+        _last = (stamp, value)
+    return f"analysis_{stamp}_{_encode(value, _RANDOM_CHARS)}"
+
+
+def analysis_id_time(analysis_id):
+    """
+    When an analysis id was allocated, or None if it is not a generated id.
+
+    New ids carry UTC time; legacy ids carry server local time and are returned naive.
+    """
+    match = _ID_RE.match(analysis_id or '')
+    if match:
+        return datetime.strptime(match.group(1), '%Y%m%d%H%M%S%f').replace(tzinfo=timezone.utc)
+    match = _LEGACY_ID_RE.match(analysis_id or '')
+    if match:
+        return datetime.strptime(match.group(1), '%Y%m%d%H%M%S')
+    return None
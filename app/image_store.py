@@ -0,0 +1,304 @@
+"""
+Content-addressed storage for module images.
+
+Image bytes are stored once, named by their sha256, under
+``moduleimages/.blobs/<ab>/<sha256>``. Each analysis has a small manifest,
+``moduleimages/.manifests/<analysis_id>.json``, mapping the file names its
+materials use (``moduleimages/<analysis_id>/<filename>`` URLs) to blobs, so
+the same photo used by many courses takes the disk space of one, and two
+different images that share a basename no longer overwrite each other.
+
+Remote images are also indexed by source URL (a SQLite table next to the
+blobs), so an image already fetched for any analysis is linked instead of
+downloaded again.
+
+Files saved in ``moduleimages/<analysis_id>/`` before this store existed are
+still served; ``flask gc-images --import-legacy`` moves them into it.
+Unreferenced blobs are removed by ``flask gc-images``.
+"""
+
+import hashlib
+import logging
+import mimetypes
+import os
+import re
+import tempfile
+import threading
+import time
+from concurrent.futures import Future
+
+import click
+
+from app.storage import analysis_lock, atomic_write, record_cache
+from models import json_codec
+from models.cache import SQLiteCache
+from models.image_downloader import get_image_downloader
+
+logger = logging.getLogger(__name__)
+
+IMAGES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'moduleimages')
+
+_NAME_RE = re.compile(r'^[A-Za-z0-9_\-]+$')
+_SHA256_RE = re.compile(r'^[0-9a-f]{64}$')
+# Blobs younger than this are never collected, so a put that has written its
+# blob but not yet its manifest entry cannot lose it
+GC_GRACE_SECONDS = 3600
+
+
+def _check_filename(filename):
+    if not filename or filename != os.path.basename(filename) or filename.startswith('.'):
+        raise ValueError(f"Invalid image file name: {filename!r}")
+    return filename
+
+
+class ImageStore:
+    """sha256-addressed image blobs with a per-analysis manifest of file names."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.blob_dir = os.path.join(directory, '.blobs')
+        self.manifest_dir = os.path.join(directory, '.manifests')
+        self.incoming_dir = os.path.join(self.blob_dir, 'incoming')
+        self._urls = None
+        self._urls_lock = threading.Lock()
+        # Serialises ingesting downloads, so a URL maps to one blob
+        self._lock = threading.Lock()
+
+    def _url_index(self):
+        with self._urls_lock:
+            if self._urls is None:
+                self._urls = SQLiteCache(os.path.join(self.blob_dir, 'urls.sqlite3'), table='image_urls')
+            return self._urls
+
+    def blob_path(self, sha256):
+        return os.path.join(self.blob_dir, sha256[:2], sha256)
+
+    def manifest_path(self, analysis_id):
+        if not _NAME_RE.match(analysis_id or ''):
+            raise ValueError(f"Invalid analysis id: {analysis_id!r}")
+        return os.path.join(self.manifest_dir, f"{analysis_id}.json")
+
+    def legacy_dir(self, analysis_id):
+        """Folder images were saved to before the blob store."""
+        self.manifest_path(analysis_id)
+        return os.path.join(self.directory, analysis_id)
+
+    def manifest(self, analysis_id):
+        """{filename: {"sha256": ..., "url": ...}} for one analysis (shared, read-only)."""
+        return (record_cache.load(self.manifest_path(analysis_id)) or {}).get('files', {})
+
+    def add_file(self, src_path):
+        """Move a file into the blob store and return its sha256."""
+        digest = hashlib.sha256()
+        with open(src_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(64 * 1024), b''):
+                digest.update(chunk)
+        sha256 = digest.hexdigest()
+        if self._touch(sha256):
+            os.unlink(src_path)
+        else:
+            blob = self.blob_path(sha256)
+            os.makedirs(os.path.dirname(blob), exist_ok=True)
+            os.replace(src_path, blob)
+        return sha256
+
+    def _touch(self, sha256):
+        """Refresh a blob's mtime so a concurrent gc treats it as new; False if it is gone."""
+        try:
+            os.utime(self.blob_path(sha256))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def link(self, analysis_id, filename, sha256, url=None):
+        """Point ``filename`` of an analysis at a blob."""
+        _check_filename(filename)
+        manifest_path = self.manifest_path(analysis_id)
+        with analysis_lock(analysis_id):
+            files = dict(self.manifest(analysis_id))
+            entry = {'sha256': sha256}
+            if url:
+                entry['url'] = url
+            if files.get(filename) == entry:
+                return
+            files[filename] = entry
+            os.makedirs(self.manifest_dir, exist_ok=True)
+            atomic_write(manifest_path, json_codec.dumps({'files': files}))
+            record_cache.discard(manifest_path)
+
+    def save_upload(self, analysis_id, filename, storage):
+        """Store an uploaded werkzeug FileStorage as ``filename``."""
+        _check_filename(filename)
+        self.manifest_path(analysis_id)
+        os.makedirs(self.incoming_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.incoming_dir, prefix='.tmp-', suffix='.upload')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                storage.save(f)
+            self.link(analysis_id, filename, self.add_file(tmp_path))
+        finally:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+
+    def _blob_for_url(self, url):
+        """Blob already downloaded from ``url``, touched so gc keeps it until it is linked."""
+        value = self._url_index().get(url)
+        if value is not None and self._touch(value.decode('ascii')):
+            return value.decode('ascii')
+        return None
+
+    def _ingest_download(self, url, incoming):
+        with self._lock:
+            sha256 = self._blob_for_url(url)
+            if sha256 is None:
+                try:
+                    sha256 = self.add_file(incoming)
+                except FileNotFoundError:
+                    # Another worker ingested the same download first
+                    return self._blob_for_url(url)
+                self._url_index().set(url, sha256.encode('ascii'))
+            elif os.path.exists(incoming):
+                os.unlink(incoming)
+            return sha256
+
+    def fetch(self, analysis_id, filename, url):
+        """
+        Make ``url`` available as ``filename`` of an analysis, downloading it if needed.
+
+        Returns a future resolving to True when the image is stored. Files the
+        analysis already has and URLs fetched before are not downloaded again.
+        """
+        result = Future()
+        if self.path(analysis_id, filename):
+            result.set_result(True)
+            return result
+        sha256 = self._blob_for_url(url)
+        if sha256:
+            self.link(analysis_id, filename, sha256, url)
+            result.set_result(True)
+            return result
+
+        os.makedirs(self.incoming_dir, exist_ok=True)
+        incoming = os.path.join(self.incoming_dir, hashlib.sha256(url.encode('utf-8')).hexdigest())
+
+        def ingest(download):
+            try:
+                sha256 = download.result() and self._ingest_download(url, incoming)
+                if sha256:
+                    self.link(analysis_id, filename, sha256, url)
+                result.set_result(bool(sha256))
+            except Exception as e:
+                logger.warning(f"Could not store image {url}: {e}")
+                result.set_result(False)
+
+        get_image_downloader().download(url, incoming).add_done_callback(ingest)
+        return result
+
+    def path(self, analysis_id, filename):
+        """Local file holding ``filename`` of an analysis, or None."""
+        entry = self.manifest(analysis_id).get(filename)
+        if entry is not None:
+            blob = self.blob_path(entry['sha256'])
+            if os.path.exists(blob):
+                return blob
+        legacy = os.path.join(self.legacy_dir(analysis_id), _check_filename(filename))
+        return legacy if os.path.isfile(legacy) else None
+
+    def files(self, analysis_id):
+        """Every image of an analysis as {filename: local path}."""
+        found = {}
+        legacy_dir = self.legacy_dir(analysis_id)
+        if os.path.isdir(legacy_dir):
+            for name in os.listdir(legacy_dir):
+                if os.path.isfile(os.path.join(legacy_dir, name)) and not name.startswith('.'):
+                    found[name] = os.path.join(legacy_dir, name)
+        for filename, entry in self.manifest(analysis_id).items():
+            blob = self.blob_path(entry['sha256'])
+            if os.path.exists(blob):
+                found[filename] = blob
+        return found
+
+    @staticmethod
+    def mimetype(filename):
+        return mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+
+    def import_legacy(self):
+        """Move files from moduleimages/<analysis_id>/ into the store; returns the count."""
+        moved = 0
+        for analysis_id in os.listdir(self.directory):
+            legacy_dir = os.path.join(self.directory, analysis_id)
+            if not _NAME_RE.match(analysis_id) or not os.path.isdir(legacy_dir):
+                continue
+            for name in os.listdir(legacy_dir):
+                filepath = os.path.join(legacy_dir, name)
+                if name.startswith('.') or not os.path.isfile(filepath):
+                    continue
+                # Names already in the manifest were stored since; the legacy copy is stale
+                if name in self.manifest(analysis_id):
+                    os.unlink(filepath)
+                    continue
+                self.link(analysis_id, name, self.add_file(filepath))
+                moved += 1
+            if not os.listdir(legacy_dir):
+                os.rmdir(legacy_dir)
+        return moved
+
+    def gc(self, grace=GC_GRACE_SECONDS):
+        """
+        Delete blobs no manifest references and the URL index rows pointing at them.
+
+        Returns (blobs removed, bytes freed, URLs forgotten).
+        """
+        referenced = set()
+        if os.path.isdir(self.manifest_dir):
+            for name in os.listdir(self.manifest_dir):
+                if name.endswith('.json'):
+                    files = (record_cache.load(os.path.join(self.manifest_dir, name)) or {}).get('files', {})
+                    referenced.update(entry['sha256'] for entry in files.values())
+
+        removed = freed = 0
+        cutoff = time.time() - grace
+        for dirpath, _, filenames in os.walk(self.blob_dir):
+            for name in filenames:
+                filepath = os.path.join(dirpath, name)
+                is_blob = _SHA256_RE.match(name) and dirpath != self.incoming_dir
+                is_stale_download = dirpath == self.incoming_dir
+                if not (is_blob and name not in referenced) and not is_stale_download:
+                    continue
+                try:
+                    st = os.stat(filepath)
+                    if st.st_mtime > cutoff:
+                        continue
+                    os.unlink(filepath)
+                except FileNotFoundError:
+                    continue
+                removed += 1
+                freed += st.st_size
+        return removed, freed, self._prune_url_index()
+
+    def _prune_url_index(self):
+        """Drop URL index rows whose blob no longer exists; returns how many."""
+        index = self._url_index()
+        pruned = 0
+        for url, value in index.items():
+            if not os.path.exists(self.blob_path(value.decode('ascii'))):
+                index.delete(url)
+                pruned += 1
+        return pruned
+
+
+image_store = ImageStore(os.environ.get('MODULE_IMAGES_DIR') or IMAGES_DIR)
+
+
+@click.command('gc-images')
+@click.option('--import-legacy', is_flag=True,
+              help='First move images saved under moduleimages/<analysis_id>/ into the store.')
+@click.option('--grace', type=int, default=GC_GRACE_SECONDS, show_default=True,
+              help='Keep unreferenced blobs younger than this many seconds.')
+def gc_images_command(import_legacy, grace):
+    """Delete image blobs that no analysis references."""
+    if import_legacy:
+        click.echo(f"Imported {image_store.import_legacy()} legacy images")
+    removed, freed, forgotten = image_store.gc(grace)
+    click.echo(f"Removed {removed} unreferenced image blobs ({freed / 1024 / 1024:.1f} MB) "
+               f"and {forgotten} stale source URLs")
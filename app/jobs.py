@@ -0,0 +1,212 @@
+"""
+Background job queue for long-running LLM generation.
+
+Jobs are persisted in the ``generation_job`` table so they survive worker
+restarts. Every serving process runs a small poller that claims queued jobs with an
+atomic status update and executes them on a bounded thread pool inside an app
+context. The pool starts with the first request a process serves, or with
+``flask run-jobs`` for a dedicated worker, never in other CLI commands.
+Running jobs heartbeat; if a process dies its jobs go stale and are put
+back on the queue for another process to pick up, up to JOB_MAX_ATTEMPTS runs.
+"""
+
+import contextvars
+import logging
+import os
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import click
+from flask.cli import with_appcontext
+
+from app import db
+from app.generation_job import GenerationJob, GenerationJobEvent
+from app.llm_usage import usage_ledger
+
+logger = logging.getLogger(__name__)
+
+_current_job = contextvars.ContextVar('current_job_id', default=None)
+
+
+def current_job_id():
+    """Id of the job being run by the calling handler, or None outside a job."""
+    return _current_job.get()
+
+
+class JobQueue:
+    """Database-backed job queue with an in-process worker pool."""
+
+    def __init__(self, app=None):
+        self.app = None
+        self.handlers = {}
+        self.failure_endpoints = {}
+        self._executor = None
+        self._poller = None
+        self._start_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._running = set()
+        self._running_lock = threading.Lock()
+        self.worker_name = f"{socket.gethostname()}:{os.getpid()}"
+        if app is not None:
+            self.init_app(app)
+
+    def handler(self, kind, failure_endpoint='main.index'):
+        """
+        Register a job handler.
+
+        The handler is called as ``handler(analysis_id, **params)`` inside an app
+        context and returns a JSON-serialisable result. A result may carry
+        ``redirect`` (endpoint name), ``redirect_args`` and ``message`` keys for the
+        browser flow.
+        ``current_job_id()`` gives the handler the id of the job it is running.
+        """
+        def decorator(func):
+            self.handlers[kind] = func
+            self.failure_endpoints[kind] = failure_endpoint
+            return func
+        return decorator
+
+    def init_app(self, app):
+        self.app = app
+        self.max_workers = app.config.get('JOB_WORKERS', 2)
+        self.poll_interval = app.config.get('JOB_POLL_INTERVAL', 2)
+        self.stale_after = app.config.get('JOB_STALE_AFTER', 120)
+        self.max_attempts = app.config.get('JOB_MAX_ATTEMPTS', 3)
+        app.extensions['job_queue'] = self
+
+        with app.app_context():
+            try:
+                GenerationJob.__table__.create(bind=db.engine, checkfirst=True)
+                GenerationJobEvent.__table__.create(bind=db.engine, checkfirst=True)
+            except Exception as e:
+                app.logger.error("Could not ensure job tables: %s", str(e))
+
+        # CLI commands build the app too; only processes serving requests (or
+        # `flask run-jobs`) may claim jobs, so start on the first request
+        if app.config.get('JOB_QUEUE_ENABLED', True):
+            app.before_request(self.start)
+
+    def start(self):
+        """Start the poller and worker pool in this process (idempotent)."""
+        if self._poller is not None:
+            return
+        with self._start_lock:
+            if self._poller is not None:
+                return
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="job")
+            self._poller = threading.Thread(target=self._poll_loop, name="job-poller", daemon=True)
+            self._poller.start()
+        logger.info("Job queue started on %s with %d workers", self.worker_name, self.max_workers)
+
+    def run_forever(self):
+        """Run jobs in this process until it is stopped (for a dedicated worker)."""
+        self.start()
+        self._poller.join()
+
+    def enqueue(self, kind, analysis_id, **params):
+        """Persist a job and wake the poller. Identical active jobs are reused."""
+        if kind not in self.handlers:
+            raise ValueError(f"Unknown job kind: {kind}")
+
+        existing = GenerationJob.find_active(analysis_id, kind, params)
+        if existing:
+            logger.info("Reusing active %s job %s for %s", kind, existing.id, analysis_id)
+            return existing
+
+        job = GenerationJob.create(analysis_id, kind, params)
+        logger.info("Queued %s job %s for %s", kind, job.id, analysis_id)
+        self._wakeup.set()
+        return job
+
+    def progress_reporter(self, job_id):
+        """
+        Return a thread-safe callable that stores progress events for ``job_id``.
+
+        Events are persisted so any app process can stream them (see /jobs/<id>/events).
+        """
+        app = self.app
+
+        def report(event):
+            with app.app_context():
+                GenerationJobEvent.add(job_id, event)
+
+        return report
+
+    def _free_slots(self):
+        with self._running_lock:
+            return self.max_workers - len(self._running)
+
+    def _poll_loop(self):
+        while True:
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+            try:
+                with self.app.app_context():
+                    with self._running_lock:
+                        running = list(self._running)
+                    GenerationJob.heartbeat(running, self.worker_name)
+                    requeued, failed = GenerationJob.requeue_stale(self.stale_after, self.max_attempts)
+                    if requeued:
+                        logger.warning("Requeued %d stale job(s)", requeued)
+                    if failed:
+                        logger.error("Failed %d stale job(s) after %d attempts", failed, self.max_attempts)
+
+                    free = self._free_slots()
+                    if free <= 0:
+                        continue
+                    for job_id in GenerationJob.queued_ids(free):
+                        if GenerationJob.claim(job_id, self.worker_name):
+                            with self._running_lock:
+                                self._running.add(job_id)
+                            self._executor.submit(self._run, job_id)
+            except Exception as e:
+                logger.error("Job poller error: %s", str(e), exc_info=True)
+
+    def _finish(self, job_id, result=None, error=None):
+        finished = GenerationJob.finish(job_id, self.worker_name, result=result, error=error)
+        if not finished:
+            logger.warning("Discarded outcome of job %s: it was taken from this worker as stale", job_id)
+        return finished
+
+    def _run(self, job_id):
+        try:
+            with self.app.app_context():
+                job = GenerationJob.get(job_id)
+                handler = self.handlers.get(job.kind)
+                if handler is None:
+                    self._finish(job_id, error=f"No handler registered for {job.kind}")
+                    return
+
+                logger.info("Running %s job %s for %s", job.kind, job_id, job.analysis_id)
+                token = _current_job.set(job_id)
+                try:
+                    with usage_ledger(job.analysis_id, job_id=job_id):
+                        result = handler(job.analysis_id, **(job.params or {}))
+                except Exception as e:
+                    logger.error("Job %s failed: %s", job_id, str(e), exc_info=True)
+                    db.session.rollback()
+                    self._finish(job_id, error=str(e))
+                    return
+                finally:
+                    _current_job.reset(token)
+
+                if self._finish(job_id, result=result or {}):
+                    logger.info("Job %s finished", job_id)
+        except Exception as e:
+            logger.error("Could not record outcome of job %s: %s", job_id, str(e), exc_info=True)
+        finally:
+            with self._running_lock:
+                self._running.discard(job_id)
+            self._wakeup.set()
+
+
+job_queue = JobQueue()
+
+
+@click.command('run-jobs')
+@with_appcontext
+def run_jobs_command():
+    """Run queued generation jobs in this process until interrupted."""
+    click.echo(f"Running jobs on {job_queue.worker_name} with {job_queue.max_workers} workers")
+    job_queue.run_forever()
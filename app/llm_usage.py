@@ -0,0 +1,95 @@
+from contextlib import contextmanager
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import func
+from app import db
+from models.groq_client import llm_context, record_llm_calls
+
+class LLMUsage(db.Model):
+    __tablename__ = 'llm_usage'
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    analysis_id = db.Column(db.String, nullable=False, index=True)
+    job_id = db.Column(db.String)
+    component = db.Column(db.String)
+    module = db.Column(db.Integer)
+    model = db.Column(db.String)
+    prompt_tokens = db.Column(db.Integer, nullable=False, default=0)
+    completion_tokens = db.Column(db.Integer, nullable=False, default=0)
+    total_tokens = db.Column(db.Integer, nullable=False, default=0)
+    latency_ms = db.Column(db.Integer, nullable=False, default=0)
+    cached = db.Column(db.Boolean, nullable=False, default=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    @classmethod
+    def record_many(cls, analysis_id, calls, job_id=None):
+        """Store call records collected by models.groq_client.record_llm_calls."""
+        if not calls:
+            return
+        db.session.add_all([
+            cls(analysis_id=analysis_id,
+                job_id=job_id,
+                component=call.get('component'),
+                module=call.get('module'),
+                model=call.get('model'),
+                prompt_tokens=call.get('prompt_tokens', 0),
+                completion_tokens=call.get('completion_tokens', 0),
+                total_tokens=call.get('total_tokens', 0),
+                latency_ms=call.get('latency_ms', 0),
+                cached=call.get('cached', False))
+            for call in calls
+        ])
+        db.session.commit()
+
+    @classmethod
+    def breakdown(cls, analysis_id, group_by=('component',)):
+        """Aggregate calls, tokens and latency for an analysis, grouped by the given columns."""
+        columns = [getattr(cls, name) for name in group_by]
+        rows = (db.session.query(
+                    *columns,
+                    func.count(cls.id),
+                    func.sum(db.case((cls.cached.is_(True), 1), else_=0)),
+                    func.sum(cls.prompt_tokens),
+                    func.sum(cls.completion_tokens),
+                    func.sum(cls.total_tokens),
+                    func.sum(cls.latency_ms),
+                    func.max(cls.latency_ms))
+                .filter(cls.analysis_id == analysis_id)
+                .group_by(*columns)
+                .order_by(*columns)
+                .all())
+        result = []
+        for row in rows:
+            keys = dict(zip(group_by, row[:len(group_by)]))
+            calls, cached, prompt, completion, total, latency, slowest = row[len(group_by):]
+            result.append({
+                **keys,
+                'calls': calls,
+                'cached_calls': int(cached or 0),
+                'prompt_tokens': int(prompt or 0),
+                'completion_tokens': int(completion or 0),
+                'total_tokens': int(total or 0),
+                'latency_ms': int(latency or 0),
+                'avg_latency_ms': int((latency or 0) / calls) if calls else 0,
+                'max_latency_ms': int(slowest or 0),
+            })
+        return result
+
+
+@contextmanager
+def usage_ledger(analysis_id, job_id=None):
+    """
+    Record every LLM call made inside the block against an analysis.
+
+    Calls are labelled with the analysis id and written to llm_usage when the
+    block exits, including when it fails, so partial spend is still visible.
+    """
+    with record_llm_calls() as calls, llm_context(analysis_id=analysis_id):
+        try:
+            yield calls
+        finally:
+            try:
+                LLMUsage.record_many(analysis_id, calls, job_id=job_id)
+            except Exception as e:
+                db.session.rollback()
+                current_app.logger.error("Could not record LLM usage for %s: %s", analysis_id, str(e))
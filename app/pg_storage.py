@@ -0,0 +1,203 @@
+"""
+PostgreSQL backend for analysis persistence (ANALYSIS_STORAGE_BACKEND=postgres).
+
+Experimental: it is enabled only together with ANALYSIS_STORAGE_EXPERIMENTAL=true,
+and its statements are tested against a recording session, not a live server.
+
+The analysis document lives in analysis_log.data as JSONB, so every app server
+shares the same state. Reads project out only the fields a view needs and
+writes touch only what changed: top-level fields are merged with ``||`` and a
+single material component is written in place with ``jsonb_set``. Read-modify-
+write updates lock the row (SELECT ... FOR UPDATE) instead of a local file lock.
+"""
+
+import os
+from datetime import datetime
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from app.analysis_log import AnalysisLog
+from app.ids import analysis_id_time
+from models import json_codec
+
+
+class PostgresAnalysisStore:
+    """Analysis storage in analysis_log.data; mirrors the functions in app.storage."""
+
+    def __init__(self, record_fields, materials_field):
+        self.record_fields = record_fields
+        self.materials_field = materials_field
+        self._checked = False
+
+    def _check_dialect(self):
+        if not self._checked:
+            if db.engine.dialect.name != 'postgresql':
+                raise RuntimeError("ANALYSIS_STORAGE_BACKEND=postgres requires a PostgreSQL database")
+            self._checked = True
+
+    def _execute(self, sql, **params):
+        self._check_dialect()
+        return db.session.execute(text(sql), params)
+
+    def analysis_exists(self, analysis_id):
+        return self._execute(
+            "SELECT 1 FROM analysis_log WHERE analysis_id = :id AND data IS NOT NULL",
+            id=analysis_id
+        ).first() is not None
+
+    def load_analysis(self, analysis_id, fields=None):
+        skipped = [] if fields is None else [
+            field for field in (*self.record_fields, self.materials_field) if field not in fields
+        ]
+        row = self._execute(
+            "SELECT data - CAST(:skipped AS text[]) FROM analysis_log WHERE analysis_id = :id",
+            id=analysis_id, skipped=skipped
+        ).first()
+        db.session.commit()
+        return row[0] if row else None
+
+    def _module_query(self, select, lock=False):
+        return (
+            f"SELECT {select} FROM analysis_log,"
+            " jsonb_array_elements(data->'course_materials'->'modules') WITH ORDINALITY AS m(module, idx)"
+            " WHERE analysis_id = :id AND m.module->'number' = to_jsonb(CAST(:number AS integer))"
+            + (" FOR UPDATE OF analysis_log" if lock else "")
+        )
+
+    def load_module(self, analysis_id, module_number, components=None):
+        row = self._execute(self._module_query("m.module"), id=analysis_id, number=module_number).first()
+        db.session.commit()
+        if not row:
+            return None
+        module = row[0]
+        if components is not None:
+            module['components'] = {k: v for k, v in (module.get('components') or {}).items()
+                                    if k in components}
+        return module
+
+    def load_material(self, analysis_id, module_number, component):
+        row = self._execute(self._module_query("m.module->'components'->:component"),
+                            id=analysis_id, number=module_number, component=component).first()
+        db.session.commit()
+        return row[0] if row else None
+
+    def create_analysis(self, analysis_id, data, useremail):
+        from app.storage import AnalysisExistsError
+        try:
+            AnalysisLog.create(useremail=useremail, analysis_id=analysis_id, data=data)
+        except IntegrityError:
+            db.session.rollback()
+            raise AnalysisExistsError(analysis_id)
+        return analysis_id
+
+    def save_analysis(self, analysis_id, data):
+        try:
+            updated = self._execute(
+                "UPDATE analysis_log SET data = CAST(:data AS jsonb), updated_at = :now"
+                " WHERE analysis_id = :id",
+                id=analysis_id, data=json_codec.dumps(data).decode('utf-8'), now=datetime.utcnow()
+            ).rowcount
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        if not updated:
+            # Saved without an owner (e.g. imported); useremail can be set later
+            AnalysisLog.create(useremail='', analysis_id=analysis_id, data=data)
+        return analysis_id
+
+    def update_analysis(self, analysis_id, mutate):
+        try:
+            row = self._execute(
+                "SELECT data FROM analysis_log WHERE analysis_id = :id FOR UPDATE", id=analysis_id
+            ).first()
+            if not row or row[0] is None:
+                db.session.rollback()
+                return None
+            data = row[0]
+            result = mutate(data)
+            if result is not None:
+                data = result
+            self._execute(
+                "UPDATE analysis_log SET data = CAST(:data AS jsonb), updated_at = :now"
+                " WHERE analysis_id = :id",
+                id=analysis_id, data=json_codec.dumps(data).decode('utf-8'), now=datetime.utcnow()
+            )
+            db.session.commit()
+            return data
+        except Exception:
+            db.session.rollback()
+            raise
+
+    def update_analysis_fields(self, analysis_id, fields):
+        try:
+            updated = self._execute(
+                "UPDATE analysis_log SET data = data || CAST(:patch AS jsonb), updated_at = :now"
+                " WHERE analysis_id = :id AND data IS NOT NULL",
+                id=analysis_id, patch=json_codec.dumps(fields).decode('utf-8'), now=datetime.utcnow()
+            ).rowcount
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        return True if updated else None
+
+    def save_material(self, analysis_id, module_number, component, material):
+        try:
+            row = self._execute(self._module_query("m.idx - 1", lock=True),
+                                id=analysis_id, number=module_number).first()
+            if not row:
+                db.session.rollback()
+                return False
+            components_path = ['course_materials', 'modules', str(row[0]), 'components']
+            self._execute(
+                "UPDATE analysis_log SET data = jsonb_set("
+                "   jsonb_set(data, CAST(:components_path AS text[]),"
+                "             COALESCE(data #> CAST(:components_path AS text[]), '{}'::jsonb)),"
+                "   CAST(:component_path AS text[]), CAST(:material AS jsonb)),"
+                " updated_at = :now"
+                " WHERE analysis_id = :id",
+                id=analysis_id, components_path=components_path,
+                component_path=components_path + [component],
+                material=json_codec.dumps(material).decode('utf-8'), now=datetime.utcnow()
+            )
+            db.session.commit()
+            return True
+        except Exception:
+            db.session.rollback()
+            raise
+
+
+@click.command('import-analyses')
+@click.option('--overwrite', is_flag=True, help='Replace documents already stored in the database.')
+@with_appcontext
+def import_analyses_command(overwrite):
+    """Copy analyses from the data/ directory into analysis_log (JSONB)."""
+    from app import storage
+
+    AnalysisLog.migrate_schema(echo=click.echo)
+    imported = skipped = 0
+    for analysis_id in storage.file_analysis_ids():
+        data = storage.load_analysis_file(analysis_id)
+        if data is None:
+            continue
+        log = AnalysisLog.query.filter_by(analysis_id=analysis_id).first()
+        # Rows created when an analysis starts only hold the initial form fields
+        if log is not None and log.data and not overwrite and set(log.data) >= set(data):
+            skipped += 1
+            continue
+        if log is None:
+            log = AnalysisLog.create(useremail='', analysis_id=analysis_id, data=data)
+            created = analysis_id_time(analysis_id)
+            if created is not None:
+                log.created_at = created.replace(tzinfo=None)
+                db.session.commit()
+        else:
+            AnalysisLog.update_by_analysis_id(analysis_id, data=data)
+        imported += 1
+    click.echo(f"Imported {imported} analyses, skipped {skipped} already in the database "
+               f"(from {os.path.relpath(storage.DATA_DIR)})")
@@ -1,9 +1,10 @@
-from models.groq_client import GroqClient
+from models.groq_client import GroqClient, fresh_responses, get_response_cache, get_rate_limiter, stream_tokens
 import os
+import pathlib
 import sys
 import json
 from venv import logger
-from flask import Blueprint, render_template, request, flash, redirect, url_for, session, send_file, current_app
+from flask import Blueprint, render_template, request, flash, redirect, url_for, session, send_file, current_app, jsonify, Response, stream_with_context
 from datetime import datetime
 import markdown
 import io
@@ -13,13 +14,23 @@ from docx.enum.text import WD_ALIGN_PARAGRAPH
 import re
 from difflib import get_close_matches
 import zipfile
-from models.course_materials import CourseMaterialsGenerator, generate_course_materials
+from models.course_materials import CourseMaterialsGenerator, generate_course_materials, generate_course_materials_async
 from collections import defaultdict
 import html
 from xml.etree import ElementTree as ET
 from xml.dom import minidom
 from functools import wraps
+from app import db
 from app.analysis_log import AnalysisLog
+from app.llm_usage import LLMUsage, usage_ledger
+from app.generation_job import GenerationJob, GenerationJobEvent
+from app.jobs import job_queue, current_job_id
+from app.zip_stream import stream_zip
+from app.export_cache import content_key, export_cache
+from app.image_store import image_store
+from models.circuit_breaker import breaker_status, get_breaker
+import asyncio
+from contextlib import contextmanager
 import time
 
 
@@ -72,12 +83,11 @@ class CourseDesignRequirementsForm(FlaskForm):
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from models.audience_analysis import generate_audience_analysis
 from models.task_analysis import generate_task_analysis
-from models.course_design import generate_course_structure, generate_instructional_strategies, generate_assessment_plan, generate_comprehensive_course_design
+from models.course_design import generate_course_structure, generate_instructional_strategies, generate_assessment_plan, generate_comprehensive_course_design, generate_comprehensive_course_design_async
 
-# Create a data directory if it doesn't exist
-DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
-if not os.path.exists(DATA_DIR):
-    os.makedirs(DATA_DIR)
+from models import json_codec
+from app.storage import (RECORD_FIELDS, create_analysis, load_analysis, load_module, update_analysis,
+                         update_analysis_fields, save_material, record_cache)
 
 def login_required(view):
     @wraps(view)
@@ -87,21 +97,6 @@ def login_required(view):
         return view(*args, **kwargs)
     return wrapped
 
-def save_analysis(analysis_id, data):
-    """Save analysis data to a JSON file"""
-    filepath = os.path.join(DATA_DIR, f"{analysis_id}.json")
-    with open(filepath, 'w') as f:
-        json.dump(data, f)
-    return analysis_id
-
-def load_analysis(analysis_id):
-    """Load analysis data from a JSON file"""
-    filepath = os.path.join(DATA_DIR, f"{analysis_id}.json")
-    if os.path.exists(filepath):
-        with open(filepath, 'r') as f:
-            return json.load(f)
-    return None
-
 def markdown_to_docx(doc, markdown_text):
     """Convert markdown text to formatted docx document."""
     # Split the markdown into lines
@@ -279,44 +274,29 @@ def index():
             
             current_app.logger.info("Received form data: course_topic=%s, audience_type=%s", course_topic, audience_type)
 
-            # Create a timestamp-based ID
-            timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-            analysis_id = f"analysis_{timestamp}"
-            
-            # Generate audience analysis
-            audience_analysis = generate_audience_analysis(course_topic, audience_type, '')
-            current_app.logger.debug("Generated audience analysis for ID: %s", analysis_id)
-
+            logged_user = session.get("user")
+            if not logged_user:
+                flash("User session not found.")
+                return redirect(url_for("auth_bp.login"))  # or any fallback
+             
+            email = logged_user["email"]
             
-            # Save initial data to file
+            # Save initial data; the audience analysis is streamed in by a stream_analysis job
             analysis_data = {
-                'audience_analysis': audience_analysis,
                 'course_topic': course_topic,
                 'audience_type': audience_type,
                 'job_titles': job_titles,
                 'generated_date': datetime.now().strftime("%B %d, %Y at %H:%M")
             }
-            save_analysis(analysis_id, analysis_data)
+            analysis_id = create_analysis(analysis_data, useremail=email)
             current_app.logger.info("Analysis data saved with ID: %s", analysis_id)
             
-            logged_user = session.get("user")
-            if not logged_user:
-                flash("User session not found.")
-                return redirect(url_for("auth_bp.login"))  # or any fallback
-             
-            email = logged_user["email"]
-            
-            AnalysisLog.create(
-                useremail= email,
-                analysis_id=analysis_id,
-                data= analysis_data
-            )
-            
             # Store the ID in session
             session['current_analysis_id'] = analysis_id
             current_app.logger.debug("Stored analysis ID in session: %s", analysis_id)
             
-            return redirect(url_for('main.audience_analysis', analysis_id=analysis_id))
+            job = start_analysis_stream(analysis_id, 'audience_analysis')
+            return redirect(url_for('main.stream_analysis', analysis_id=analysis_id, target='audience_analysis', job=job.id))
         
         except Exception as e:
             current_app.logger.error("Error generating analysis: %s", str(e), exc_info=True)
@@ -332,7 +312,7 @@ def audience_analysis(analysis_id):
 
     current_app.logger.info("Accessed audience_analysis view for ID: %s", analysis_id)
     # Load analysis data from file
-    analysis_data = load_analysis(analysis_id)
+    analysis_data = load_analysis(analysis_id, fields=('audience_analysis',))
     
     if not analysis_data:
         current_app.logger.warning("Analysis ID %s not found. Redirecting to index.", analysis_id)
@@ -341,6 +321,9 @@ def audience_analysis(analysis_id):
     
     current_app.logger.debug("Loaded analysis data for ID: %s", analysis_id)
 
+    if not analysis_data.get('audience_analysis'):
+        return redirect(url_for('main.stream_analysis', analysis_id=analysis_id, target='audience_analysis'))
+
     if request.method == 'POST':
         # Check if this is a task analysis generation request
         if request.form.get('generate_task_analysis') == 'true':
@@ -360,7 +343,7 @@ def audience_analysis(analysis_id):
                 analysis_data['task_analysis'] = task_analysis
                 
                 # Save updated analysis
-                save_analysis(analysis_id, analysis_data)
+                update_analysis_fields(analysis_id, {'task_analysis': task_analysis})
                 
                 print(f"Redirecting to task_analysis page for {analysis_id}")  # Debug log
                 
@@ -409,7 +392,10 @@ def audience_analysis(analysis_id):
             analysis_data['task_analysis'] = task_analysis
             
             # Save updated analysis
-            save_analysis(analysis_id, analysis_data)
+            update_analysis_fields(analysis_id, {
+                'terminal_objectives': terminal_objectives,
+                'task_analysis': task_analysis
+            })
             current_app.logger.info("Saved updated analysis with task analysis for ID: %s", analysis_id)
 
             
@@ -448,7 +434,7 @@ def audience_analysis(analysis_id):
 @main.route('/task_analysis/<analysis_id>')
 def task_analysis(analysis_id):
     # Load analysis data from file
-    analysis_data = load_analysis(analysis_id)
+    analysis_data = load_analysis(analysis_id, fields=('task_analysis',))
     
     if not analysis_data:
         flash('Analysis not found. Please submit the form to generate a new analysis.')
@@ -478,7 +464,7 @@ def prepare_course_design(analysis_id):
     
     current_app.logger.info("Accessed prepare_course_design for ID: %s", analysis_id)
     # Load analysis data from file
-    analysis_data = load_analysis(analysis_id)
+    analysis_data = load_analysis(analysis_id, fields=('audience_analysis', 'task_analysis'))
     
     if not analysis_data:
         current_app.logger.warning("Analysis ID %s not found. Redirecting to index.", analysis_id)
@@ -537,15 +523,14 @@ def prepare_course_design(analysis_id):
                                  terminal_objectives=analysis_data.get('terminal_objectives', ''),
                                  current_date=analysis_data['generated_date'])
         
-        # Add to analysis data
-        analysis_data['course_duration'] = course_duration
-        analysis_data['delivery_format'] = delivery_format
-        analysis_data['module_count'] = module_count
-        analysis_data['additional_requirements'] = additional_requirements
-        analysis_data['design_components'] = components
-        
-        # Save updated analysis
-        save_analysis(analysis_id, analysis_data)
+        # Save the design preferences
+        update_analysis_fields(analysis_id, {
+            'course_duration': course_duration,
+            'delivery_format': delivery_format,
+            'module_count': module_count,
+            'additional_requirements': additional_requirements,
+            'design_components': components
+        })
         current_app.logger.info("Saved course design prep data for ID: %s", analysis_id)
         
         # Redirect to generate course design
@@ -572,7 +557,7 @@ def generate_course_design(analysis_id):
 
     current_app.logger.info("Accessed generate_course_design for ID: %s", analysis_id)
     # Load analysis data from file
-    analysis_data = load_analysis(analysis_id)
+    analysis_data = load_analysis(analysis_id, fields=COURSE_DESIGN_FIELDS)
     
     if not analysis_data:
         current_app.logger.warning("Analysis ID %s not found. Redirecting to index.", analysis_id)
@@ -600,55 +585,77 @@ def generate_course_design(analysis_id):
         flash('Course design already exists. Redirecting to existing design.')
         return redirect(url_for('main.view_course_design', analysis_id=analysis_id))
     
-    # Generate course design components
+    # Extract module count if specified
+    module_count = analysis_data.get('module_count')
+    if module_count and isinstance(module_count, str):
+        try:
+            module_count = int(module_count)
+        except ValueError:
+            current_app.logger.warning("Invalid module_count format for ID %s: %s", analysis_id, module_count)
+            module_count = None
+    
+    current_app.logger.info("Queueing course design for ID: %s with components: %s", analysis_id, components_to_generate)
     try:
-        # Extract module count if specified
-        module_count = analysis_data.get('module_count')
-        if module_count and isinstance(module_count, str):
-            try:
-                module_count = int(module_count)
-            except ValueError:
-                current_app.logger.warning("Invalid module_count format for ID %s: %s", analysis_id, module_count)
-                module_count = None
-        
-        current_app.logger.info("Generating course design for ID: %s with components: %s", analysis_id, components_to_generate)
+        job = job_queue.enqueue('generate_course_design', analysis_id,
+                                components=components_to_generate,
+                                module_count=module_count)
+    except Exception as e:
+        current_app.logger.error("Error queueing course design for ID %s: %s", analysis_id, str(e), exc_info=True)
+        flash(f'Error generating course design: {str(e)}')
+        return redirect(url_for('main.task_analysis', analysis_id=analysis_id))
+    
+    return redirect(url_for('main.job_status', job_id=job.id))
 
-        # Generate only the requested components
+COURSE_DESIGN_FIELDS = ('course_structure', 'instructional_strategies', 'assessment_plan',
+                        'course_design_generated_date')
+
+def course_design_fields(analysis_data):
+    """The course design fields present in analysis_data, for merging into the saved analysis."""
+    return {key: analysis_data[key] for key in COURSE_DESIGN_FIELDS if key in analysis_data}
+
+@job_queue.handler('generate_course_design', failure_endpoint='main.task_analysis')
+def run_generate_course_design(analysis_id, components, module_count=None):
+    """Background job: generate the requested course design components."""
+    analysis_data = load_analysis(analysis_id, fields=RECORD_FIELDS)
+    if not analysis_data:
+        raise ValueError(f"Analysis {analysis_id} not found")
+    
+    # Generate only the requested components
+    if current_app.config.get('ASYNC_GENERATION', True):
+        updated_analysis_data = asyncio.run(generate_comprehensive_course_design_async(
+            analysis_data, 
+            components=components,
+            module_count=module_count
+        ))
+    else:
         updated_analysis_data = generate_comprehensive_course_design(
             analysis_data, 
-            components=components_to_generate,
+            components=components,
             module_count=module_count
         )
-        
-        # Save the updated analysis
-        save_analysis(analysis_id, updated_analysis_data)
-        current_app.logger.info("Successfully saved generated design for ID: %s", analysis_id)
-
-        
-        # Create success message based on generated components
-        component_names = {
-            'structure': 'Course Structure',
-            'strategies': 'Instructional Strategies',
-            'assessment': 'Assessment Plan'
-        }
-        generated_names = [component_names[comp] for comp in components_to_generate]
-        
-        if len(generated_names) == 1:
-            message = f"{generated_names[0]} generated successfully!"
-        elif len(generated_names) == 2:
-            message = f"{generated_names[0]} and {generated_names[1]} generated successfully!"
-        elif len(generated_names) > 2:
-            message = f"{', '.join(generated_names[:-1])} and {generated_names[-1]} generated successfully!"
-        else:
-            message = "Course design components generated successfully!"
-            
-        flash(message)
-        return redirect(url_for('main.view_course_design', analysis_id=analysis_id))
     
-    except Exception as e:
-        current_app.logger.error("Error generating course design for ID %s: %s", analysis_id, str(e), exc_info=True)
-        flash(f'Error generating course design: {str(e)}')
-        return redirect(url_for('main.task_analysis', analysis_id=analysis_id))
+    # Save only the generated fields so edits made while the job ran are kept
+    update_analysis_fields(analysis_id, course_design_fields(updated_analysis_data))
+    current_app.logger.info("Successfully saved generated design for ID: %s", analysis_id)
+    
+    # Create success message based on generated components
+    component_names = {
+        'structure': 'Course Structure',
+        'strategies': 'Instructional Strategies',
+        'assessment': 'Assessment Plan'
+    }
+    generated_names = [component_names[comp] for comp in components]
+    
+    if len(generated_names) == 1:
+        message = f"{generated_names[0]} generated successfully!"
+    elif len(generated_names) == 2:
+        message = f"{generated_names[0]} and {generated_names[1]} generated successfully!"
+    elif len(generated_names) > 2:
+        message = f"{', '.join(generated_names[:-1])} and {generated_names[-1]} generated successfully!"
+    else:
+        message = "Course design components generated successfully!"
+    
+    return {'redirect': 'main.view_course_design', 'message': message}
 
 @main.route('/view_course_design/<analysis_id>')
 def view_course_design(analysis_id):
@@ -656,7 +663,7 @@ def view_course_design(analysis_id):
     current_app.logger.info("Accessed view_course_design for ID: %s", analysis_id)
 
     # Load analysis data from file
-    analysis_data = load_analysis(analysis_id)
+    analysis_data = load_analysis(analysis_id, fields=COURSE_DESIGN_FIELDS)
     
     if not analysis_data:
         current_app.logger.warning("Analysis ID %s not found. Redirecting to index.", analysis_id)       
@@ -688,7 +695,7 @@ def edit_course_design(analysis_id):
     
     current_app.logger.info("Accessed edit_course_design view for ID: %s", analysis_id)
     # Load analysis data from file
-    analysis_data = load_analysis(analysis_id)
+    analysis_data = load_analysis(analysis_id, fields=COURSE_DESIGN_FIELDS)
     
     if not analysis_data:
         current_app.logger.warning("Analysis ID %s not found. Redirecting to index.", analysis_id)
@@ -702,14 +709,13 @@ def edit_course_design(analysis_id):
         return redirect(url_for('main.generate_course_design', analysis_id=analysis_id))
     
     if request.method == 'POST':
-        # Update the analysis data with edited content
-        analysis_data['course_structure'] = request.form.get('course_structure', '')
-        analysis_data['instructional_strategies'] = request.form.get('instructional_strategies', '')
-        analysis_data['assessment_plan'] = request.form.get('assessment_plan', '')
-        analysis_data['last_edited'] = datetime.now().strftime("%B %d, %Y at %H:%M")
-        
-        # Save the updated analysis
-        save_analysis(analysis_id, analysis_data)
+        # Save the edited content
+        update_analysis_fields(analysis_id, {
+            'course_structure': request.form.get('course_structure', ''),
+            'instructional_strategies': request.form.get('instructional_strategies', ''),
+            'assessment_plan': request.form.get('assessment_plan', ''),
+            'last_edited': datetime.now().strftime("%B %d, %Y at %H:%M")
+        })
         current_app.logger.info("Course design updated for ID: %s", analysis_id)
         flash('Course design updated successfully!')
         
@@ -729,7 +735,7 @@ def download_course_design(analysis_id):
     current_app.logger.info("Requested course design download for ID: %s", analysis_id)
 
     # Load analysis data from file
-    analysis_data = load_analysis(analysis_id)
+    analysis_data = load_analysis(analysis_id, fields=COURSE_DESIGN_FIELDS)
     
     if not analysis_data:
         current_app.logger.warning("Analysis ID %s not found. Redirecting to index.", analysis_id)     
@@ -792,7 +798,7 @@ def results(analysis_id):
 
     current_app.logger.info("Accessed results view for ID: %s", analysis_id)
     # Load analysis data from file
-    analysis_data = load_analysis(analysis_id)
+    analysis_data = load_analysis(analysis_id, fields=RECORD_FIELDS)
     
     if not analysis_data:
         current_app.logger.warning("Analysis ID %s not found. Redirecting to index.", analysis_id)
@@ -847,7 +853,7 @@ def results_redirect():
 def edit_audience_analysis(analysis_id):
     try:
         # Load analysis data from file
-        analysis_data = load_analysis(analysis_id)
+        analysis_data = load_analysis(analysis_id, fields=('audience_analysis',))
         
         if not analysis_data:
             current_app.logger.warning("Analysis ID %s not found. Redirecting to index.", analysis_id)
@@ -856,10 +862,7 @@ def edit_audience_analysis(analysis_id):
         
         if request.method == 'POST':
             # Update only the audience analysis
-            analysis_data['audience_analysis'] = request.form.get('audience_analysis', '')
-            
-            # Save the updated analysis
-            save_analysis(analysis_id, analysis_data)
+            update_analysis_fields(analysis_id, {'audience_analysis': request.form.get('audience_analysis', '')})
             current_app.logger.info("Audience analysis updated for ID: %s", analysis_id)
             flash('Audience analysis updated successfully!')
             
@@ -885,7 +888,7 @@ def edit_task_analysis(analysis_id):
 
     try:
         # Load analysis data from file
-        analysis_data = load_analysis(analysis_id)
+        analysis_data = load_analysis(analysis_id, fields=('task_analysis',))
         
         if not analysis_data:
             current_app.logger.warning("Analysis ID %s not found. Redirecting to index.", analysis_id)
@@ -894,10 +897,7 @@ def edit_task_analysis(analysis_id):
         
         if request.method == 'POST':
             # Update only the task analysis
-            analysis_data['task_analysis'] = request.form.get('task_analysis', '')
-            
-            # Save the updated analysis
-            save_analysis(analysis_id, analysis_data)
+            update_analysis_fields(analysis_id, {'task_analysis': request.form.get('task_analysis', '')})
             current_app.logger.info("Task analysis updated for ID: %s", analysis_id)
             flash('Task analysis updated successfully!')
             
@@ -922,7 +922,7 @@ def download_audience_analysis(analysis_id):
     current_app.logger.info("Download requested for audience analysis ID: %s", analysis_id)
 
     # Load analysis data from file
-    analysis_data = load_analysis(analysis_id)
+    analysis_data = load_analysis(analysis_id, fields=('audience_analysis',))
     
     if not analysis_data:
         current_app.logger.warning("Audience analysis not found for ID: %s", analysis_id)
@@ -965,7 +965,7 @@ def download_task_analysis(analysis_id):
     current_app.logger.info("Download requested for task analysis ID: %s", analysis_id)
 
     # Load analysis data from file
-    analysis_data = load_analysis(analysis_id)
+    analysis_data = load_analysis(analysis_id, fields=('task_analysis',))
     
     if not analysis_data:
         current_app.logger.warning("Audience analysis not found for ID: %s", analysis_id)
@@ -1008,7 +1008,7 @@ def generate_additional_components(analysis_id):
     current_app.logger.info("Initiated additional component generation for ID: %s", analysis_id)
 
     # Load analysis data
-    analysis_data = load_analysis(analysis_id)
+    analysis_data = load_analysis(analysis_id, fields=RECORD_FIELDS)
     
     if not analysis_data:
         current_app.logger.warning("Analysis ID %s not found.", analysis_id)
@@ -1038,14 +1038,15 @@ def generate_additional_components(analysis_id):
 
             
             # Generate components
-            updated_analysis_data = generate_comprehensive_course_design(
-                analysis_data, 
-                components=components,
-                module_count=module_count
-            )
+            with usage_ledger(analysis_id):
+                updated_analysis_data = generate_comprehensive_course_design(
+                    analysis_data, 
+                    components=components,
+                    module_count=module_count
+                )
             
-            # Save the updated analysis
-            save_analysis(analysis_id, updated_analysis_data)
+            # Save only the generated fields so concurrent edits are kept
+            update_analysis_fields(analysis_id, course_design_fields(updated_analysis_data))
             current_app.logger.info("Successfully generated components %s for ID: %s", components, analysis_id)
 
             
@@ -1129,7 +1130,7 @@ def generate_materials(analysis_id):
     current_app.logger.info("Material generation initiated for ID: %s", analysis_id)
 
     # Load analysis data
-    analysis_data = load_analysis(analysis_id)
+    analysis_data = load_analysis(analysis_id, fields=())
     
     if not analysis_data:
         current_app.logger.warning("Analysis not found for ID: %s", analysis_id)
@@ -1169,31 +1170,60 @@ def generate_materials(analysis_id):
         if content_tone not in valid_tones:
             content_tone = 'default'                            
         # selected_modules = [int(m) for m in selected_modules]
-        # Generate materials
-        logger.info(f"Generating materials for modules {selected_modules} with components {components} in {content_tone} tone")
-        current_app.logger.info("Generating materials for ID %s: modules=%s, components=%s",
+        # Queue materials generation
+        current_app.logger.info("Queueing materials generation for ID %s: modules=%s, components=%s",
                                 analysis_id, selected_modules, components)
-
-        
-        materials = generate_course_materials(
-            analysis_data,
-            selected_modules=selected_modules,
-            components=components,
-            content_tone=content_tone,  # NEW: Pass tone parameter
-            additional_notes=additional_notes
-        )
-        
-        # Add metadata
-        materials['metadata'] = {
-            'generated_date': datetime.now().strftime("%B %d, %Y at %H:%M"),
-            'total_modules': len(materials['modules']),
-            'components_generated': components,
-            'detail_level': detail_level,
-            'format_preference': format_preference,
-            'content_tone': content_tone,
-            'additional_notes': additional_notes
-        }
+        job = job_queue.enqueue('generate_materials', analysis_id,
+                                selected_modules=selected_modules,
+                                components=components,
+                                detail_level=detail_level,
+                                format_preference=format_preference,
+                                content_tone=content_tone,
+                                additional_notes=additional_notes)
+        return redirect(url_for('main.job_status', job_id=job.id))
         
+    except Exception as e:
+        current_app.logger.error("Error generating materials for ID %s: %s", analysis_id, str(e), exc_info=True)
+        logger.error(f"Error generating materials: {str(e)}")
+        error_message = str(e)
+        flash(f'Error generating materials: {error_message}')
+        return redirect(url_for('main.prepare_materials', analysis_id=analysis_id))
+
+@job_queue.handler('generate_materials', failure_endpoint='main.prepare_materials')
+def run_generate_materials(analysis_id, selected_modules, components, detail_level='comprehensive',
+                           format_preference='structured', content_tone='default', additional_notes=''):
+    """Background job: generate course materials and merge them into the analysis."""
+    analysis_data = load_analysis(analysis_id, fields=RECORD_FIELDS)
+    if not analysis_data:
+        raise ValueError(f"Analysis {analysis_id} not found")
+    
+    # Generate materials
+    logger.info(f"Generating materials for modules {selected_modules} with components {components} in {content_tone} tone")
+    
+    materials_request = dict(
+        selected_modules=selected_modules,
+        components=components,
+        content_tone=content_tone,  # NEW: Pass tone parameter
+        additional_notes=additional_notes,
+        progress_callback=job_queue.progress_reporter(current_job_id())
+    )
+    if current_app.config.get('ASYNC_GENERATION', True):
+        materials = asyncio.run(generate_course_materials_async(analysis_data, **materials_request))
+    else:
+        materials = generate_course_materials(analysis_data, **materials_request)
+    
+    # Add metadata
+    materials['metadata'] = {
+        'generated_date': datetime.now().strftime("%B %d, %Y at %H:%M"),
+        'total_modules': len(materials['modules']),
+        'components_generated': components,
+        'detail_level': detail_level,
+        'format_preference': format_preference,
+        'content_tone': content_tone,
+        'additional_notes': additional_notes
+    }
+    
+    def merge_materials(analysis_data):
         # Merge with existing materials if any
         if 'course_materials' in analysis_data:
             
@@ -1217,19 +1247,16 @@ def generate_materials(analysis_id):
         # Save materials (use consistent key name)
         analysis_data['course_materials'] = materials
         analysis_data['materials_generated_date'] = datetime.now().strftime("%B %d, %Y at %H:%M")
-        save_analysis(analysis_id, analysis_data)
-        current_app.logger.info("Successfully generated materials for ID %s: modules=%d, components=%d",
-                                analysis_id, len(selected_modules), len(components))
-
-        flash(f'Successfully generated {len(components)} component(s) for {len(selected_modules)} module(s) in {content_tone} tone!')
-        return redirect(url_for('main.view_materials', analysis_id=analysis_id))
-        
-    except Exception as e:
-        current_app.logger.error("Error generating materials for ID %s: %s", analysis_id, str(e), exc_info=True)
-        logger.error(f"Error generating materials: {str(e)}")
-        error_message = str(e)
-        flash(f'Error generating materials: {error_message}')
-        return redirect(url_for('main.prepare_materials', analysis_id=analysis_id))
+    
+    # Merge into the latest saved analysis so edits made while the job ran are kept
+    update_analysis(analysis_id, merge_materials)
+    current_app.logger.info("Successfully generated materials for ID %s: modules=%d, components=%d",
+                            analysis_id, len(selected_modules), len(components))
+    
+    return {
+        'redirect': 'main.view_materials',
+        'message': f'Successfully generated {len(components)} component(s) for {len(selected_modules)} module(s) in {content_tone} tone!'
+    }
 
 # Import the image service at the top of routes.py
 from models.image_service import image_service
@@ -1275,18 +1302,8 @@ from models.image_service import image_service
 def get_images_for_module(analysis_id, module_id):
     """Get images for a specific module via AJAX."""
     try:
-        # Load analysis data
-        analysis_data = load_analysis(analysis_id)
-        
-        if not analysis_data or 'course_materials' not in analysis_data:
-            return {'error': 'Materials not found'}, 404
-        
-        # Find the module
-        module = None
-        for m in analysis_data['course_materials']['modules']:
-            if m['number'] == module_id:
-                module = m
-                break
+        # Load only this module
+        module = load_module(analysis_id, module_id)
         
         if not module:
             return {'error': 'Module not found'}, 404
@@ -1356,19 +1373,15 @@ def view_material(analysis_id, module_id, material_type):
     """View a specific material component."""
     # Load analysis data
     current_app.logger.info("Accessed materials dashboard for ID: %s", analysis_id)                                          
-    analysis_data = load_analysis(analysis_id)
+    analysis_data = load_analysis(analysis_id, fields=())
     
-    if not analysis_data or 'course_materials' not in analysis_data:
+    if not analysis_data:
         current_app.logger.warning("Materials not found for ID: %s", analysis_id)                                                                                    
         flash('Materials not found.')
         return redirect(url_for('main.index'))
     
-    # Find the module
-    module = None
-    for m in analysis_data['course_materials']['modules']:
-        if m['number'] == module_id:
-            module = m
-            break
+    # Load only the requested component of the module
+    module = load_module(analysis_id, module_id, components=[material_type])
     
     if not module:
         current_app.logger.warning("Module not found:%s", module_id)
@@ -1395,23 +1408,14 @@ def edit_material(analysis_id, module_id, material_type):
     """Edit a specific material component."""
     current_app.logger.info("Accessing edit view for material '%s' in module %s (analysis: %s)",
                             material_type, module_id, analysis_id)
-    # Load analysis data
-    analysis_data = load_analysis(analysis_id)
+    # Load only the component being edited
+    module = load_module(analysis_id, module_id, components=[material_type])
     
-    if not analysis_data or 'course_materials' not in analysis_data:
+    if module is None and not load_analysis(analysis_id, fields=()):
         current_app.logger.warning("Materials not found for analysis ID: %s", analysis_id)
         flash('Materials not found.')
         return redirect(url_for('main.index'))
     
-    # Find the module
-    module_idx = None
-    module = None
-    for idx, m in enumerate(analysis_data['course_materials']['modules']):
-        if m['number'] == module_id:
-            module_idx = idx
-            module = m
-            break
-    
     if not module:
         flash('Module not found.')
         return redirect(url_for('main.view_materials', analysis_id=analysis_id))
@@ -1432,12 +1436,13 @@ def edit_material(analysis_id, module_id, material_type):
         try:
             # Save the updated material as raw content for now
             if isinstance(material, dict):
-                material['raw_content'] = updated_content
+                material = {**material, 'raw_content': updated_content}
             else:
                 material = {'raw_content': updated_content}
             
-            analysis_data['course_materials']['modules'][module_idx]['components'][material_type] = material
-            save_analysis(analysis_id, analysis_data)
+            # Rewrite only this component's record
+            if not save_material(analysis_id, module_id, material_type, material):
+                raise ValueError(f"Module {module_id} no longer exists")
             current_app.logger.info("Successfully updated material '%s' in module %s (analysis ID: %s)",
                                     material_type, module_id, analysis_id)
             
@@ -1459,7 +1464,7 @@ def edit_material(analysis_id, module_id, material_type):
     
     # For GET request, show edit form
     if isinstance(material, dict):
-        material_content = material.get('raw_content', json.dumps(material, indent=2))
+        material_content = material.get('raw_content', json_codec.dumps_pretty(material))
         
         # material_content_format = escape_control_characters(material_content)
         # material_raw = json.loads(material_content_format)
@@ -1477,53 +1482,46 @@ def edit_material(analysis_id, module_id, material_type):
                           material_type=material_type,
                           material_content=material_content)
 
-@main.route('/generate_single_material/<analysis_id>/<int:module_id>/<material_type>')
-def generate_single_material(analysis_id, module_id, material_type):
-    """Generate a single material component for a specific module."""
-    current_app.logger.info(
-        "Generating single material '%s' for module %s (analysis ID: %s)",
-        material_type, module_id, analysis_id
-    )
-    # Load analysis data
-    analysis_data = load_analysis(analysis_id)
+# Material types shown in the UI -> generator component names
+MATERIAL_COMPONENTS = {
+    'lesson_plan': 'lesson_plans',
+    'content': 'content',
+    'activities': 'activities',
+    'assessments': 'assessments',
+    'instructor_guide': 'instructor_guides'
+}
+
+def generate_and_merge_material(analysis_id, module_id, material_type):
+    """
+    Generate one material component for one module and merge it into the saved analysis.
     
-    if not analysis_data:
-        current_app.logger.warning("Analysis not found for ID: %s", analysis_id)
-        flash('Analysis not found.')
-        return redirect(url_for('main.index'))
+    Runs serially in the calling thread so token streaming (stream_tokens) sees every call.
+    Returns False if material_type is unknown.
+    """
+    component = MATERIAL_COMPONENTS.get(material_type)
+    if not component:
+        return False
     
-    try:
-        # Generate the specific material
-        generator = CourseMaterialsGenerator(analysis_data)
-        current_app.logger.debug("Calling material generator for component: %s", component)
-        
-        # Map material type to component name
-        component_map = {
-            'lesson_plan': 'lesson_plans',
-            'content': 'content',
-            'activities': 'activities',
-            'assessments': 'assessments',
-            'instructor_guide': 'instructor_guides'
-        }
-        
-        component = component_map.get(material_type)
-        if not component:
-            flash('Invalid material type.')
-            return redirect(url_for('main.view_materials', analysis_id=analysis_id))
-        
-        # Generate material for single module and component
+    analysis_data = load_analysis(analysis_id, fields=RECORD_FIELDS)
+    generator = CourseMaterialsGenerator(analysis_data)
+    current_app.logger.debug("Calling material generator for component: %s", component)
+    
+    # Generate material for single module and component; a cached answer would repeat the old one
+    with fresh_responses():
         new_materials = generator.generate_all_materials(
             selected_modules=[module_id],
-            components=[component]
+            components=[component],
+            max_workers=1
         )
-        
+    
+    def merge_material(analysis_data):
         # Initialize course_materials if it doesn't exist
         if 'course_materials' not in analysis_data:
             analysis_data['course_materials'] = {'modules': []}
         
         # Find and update the specific module
         module_found = False
-        for idx, module in enumerate(analysis_data['course_materials']['modules']):
+        for module in analysis_data['course_materials']['modules']:
             if module['number'] == module_id:
                 # Update the specific component
                 if len(new_materials['modules']) > 0:
@@ -1539,11 +1537,38 @@ def generate_single_material(analysis_id, module_id, material_type):
             # Module not found in existing materials, add it
             analysis_data['course_materials']['modules'].append(new_materials['modules'][0])
             analysis_data['course_materials']['modules'].sort(key=lambda x: x['number'])
-        
-        # Save updated analysis
-        save_analysis(analysis_id, analysis_data)
-        current_app.logger.info("Material '%s' generated and saved successfully for module %s", material_type, module_id)
+    
+    # Rewrite only the regenerated component when its module is already saved
+    new_component = new_materials['modules'][0]['components'].get(material_type) if new_materials['modules'] else None
+    if new_component and save_material(analysis_id, module_id, material_type, new_component):
+        return True
+    
+    # Merge into the latest saved analysis so edits saved while generating are kept
+    update_analysis(analysis_id, merge_material)
+    return True
 
+@main.route('/generate_single_material/<analysis_id>/<int:module_id>/<material_type>')
+def generate_single_material(analysis_id, module_id, material_type):
+    """Generate a single material component for a specific module."""
+    current_app.logger.info(
+        "Generating single material '%s' for module %s (analysis ID: %s)",
+        material_type, module_id, analysis_id
+    )
+    # Load analysis data
+    analysis_data = load_analysis(analysis_id, fields=())
+    
+    if not analysis_data:
+        current_app.logger.warning("Analysis not found for ID: %s", analysis_id)
+        flash('Analysis not found.')
+        return redirect(url_for('main.index'))
+    
+    try:
+        with usage_ledger(analysis_id):
+            generated = generate_and_merge_material(analysis_id, module_id, material_type)
+        if not generated:
+            flash('Invalid material type.')
+            return redirect(url_for('main.view_materials', analysis_id=analysis_id))
+        current_app.logger.info("Material '%s' generated and saved successfully for module %s", material_type, module_id)
         
         flash(f'{material_type.replace("_", " ").title()} generated successfully!')
         return redirect(url_for('main.view_material', 
@@ -1564,24 +1589,47 @@ def regenerate_module(analysis_id, module_id):
 
     try:
         # Load analysis data
-        analysis_data = load_analysis(analysis_id)
+        analysis_data = load_analysis(analysis_id, fields=())
         
         if not analysis_data:
             current_app.logger.warning("Analysis not found for ID: %s", analysis_id)
             flash('Analysis not found.')
             return redirect(url_for('main.index'))
         
-        current_app.logger.debug("Loaded analysis data for regeneration")
+        job = job_queue.enqueue('regenerate_module', analysis_id, module_id=module_id)
+        return redirect(url_for('main.job_status', job_id=job.id))
         
-        # Generate all materials for the module
-        generator = CourseMaterialsGenerator(analysis_data)
-        materials = generator.generate_all_materials(
-            selected_modules=[module_id],
-            components=['lesson_plans', 'content', 'activities', 'assessments', 'instructor_guides']
-        )
+    except Exception as e:
+        current_app.logger.error("Error regenerating module %s: %s", module_id, str(e), exc_info=True)
+        flash(f'Error regenerating module {module_id}: {str(e)}')
+        return redirect(url_for('main.view_materials', analysis_id=analysis_id))
 
-        current_app.logger.debug("Generated new materials for module %s", module_id)
-        
+@job_queue.handler('regenerate_module', failure_endpoint='main.view_materials')
+def run_regenerate_module(analysis_id, module_id):
+    """Background job: regenerate every component of one module."""
+    analysis_data = load_analysis(analysis_id, fields=RECORD_FIELDS)
+    if not analysis_data:
+        raise ValueError(f"Analysis {analysis_id} not found")
+    
+    current_app.logger.debug("Loaded analysis data for regeneration")
+    
+    # Generate all materials for the module
+    generator = CourseMaterialsGenerator(analysis_data)
+    module_request = dict(
+        selected_modules=[module_id],
+        components=['lesson_plans', 'content', 'activities', 'assessments', 'instructor_guides'],
+        progress_callback=job_queue.progress_reporter(current_job_id())
+    )
+    # Regenerating must not hand back the cached text of the last run
+    with fresh_responses():
+        if current_app.config.get('ASYNC_GENERATION', True):
+            materials = asyncio.run(generator.generate_all_materials_async(**module_request))
+        else:
+            materials = generator.generate_all_materials(**module_request)
+
+    current_app.logger.debug("Generated new materials for module %s", module_id)
+    
+    def replace_module(analysis_data):
         # Initialize course_materials if it doesn't exist
         if 'course_materials' not in analysis_data:
             analysis_data['course_materials'] = {'modules': []}
@@ -1595,19 +1643,303 @@ def regenerate_module(analysis_id, module_id):
         if len(materials['modules']) > 0:
             modules.extend(materials['modules'])
             modules.sort(key=lambda x: x['number'])
-        
-        # Save updated analysis
-        save_analysis(analysis_id, analysis_data)
-        current_app.logger.info("Regenerated module %s successfully saved", module_id)
-        
-        flash(f'Module {module_id} regenerated successfully!')
-        return redirect(url_for('main.view_materials', analysis_id=analysis_id))
-        
-    except Exception as e:
-        current_app.logger.error("Error regenerating module %s: %s", module_id, str(e), exc_info=True)
-        flash(f'Error regenerating module {module_id}: {str(e)}')
-        return redirect(url_for('main.view_materials', analysis_id=analysis_id))
+    
+    # Apply to the latest saved analysis so edits made while the job ran are kept
+    update_analysis(analysis_id, replace_module)
+    current_app.logger.info("Regenerated module %s successfully saved", module_id)
+    
+    return {'redirect': 'main.view_materials', 'message': f'Module {module_id} regenerated successfully!'}
+
+@main.route('/jobs/<job_id>')
+def job_status(job_id):
+    """Show a waiting page that polls the job until it finishes."""
+    job = GenerationJob.get(job_id)
+    if not job:
+        flash('Job not found.')
+        return redirect(url_for('main.index'))
+    
+    if job.status in ('succeeded', 'failed'):
+        return redirect(url_for('main.job_done', job_id=job_id))
+    
+    return render_template('job_status.html', job=job)
+
+@main.route('/jobs/<job_id>/status')
+def job_status_json(job_id):
+    """Return the job's status and result as JSON."""
+    job = GenerationJob.get(job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    payload = job.to_dict()
+    payload['done_url'] = url_for('main.job_done', job_id=job_id)
+    return jsonify(payload)
+
+@main.route('/jobs/<job_id>/events')
+def job_events(job_id):
+    """
+    Stream a job's progress as Server-Sent Events.
+    
+    Emits one ``progress`` event per finished module component and a final ``done``
+    event with the job status. A response lasts at most JOB_EVENTS_MAX_SECONDS so it
+    does not pin a sync worker for the whole job; the browser then reconnects and
+    resumes from ``Last-Event-ID``.
+    """
+    job = GenerationJob.get(job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    try:
+        last_id = int(request.headers.get('Last-Event-ID') or request.args.get('last_event_id', 0))
+    except ValueError:
+        last_id = 0
+    poll_interval = current_app.config.get('JOB_EVENTS_POLL_INTERVAL', 1)
+    max_seconds = current_app.config.get('JOB_EVENTS_MAX_SECONDS', 25)
+    done_url = url_for('main.job_done', job_id=job_id)
+    
+    def stream():
+        nonlocal last_id
+        started = time.monotonic()
+        yield "retry: 1000\n\n"
+        while time.monotonic() - started < max_seconds:
+            # End the read transaction so rows committed by the worker become visible
+            db.session.rollback()
+            for event in GenerationJobEvent.since(job_id, last_id):
+                last_id = event.id
+                yield f"id: {event.id}\nevent: progress\ndata: {json.dumps(event.data)}\n\n"
+            
+            current = GenerationJob.get(job_id)
+            if current.status in ('succeeded', 'failed'):
+                payload = current.to_dict()
+                payload['done_url'] = done_url
+                yield f"event: done\ndata: {json.dumps(payload)}\n\n"
+                return
+            
+            yield ": keepalive\n\n"
+            time.sleep(poll_interval)
+    
+    return Response(stream_with_context(stream()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@main.route('/jobs/<job_id>/done')
+def job_done(job_id):
+    """Flash the outcome of a finished job and send the user to its result page."""
+    job = GenerationJob.get(job_id)
+    if not job:
+        flash('Job not found.')
+        return redirect(url_for('main.index'))
+    
+    if job.status == 'succeeded':
+        result = job.result or {}
+        if result.get('message'):
+            flash(result['message'])
+        endpoint = result.get('redirect', 'main.view_materials')
+        redirect_args = result.get('redirect_args', {})
+    elif job.status == 'failed':
+        flash(f'Error generating {job.kind.replace("_", " ")}: {job.error}')
+        endpoint = job_queue.failure_endpoints.get(job.kind, 'main.index')
+        redirect_args = {}
+    else:
+        return redirect(url_for('main.job_status', job_id=job_id))
+    
+    return redirect(url_for(endpoint, analysis_id=job.analysis_id, **redirect_args))
+
+
+@contextmanager
+def stream_job_tokens(job_id, interval=0.5):
+    """
+    Store the LLM tokens generated inside the block as 'token' progress events of a job.
+    
+    Deltas are batched (one event every ``interval`` seconds) to keep the event
+    table small; /jobs/<id>/events replays them to every viewer of the page.
+    """
+    report = job_queue.progress_reporter(job_id)
+    pending = []
+    last_flush = [time.monotonic()]
+    
+    def flush():
+        if pending:
+            report({'event': 'token', 'text': ''.join(pending)})
+            pending.clear()
+        last_flush[0] = time.monotonic()
+    
+    def on_token(text):
+        pending.append(text)
+        if time.monotonic() - last_flush[0] >= interval:
+            flush()
+    
+    try:
+        with stream_tokens(on_token):
+            yield
+    finally:
+        flush()
+
+
+def streamed_job(analysis_id, kind, params):
+    """
+    The streamed generation a stream page should show: the job named by ?job=,
+    else the active job for the same request. None if nothing is running.
+    """
+    job_id = request.args.get('job')
+    if job_id:
+        job = GenerationJob.get(job_id)
+        if job and job.analysis_id == analysis_id and job.kind == kind and job.params == params:
+            return job
+    return GenerationJob.find_active(analysis_id, kind, params)
+
+
+def render_stream_page(job, title, course_topic, start_url, fallback_url):
+    """Render the live view of a streamed job, or a button that starts one (with a POST)."""
+    return render_template('stream_generation.html',
+                          title=title,
+                          course_topic=course_topic,
+                          events_url=url_for('main.job_events', job_id=job.id) if job else None,
+                          start_url=start_url,
+                          fallback_url=fallback_url)
+
+STREAMABLE_ANALYSES = {
+    'audience_analysis': 'Audience Analysis',
+    'task_analysis': 'Task Analysis'
+}
+
+def start_analysis_stream(analysis_id, target):
+    """Queue the streamed generation of an audience or task analysis (reusing one already running)."""
+    return job_queue.enqueue('stream_analysis', analysis_id, target=target)
+
+@main.route('/stream/<analysis_id>/<target>', methods=['GET', 'POST'])
+def stream_analysis(analysis_id, target):
+    """
+    Page that renders an audience or task analysis while it is being generated.
+    
+    POST starts the generation as a job; GET only attaches to it, so reloads and
+    reconnects never pay for another one.
+    """
+    analysis_data = load_analysis(analysis_id, fields=())
+    if not analysis_data or target not in STREAMABLE_ANALYSES:
+        flash('Analysis not found. Please submit the form to generate a new analysis.')
+        return redirect(url_for('main.index'))
+    
+    if request.method == 'POST':
+        job = start_analysis_stream(analysis_id, target)
+        return redirect(url_for('main.stream_analysis', analysis_id=analysis_id, target=target, job=job.id))
+    
+    return render_stream_page(streamed_job(analysis_id, 'stream_analysis', {'target': target}),
+                              STREAMABLE_ANALYSES[target],
+                              analysis_data.get('course_topic', ''),
+                              url_for('main.stream_analysis', analysis_id=analysis_id, target=target),
+                              url_for('main.audience_analysis', analysis_id=analysis_id))
+
+@job_queue.handler('stream_analysis', failure_endpoint='main.audience_analysis')
+def run_stream_analysis(analysis_id, target):
+    """Background job: generate an audience or task analysis, storing its tokens as job events."""
+    analysis_data = load_analysis(analysis_id, fields=())
+    if not analysis_data:
+        raise ValueError(f"Analysis {analysis_id} not found")
+    
+    with stream_job_tokens(current_job_id()):
+        if target == 'audience_analysis':
+            result = generate_audience_analysis(analysis_data['course_topic'], analysis_data['audience_type'], '')
+        else:
+            result = generate_task_analysis(analysis_data['course_topic'], analysis_data['audience_type'], "")
+    
+    update_analysis_fields(analysis_id, {target: result})
+    if target == 'audience_analysis':
+        AnalysisLog.update_by_analysis_id(analysis_id=analysis_id, data=load_analysis(analysis_id))
+    return {'redirect': f'main.{target}'}
+
+@main.route('/stream_material/<analysis_id>/<int:module_id>/<material_type>', methods=['GET', 'POST'])
+def stream_material(analysis_id, module_id, material_type):
+    """Page that renders a single material while it is being (re)generated; POST starts it."""
+    analysis_data = load_analysis(analysis_id, fields=())
+    if not analysis_data or material_type not in MATERIAL_COMPONENTS:
+        flash('Materials not found.')
+        return redirect(url_for('main.index'))
+    
+    params = {'module_id': module_id, 'material_type': material_type}
+    if request.method == 'POST':
+        job = job_queue.enqueue('stream_material', analysis_id, **params)
+        return redirect(url_for('main.stream_material', analysis_id=analysis_id, job=job.id, **params))
+    
+    return render_stream_page(streamed_job(analysis_id, 'stream_material', params),
+                              f'Module {module_id}: {material_type.replace("_", " ").title()}',
+                              analysis_data.get('course_topic', ''),
+                              url_for('main.stream_material', analysis_id=analysis_id, **params),
+                              url_for('main.view_materials', analysis_id=analysis_id))
+
+@job_queue.handler('stream_material', failure_endpoint='main.view_materials')
+def run_stream_material(analysis_id, module_id, material_type):
+    """Background job: regenerate one material, storing its tokens as job events."""
+    with stream_job_tokens(current_job_id()):
+        generate_and_merge_material(analysis_id, module_id, material_type)
+    return {'redirect': 'main.view_material',
+            'redirect_args': {'module_id': module_id, 'material_type': material_type}}
+
+@main.route('/analysis/<analysis_id>/usage')
+def analysis_usage(analysis_id):
+    """
+    Token, latency and cost breakdown of every LLM call recorded for an analysis.
+    
+    Costs use the per-model USD prices per million tokens in LLM_PRICING.
+    """
+    pricing = current_app.config.get('LLM_PRICING', {})
+    
+    def with_cost(row):
+        price = pricing.get(row.get('model')) or pricing.get('default') or {}
+        row['cost_usd'] = round(row['prompt_tokens'] / 1e6 * price.get('input', 0)
+                                + row['completion_tokens'] / 1e6 * price.get('output', 0), 6)
+        return row
+    
+    by_model = [with_cost(row) for row in LLMUsage.breakdown(analysis_id, group_by=('model',))]
+    by_component = [with_cost(row) for row in LLMUsage.breakdown(analysis_id, group_by=('component', 'model'))]
+    by_module = [with_cost(row) for row in LLMUsage.breakdown(analysis_id, group_by=('module', 'component', 'model'))]
+    
+    totals = {key: sum(row[key] for row in by_model)
+              for key in ('calls', 'cached_calls', 'prompt_tokens', 'completion_tokens', 'total_tokens', 'latency_ms')}
+    totals['cost_usd'] = round(sum(row['cost_usd'] for row in by_model), 6)
+    
+    return jsonify({
+        'analysis_id': analysis_id,
+        'totals': totals,
+        'by_model': by_model,
+        'by_component': by_component,
+        'by_module': by_module
+    })
 
+@main.route('/analyses')
+@login_required
+def list_analyses():
+    """The signed-in user's analyses, newest first (optionally filtered by ?course_topic=)."""
+    limit = min(request.args.get('limit', 50, type=int), 500)
+    analyses = AnalysisLog.list_for_user(session['user']['email'],
+                                         course_topic=request.args.get('course_topic'),
+                                         limit=limit)
+    return jsonify({'analyses': analyses})
+
+@main.route('/metrics')
+def metrics():
+    """Cache and rate limiter statistics for this process."""
+    return jsonify({
+        'llm_cache': get_response_cache().stats(),
+        'llm_rate_limit': get_rate_limiter().stats(),
+        'analysis_cache': record_cache.stats(),
+        'export_cache': export_cache.stats(),
+        'image_search_cache': image_service.cache.stats(),
+        'image_providers': breaker_status()
+    })
+
+@main.route('/image_providers/status')
+def image_providers_status():
+    """Circuit breaker state of each image API; 'open' providers are currently skipped."""
+    configured = {
+        'unsplash': bool(image_service.unsplash_key),
+        'pexels': bool(image_service.pexels_key),
+        'pixabay': bool(image_service.pixabay_key)
+    }
+    providers = {name: {'configured': is_configured, **get_breaker(name).stats()}
+                 for name, is_configured in configured.items()}
+    return jsonify({
+        'providers': providers,
+        'healthy': all(p['state'] != 'open' for p in providers.values() if p['configured'])
+    })
 
 
 def clean_markdown_text(text):
@@ -1657,7 +1989,7 @@ def clean_groq_response(raw_response):
 
 @main.route('/download_all_materials/<analysis_id>')
 def download_all_materials(analysis_id):
-    """Download all materials as a ZIP file."""
+    """Download all materials as a ZIP file: a cached copy, or streamed as it is built."""
     scorm_version = request.args.get('scorm', '').strip()
     include_scorm = scorm_version == '2004'
 
@@ -1665,184 +1997,168 @@ def download_all_materials(analysis_id):
     analysis_data = load_analysis(analysis_id)
     
     if not analysis_data or 'course_materials' not in analysis_data:
-        current_app.logger.error("While download_all_materials-Materials not found: %s", analysis_id, str(e), exc_info=True)
+        current_app.logger.error("While download_all_materials-Materials not found: %s", analysis_id)
         flash('Materials not found.')
         return redirect(url_for('main.view_materials', analysis_id=analysis_id))
-    
-    try:
-        # Create a ZIP file in memory
-        zip_buffer = io.BytesIO()
-        
-        with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-            # Add overview document
-            overview = create_materials_overview(analysis_data)
-            zip_file.writestr('Course_Materials_Overview.txt', overview)
-            
-            navigation_data = create_combined_navigation(analysis_data['course_materials'])
-            zip_file.writestr('navigation.json', json.dumps(navigation_data, indent=2))
-			# Add SCORM runtime files if requested
-            if include_scorm:
-                scorm_files = {
-                    'index_lms.html': os.path.join(current_app.root_path, 'static', 'index_lms.html'),
-                    'course.js': os.path.join(current_app.root_path, 'static', 'js', 'course.js'),
-                    'ADLwrapper.js': os.path.join(current_app.root_path, 'static', 'js', 'ADLwrapper.js'),
-                    'index.css': os.path.join(current_app.root_path, 'static', 'css', 'index.css')                                 
-                }
-                
-                # Add all files from the images folder
-                images_folder = os.path.join(current_app.root_path, 'static', 'images')
-                for root, dirs, files in os.walk(images_folder):
-                    for file in files:
-                        abs_path = os.path.join(root, file)
-                        # Get relative path inside 'static' to preserve folder structure
-                        rel_path = os.path.relpath(abs_path, os.path.join(current_app.root_path, 'static'))
-                        scorm_files[rel_path] = abs_path                      
-                for arcname, filepath in scorm_files.items():
-                    if os.path.exists(filepath):
-                        zip_file.write(filepath, arcname)
-                    else:
-                        current_app.logger.warning(f'SCORM file missing: {filepath}')
-                
-                # Generate and add manifest
-                manifest_xml = create_scorm_manifest(
-                    course_title=analysis_data['course_topic'],
-                    modules=analysis_data['course_materials']['modules']
-                )
-                zip_file.writestr('imsmanifest.xml', manifest_xml)
-
-         
-            # Add each module's materials
-            for module in analysis_data['course_materials']['modules']:
-                module_folder = f"Module_{module['number']}_{sanitize_filename(module['title'])}"
-                module_title = module['title']
-                module_number = module['number']
-                # Collect chapter/component names
-                # chapters = []
-                # for component_type, component_data in module['components'].items():
-                #     if component_data:
-                #         # Format component type as title (e.g., "lesson_plan" -> "Lesson Plan")
-                #         chapter_name = component_type.replace('_', ' ').title()
-                #         chapters.append(chapter_name)
-                
-                
-                # Add each component
-                for component_type, component_data in module['components'].items():
-                    if component_data:
-                        # Create filename
-                        filename = f"{module_folder}/{component_type.replace('_', ' ').title()}.json"
-                        
-                        # Add to ZIP
-                        content = json.dumps(component_data, indent=2)
-                        zip_file.writestr(filename, content)
-                        
-                        # Also create a formatted text version
-                        text_content = format_material_as_text(component_type, component_data)
-                        text_filename = f"{module_folder}/{component_type.replace('_', ' ').title()}.txt"
-                        zip_file.writestr(text_filename, text_content)
-
-                       # 3. Clean JSON (structured � parsed from markdown if needed)
-                        component_type = component_type.lower()
-
-                        if component_type in ["assessments", "assessment"]:
-                            print('assessments')
-                            if 'raw_content' in component_data:
-                                asses_json_output = parse_assessment_to_json(component_data['raw_content'])
-                                cleaned_data = asses_json_output
-                            elif 'comprehensive_assessments' in component_data:
-                                #asses_json_output = parse_assessment_to_json(component_data['comprehensive_assessments'])
-                                combined_content = (
-                                    component_data.get('comprehensive_assessments', '') + '\n' +
-                                    component_data.get('practice_questions', '')
-                                )
-                                asses_json_output = parse_assessment_to_json(combined_content)
-                                cleaned_data = asses_json_output
- 
-                            else:
-                                asses_json_output = None  # or handle the missing key case appropriately
- 
 
-                        elif component_type == "content":
-                             #json_output = parse_content_to_json_contenttype(component_data['raw_content'])
-                            if 'raw_content' in component_data:
-                                json_output = parse_content_to_json_contenttype(component_data['raw_content'],analysis_id,component_data['metadata'])
-                            elif 'main_content' in component_data:
-                                json_output = parse_content_to_json_contenttype(component_data['main_content'],analysis_id,component_data['metadata'])
-                            else:
-                                json_output = None  # or handle the missing key case appropriately
-
-                            cleaned_data = json_output
-                                                     
-                        else:
-                            cleaned_data = component_data  # fallback: use raw JSON if unknown type
-                            
+    download_name = f"Course_Materials_{sanitize_filename(analysis_data['course_topic'])}.zip"
+    key = materials_export_key(analysis_id, analysis_data, include_scorm)
+    cached_zip = export_cache.get(analysis_id, key)
+    if cached_zip:
+        return send_file(cached_zip, mimetype='application/zip', as_attachment=True,
+                         download_name=download_name)
+
+    failed_images = []
+
+    def archive_key():
+        # Figures downloaded during the build change the image manifest, so key the archive by
+        # what it was built from; a build missing a figure is not kept, the next one retries it
+        if failed_images:
+            current_app.logger.warning("Not caching materials ZIP for %s: %d images failed to download",
+                                       analysis_id, len(failed_images))
+            return None
+        return materials_export_key(analysis_id, analysis_data, include_scorm)
+
+    def generate():
+        try:
+            chunks = stream_zip(materials_zip_entries(analysis_id, analysis_data, include_scorm, failed_images))
+            yield from export_cache.tee(analysis_id, archive_key, chunks)
+        except Exception as e:
+            # Headers are already sent, so the client sees a truncated download
+            current_app.logger.error("Error creating materials ZIP: %s", str(e), exc_info=True)
+            raise
 
-                        clean_json_filename = f"{filename}.clean.json"
-                        clean_json_content = json.dumps(cleaned_data, indent=2)
-                        zip_file.writestr(clean_json_filename, clean_json_content)
+    response = Response(stream_with_context(generate()), mimetype='application/zip')
+    response.headers.set('Content-Disposition', 'attachment', filename=download_name)
+    return response
 
 
-            # 🔹 Now SCORM logic (AFTER modules)
-            if include_scorm:
-                scorm_files = {
-                    'index_lms.html': os.path.join(current_app.root_path, 'static', 'index_lms.html'),
-                    'course.js': os.path.join(current_app.root_path, 'static', 'js', 'course.js'),
-                    'ADLwrapper.js': os.path.join(current_app.root_path, 'static', 'js', 'ADLwrapper.js'),
-                    'index.css': os.path.join(current_app.root_path, 'static', 'css', 'index.css')
-                }
+# Bump when the contents of the materials download change for the same analysis
+MATERIALS_EXPORT_VERSION = 1
 
-                # Add all files from static/images
-                images_folder = os.path.join(current_app.root_path, 'static', 'images')
-                for root, dirs, files in os.walk(images_folder):
-                    for file in files:
-                        abs_path = os.path.join(root, file)
-                        rel_path = os.path.relpath(abs_path, os.path.join(current_app.root_path, 'static'))
-                        scorm_files[rel_path] = abs_path
-
-                # Point to the subfolder for the current analysis_id only
-                analysis_folder = os.path.join(
-                    current_app.root_path, "..", "moduleimages", f"{analysis_id}"
-                )
-                analysis_folder = os.path.abspath(analysis_folder)
 
-                if os.path.exists(analysis_folder):
-                    for root, dirs, files in os.walk(analysis_folder):
-                        for file in files:
-                            abs_path = os.path.join(root, file)
+def scorm_static_files():
+    """SCORM runtime files shipped in every SCORM package, as {arcname: path}."""
+    static_folder = os.path.join(current_app.root_path, 'static')
+    scorm_files = {
+        'index_lms.html': os.path.join(static_folder, 'index_lms.html'),
+        'course.js': os.path.join(static_folder, 'js', 'course.js'),
+        'ADLwrapper.js': os.path.join(static_folder, 'js', 'ADLwrapper.js'),
+        'index.css': os.path.join(static_folder, 'css', 'index.css')
+    }
+
+    # Add all files from static/images
+    images_folder = os.path.join(static_folder, 'images')
+    for root, dirs, files in os.walk(images_folder):
+        for file in files:
+            abs_path = os.path.join(root, file)
+            rel_path = os.path.relpath(abs_path, static_folder)
+            scorm_files[rel_path] = abs_path
+    return scorm_files
+
+
+def materials_export_key(analysis_id, analysis_data, include_scorm):
+    """
+    Export cache key for the materials download.
+
+    Covers everything materials_zip_entries reads, including the analysis's
+    image manifest: uploads and figure downloads change the packaged images
+    without touching the materials.
+    """
+    static_files = []
+    if include_scorm:
+        for arcname, filepath in sorted(scorm_static_files().items()):
+            try:
+                st = os.stat(filepath)
+                static_files.append([arcname, st.st_size, st.st_mtime_ns])
+            except FileNotFoundError:
+                continue
+    return content_key(
+        MATERIALS_EXPORT_VERSION, analysis_id, include_scorm, static_files,
+        {key: analysis_data.get(key) for key in ('course_topic', 'audience_type', 'materials_generated_date')},
+        analysis_data['course_materials'],
+        image_store.manifest(analysis_id)
+    )
+
+
+def materials_zip_entries(analysis_id, analysis_data, include_scorm, failed_images=None):
+    """
+    Yield (arcname, content or file path) for every file in the materials download.
+
+    URLs of figures that could not be downloaded are appended to ``failed_images``.
+    """
+    # Add overview document
+    yield 'Course_Materials_Overview.txt', create_materials_overview(analysis_data)
 
-                            # Make rel_path relative to the *parent of moduleimages*
-                            rel_path = os.path.relpath(abs_path, os.path.join(analysis_folder, "..", ".."))
-                            rel_path = rel_path.replace("\\", "/")
+    navigation_data = create_combined_navigation(analysis_data['course_materials'])
+    yield 'navigation.json', json_codec.dumps_pretty(navigation_data)
 
-                            # ✅ Now SCORM will contain: moduleimages/analysis_<id>/image.jpg
-                            scorm_files[rel_path] = abs_path
+    # Add each module's materials
+    for module in analysis_data['course_materials']['modules']:
+        module_folder = f"Module_{module['number']}_{sanitize_filename(module['title'])}"
 
-                for arcname, filepath in scorm_files.items():
-                    if os.path.exists(filepath):
-                        zip_file.write(filepath, arcname)
+        # Add each component
+        for component_type, component_data in module['components'].items():
+            if component_data:
+                # Create filename
+                filename = f"{module_folder}/{component_type.replace('_', ' ').title()}.json"
+                yield filename, json_codec.dumps_pretty(component_data)
+
+                # Also create a formatted text version
+                text_filename = f"{module_folder}/{component_type.replace('_', ' ').title()}.txt"
+                yield text_filename, format_material_as_text(component_type, component_data)
+
+                # 3. Clean JSON (structured, parsed from markdown if needed)
+                component_type = component_type.lower()
+
+                if component_type in ["assessments", "assessment"]:
+                    if 'raw_content' in component_data:
+                        cleaned_data = parse_assessment_to_json(component_data['raw_content'])
+                    elif 'comprehensive_assessments' in component_data:
+                        combined_content = (
+                            component_data.get('comprehensive_assessments', '') + '\n' +
+                            component_data.get('practice_questions', '')
+                        )
+                        cleaned_data = parse_assessment_to_json(combined_content)
+                    else:
+                        cleaned_data = None
+
+                elif component_type == "content":
+                    if 'raw_content' in component_data:
+                        cleaned_data = parse_content_to_json_contenttype(component_data['raw_content'],analysis_id,component_data['metadata'],
+                                                                        failed_images)
+                    elif 'main_content' in component_data:
+                        cleaned_data = parse_content_to_json_contenttype(component_data['main_content'],analysis_id,component_data['metadata'],
+                                                                        failed_images)
                     else:
-                        current_app.logger.warning(f'SCORM file missing: {filepath}')
+                        cleaned_data = None
 
-                # Add manifest
-                manifest_xml = create_scorm_manifest(
-                    course_title=analysis_data['course_topic'],
-                    modules=analysis_data['course_materials']['modules']
-                )
-                zip_file.writestr('imsmanifest.xml', manifest_xml)
+                else:
+                    cleaned_data = component_data  # fallback: use raw JSON if unknown type
 
-        # Prepare for download
-        zip_buffer.seek(0)
-        
-        return send_file(
-            zip_buffer,
-            mimetype='application/zip',
-            as_attachment=True,
-            download_name=f"Course_Materials_{sanitize_filename(analysis_data['course_topic'])}.zip"
+                yield f"{filename}.clean.json", json_codec.dumps_pretty(cleaned_data)
+
+    # 🔹 Now SCORM logic (AFTER modules)
+    if include_scorm:
+        scorm_files = scorm_static_files()
+
+        # Images of the current analysis only, read through the image store
+        for file_name, abs_path in image_store.files(analysis_id).items():
+            # ✅ SCORM will contain: moduleimages/analysis_<id>/image.jpg
+            scorm_files[f"moduleimages/{analysis_id}/{file_name}"] = abs_path
+
+        for arcname, filepath in scorm_files.items():
+            if os.path.exists(filepath):
+                yield arcname, pathlib.Path(filepath)
+            else:
+                current_app.logger.warning(f'SCORM file missing: {filepath}')
+
+        # Add manifest
+        manifest_xml = create_scorm_manifest(
+            course_title=analysis_data['course_topic'],
+            modules=analysis_data['course_materials']['modules']
         )
-        
-    except Exception as e:
-        current_app.logger.error("Error creating materials ZIP: %s", str(e), exc_info=True)
-        flash('Error creating download file.')
-        return redirect(url_for('main.view_materials', analysis_id=analysis_id))
+        yield 'imsmanifest.xml', manifest_xml
 
 import re
 
@@ -2597,7 +2913,7 @@ def format_material_as_text(material_type, material_data):
         data = material_data
     
     # Convert to formatted text
-    text += json.dumps(data, indent=2)
+    text += json_codec.dumps_pretty(data)
     
     return text
 
@@ -2639,7 +2955,6 @@ import shutil
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))  # this points to /app
 #SAVE_DIR = os.path.join(BASE_DIR, "static", "materialimages")
-MODULE_IMAGES_BASE = os.path.join(BASE_DIR, "..", "moduleimages")  # outside static
 
 def safe_filename(text, idx):
     """Sanitize alt text into a safe filename."""
@@ -2651,15 +2966,27 @@ def safe_filename(text, idx):
 
 
 from urllib.parse import urlparse    
-def extract_and_download_figures(md_text, analysis_id):
+from concurrent.futures import wait
+import hashlib
+def extract_and_download_figures(md_text, analysis_id, failed_images=None):
     """
     Extract <figure> and markdown image tags from md_text,
-    download images into /moduleimages/<analysis_id>/,
-    and replace references with local <img> tags.
+    download images into the analysis's image store (concurrently, see
+    app.image_store), and replace references with local <img> tags.
+    URLs that could not be downloaded are appended to ``failed_images``.
     """
-    save_folder = os.path.join(MODULE_IMAGES_BASE, str(analysis_id))
-    os.makedirs(save_folder, exist_ok=True)
+    downloads = []
 
+    # --- Helper to keep different images with the same name apart ---
+    name_urls = {name: entry.get('url') for name, entry in image_store.manifest(analysis_id).items()}
+
+    def unique_file_name(file_name, img_url):
+        if name_urls.setdefault(file_name, img_url) == img_url:
+            return file_name
+        stem, ext = os.path.splitext(file_name)
+        file_name = f"{stem}_{hashlib.sha256(img_url.encode('utf-8')).hexdigest()[:8]}{ext}"
+        name_urls[file_name] = img_url
+        return file_name
 
     # --- Helper to detect if a URL is local to this backend ---
     def is_local(img_url):
@@ -2692,23 +3019,16 @@ def extract_and_download_figures(md_text, analysis_id):
         # Extract the filename from the URL
         url_path = img_url.split("?")[0]  # remove query params
         base_name = os.path.basename(url_path)  # e.g., "graphical_user_interface.jpg"
-        file_name = base_name or "image.jpg"
+        file_name = unique_file_name(base_name or "image.jpg", img_url)
         
         # safe_name = re.sub(r'\W+', '_', alt_text.strip()).strip("_")
         # file_ext = os.path.splitext(img_url.split("?")[0])[1] or ".jpg"
         # file_name = f"{safe_name}{file_ext}"
 
-        file_path = os.path.join(save_folder, file_name)
         rel_path = os.path.join("moduleimages", str(analysis_id), file_name).replace("\\", "/")
 
-        if not os.path.exists(file_path):
-            try:
-                response = requests.get(img_url, timeout=30)
-                response.raise_for_status()
-                with open(file_path, "wb") as f:
-                    f.write(response.content)
-            except Exception as e:
-                print(f"[Download Error] {img_url}: {e}")
+        # Downloaded in the background; the reference is rewritten either way
+        downloads.append((img_url, image_store.fetch(analysis_id, file_name, img_url)))
 
         return f'<div class="textbook-image"><img src="{rel_path}" alt="{alt_text}"/></div>'
 
@@ -2717,6 +3037,7 @@ def extract_and_download_figures(md_text, analysis_id):
     soup = BeautifulSoup(md_text, "html.parser")
 
     # --- Step 2: Handle <figure> tags and download images ---
+    figures = []
     for idx, fig in enumerate(soup.find_all("figure"), start=1):
         try:
             img_tag = fig.find("img")
@@ -2729,29 +3050,30 @@ def extract_and_download_figures(md_text, analysis_id):
 
             safe_name = re.sub(r'\W+', '_', alt_text.strip()).strip("_")
             file_ext = os.path.splitext(img_url.split("?")[0])[1] or ".jpg"
-            file_name = f"{safe_name}{file_ext}"
-            file_path = os.path.join(save_folder, file_name)
-
-            # Download if not exists
-            if not os.path.exists(file_path):
-                try:
-                    response = requests.get(img_url, timeout=30)
-                    response.raise_for_status()
-                    with open(file_path, "wb") as f:
-                        f.write(response.content)
-                except Exception as e:
-                    print(f"[Download Error] {img_url}: {e}")
-                    continue
+            file_name = unique_file_name(f"{safe_name}{file_ext}", img_url)
 
-            # Replace <figure> with <img>
-            rel_path = os.path.join("moduleimages", str(analysis_id), file_name).replace("\\", "/")
-            new_img_tag = soup.new_tag("img", src=rel_path, alt=alt_text)
-            fig.replace_with(new_img_tag)
+            # Download in the background (skipped if the file already exists)
+            figures.append((fig, file_name, alt_text, img_url, image_store.fetch(analysis_id, file_name, img_url)))
 
         except Exception as e:
             print(f"[Figure Error] {e}")
             continue
 
+    # Every download has its own time budget, so this waits for the slowest one
+    downloads += [(img_url, future) for *_, img_url, future in figures]
+    wait([future for _, future in downloads])
+    if failed_images is not None:
+        failed_images.extend(img_url for img_url, future in downloads if not future.result())
+
+    for fig, file_name, alt_text, img_url, future in figures:
+        if not future.result():
+            continue
+
+        # Replace <figure> with <img>
+        rel_path = os.path.join("moduleimages", str(analysis_id), file_name).replace("\\", "/")
+        new_img_tag = soup.new_tag("img", src=rel_path, alt=alt_text)
+        fig.replace_with(new_img_tag)
+
     return str(soup)
 
 
@@ -2764,11 +3086,7 @@ def upload_image():
     file = request.files['image']
     analysis_id = request.form.get("analysis_id", "default_analysis")
 
-    # --- Step 1: Make folder ---
-    save_folder = os.path.join(MODULE_IMAGES_BASE, str(analysis_id))
-    os.makedirs(save_folder, exist_ok=True)
-
-    # --- Step 2: Generate safe filename ---
+    # --- Step 1: Generate safe filename ---
     # alt_text = request.form.get("alt_text", os.path.splitext(file.filename)[0])
     # safe_name = re.sub(r'\W+', '_', alt_text.strip()).strip("_")
     safe_name = re.sub(r'\W+', '_', os.path.splitext(file.filename)[0])
@@ -2776,12 +3094,14 @@ def upload_image():
     #timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
     # file_name = f"{safe_name}_{timestamp}{file_ext}"
     file_name = f"{safe_name}{file_ext}"
-    file_path = os.path.join(save_folder, file_name)
 
-    # --- Step 3: Save file ---
-    file.save(file_path)
+    # --- Step 2: Save file (content-addressed, see app.image_store) ---
+    try:
+        image_store.save_upload(analysis_id, file_name, file)
+    except ValueError as e:
+        return jsonify({"success": False, "message": str(e)}), 400
 
-    # --- Step 4: Build dynamic URL ---
+    # --- Step 3: Build dynamic URL ---
     # request.host_url gives the current scheme + host + port
     rel_path = os.path.join("moduleimages", str(analysis_id), file_name).replace("\\", "/")
     file_url = f"{request.host_url.rstrip('/')}/{rel_path}"
@@ -2820,11 +3140,11 @@ def process_md(analysis_id):
 
 
 
-def parse_content_to_json_contenttype(md_text,analysis_id,coursetopic):
+def parse_content_to_json_contenttype(md_text,analysis_id,coursetopic,failed_images=None):
     # rawtext = md_text
     rawtext = format_keyword_sections(md_text)
     #imgresult = extract_and_download_figures(md_text)
-    rawtext = extract_and_download_figures(rawtext,analysis_id)
+    rawtext = extract_and_download_figures(rawtext,analysis_id,failed_images)
     #print(imgresult)
 
     headings = [
@@ -3510,7 +3830,7 @@ def download_module_materials(analysis_id, module_id):
             for component_type, component_data in module.get('components', {}).items():
                 if component_data:
                     filename = f"Module_{module_id}_{component_type}.json"
-                    zip_file.writestr(filename, json.dumps(component_data, indent=2))
+                    zip_file.writestr(filename, json_codec.dumps_pretty(component_data))
             
             # Add a summary file
             summary = {
@@ -3520,7 +3840,7 @@ def download_module_materials(analysis_id, module_id):
                 'course_topic': analysis_data['course_topic'],
                 'generation_date': analysis_data.get('materials_generated_date', 'Unknown')
             }
-            zip_file.writestr(f"Module_{module_id}_Summary.json", json.dumps(summary, indent=2))
+            zip_file.writestr(f"Module_{module_id}_Summary.json", json_codec.dumps_pretty(summary))
         
         zip_buffer.seek(0)
         current_app.logger.info("Module ZIP created successfully for module %s", module_id)
@@ -3553,11 +3873,13 @@ from flask import current_app, send_from_directory,  abort
 
 @main.route("/moduleimages/<analysis_id>/<filename>")
 def serve_module_image(analysis_id, filename):
-    folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "moduleimages", analysis_id)
-    folder = os.path.abspath(folder)  # ensure safe absolute path
-    if not os.path.exists(os.path.join(folder, filename)):
+    try:
+        filepath = image_store.path(analysis_id, filename)
+    except ValueError:
+        abort(404)
+    if not filepath:
         abort(404)
-    return send_from_directory(folder, filename)
+    return send_file(filepath, mimetype=image_store.mimetype(filename))
 
 
 
@@ -3645,7 +3967,7 @@ def format_material_as_text(material_type, material_data):
         data = material_data
     
     # Convert to formatted text
-    text += json.dumps(data, indent=2)
+    text += json_codec.dumps_pretty(data)
     
     return text
 
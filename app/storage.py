@@ -0,0 +1,839 @@
+"""
+Persistence for analysis documents.
+
+Each analysis is stored as a directory of separately addressable JSON records,
+so a view reads only what it renders and an edit rewrites only what changed::
+
+    data/<analysis_id>/
+        analysis.json                      small top-level fields (topic, dates, ...)
+        audience_analysis.json             one file per RECORD_FIELDS entry
+        task_analysis.json
+        course_structure.json
+        ...
+        course_materials/
+            materials.json                 metadata + ordered module numbers
+            module_<n>/module.meta.json    module fields + ordered component names
+            module_<n>/<component>.json    one material component
+
+Analyses saved before this layout (a single ``data/<analysis_id>.json``) are
+still readable and are converted on their first write.
+
+Every record is written to a temporary file in the same directory, fsynced and
+atomically renamed over the old one, so readers never see a half-written
+record. ``analysis.json`` is written last, after the records it describes.
+
+Writers for the same analysis are serialised by a per-analysis lock (a thread
+lock within the process plus an ``flock`` on ``data/.locks/<id>.lock`` across
+gunicorn workers). Read-modify-write updates must go through
+``update_analysis`` (or the narrower ``update_analysis_fields`` /
+``save_material``) so concurrent requests cannot lose each other's changes.
+
+Parsed records are kept in an in-process LRU (``record_cache``) bounded by
+ANALYSIS_CACHE_MAX_MB of JSON. Entries are validated against the file's
+mtime, size and inode on every read, so writes from other workers are seen
+immediately. Cached values are shared, not copied: the loaders return fresh
+documents, module dicts and component maps, but record values (texts and
+material dicts) are the cached objects, so copy one before changing it in place.
+
+Writing course materials drops the analysis's prebuilt downloads from
+app.export_cache.
+
+With ANALYSIS_STORAGE_BACKEND=postgres the same functions are served by
+app.pg_storage.PostgresAnalysisStore from analysis_log.data (JSONB) instead,
+and the data/ directory is only read by the ``flask import-analyses`` command.
+That backend is experimental (its SQL is only tested against a fake session)
+and must also be opted into with ANALYSIS_STORAGE_EXPERIMENTAL=true.
+
+Records can be stored compressed (ANALYSIS_COMPRESSION=gzip|zstd; zstd needs
+the optional ``zstandard`` package). Readers recognise compressed records by
+their magic header, so plain and compressed records can coexist and the
+setting can change at any time; ``flask compress-analyses`` rewrites the
+existing records (and converts legacy files) in the configured format.
+"""
+
+import copy
+import gzip
+import logging
+import os
+import re
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import click
+
+from app.export_cache import export_cache
+from app.ids import new_analysis_id
+from models import json_codec
+
+try:
+    import fcntl
+except ImportError:  # Windows: only in-process locking is available
+    fcntl = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+LOCK_DIR = os.path.join(DATA_DIR, '.locks')
+
+# Large top-level fields kept in their own record instead of analysis.json
+RECORD_FIELDS = (
+    'audience_analysis',
+    'task_analysis',
+    'course_structure',
+    'instructional_strategies',
+    'assessment_plan',
+)
+MATERIALS_FIELD = 'course_materials'
+ROOT_RECORD = 'analysis.json'
+MATERIALS_DIR = 'course_materials'
+MATERIALS_RECORD = os.path.join(MATERIALS_DIR, 'materials.json')
+# Component names cannot contain dots, so this never collides with a component record
+MODULE_RECORD = 'module.meta.json'
+
+_NAME_RE = re.compile(r'^[A-Za-z0-9_\-]+$')
+
+COMPRESSION_METHODS = ('none', 'gzip', 'zstd')
+_GZIP_MAGIC = b'\x1f\x8b'
+_ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+_DEFAULT_LEVELS = {'gzip': 6, 'zstd': 3}
+# Smaller records are left as plain JSON; compressing them saves next to nothing
+_COMPRESS_MIN_BYTES = 512
+
+# Configured database store (False = files), see _database_store
+_store = None
+
+_thread_locks = {}
+_thread_locks_guard = threading.Lock()
+# Per-thread lock depth by analysis id, so nested acquisitions skip the file lock
+_held = threading.local()
+
+
+def _check_name(name):
+    if not isinstance(name, str) or not _NAME_RE.match(name):
+        raise ValueError(f"Invalid analysis record name: {name!r}")
+    return name
+
+
+def analysis_dir(analysis_id):
+    return os.path.join(DATA_DIR, _check_name(analysis_id))
+
+
+def legacy_analysis_path(analysis_id):
+    """Path of the single-file layout used before analyses were split into records."""
+    return os.path.join(DATA_DIR, f"{_check_name(analysis_id)}.json")
+
+
+def _module_dir(module_number):
+    return os.path.join(MATERIALS_DIR, f"module_{module_number}")
+
+
+def _module_record(module_number):
+    return os.path.join(_module_dir(module_number), MODULE_RECORD)
+
+
+def _component_record(module_number, component):
+    return os.path.join(_module_dir(module_number), f"{_check_name(component)}.json")
+
+
+def _thread_lock(analysis_id):
+    with _thread_locks_guard:
+        lock = _thread_locks.get(analysis_id)
+        if lock is None:
+            lock = _thread_locks[analysis_id] = threading.RLock()
+        return lock
+
+
+@contextmanager
+def analysis_lock(analysis_id):
+    """
+    Hold the exclusive write lock for one analysis.
+
+    Re-entrant within a thread, so code holding the lock may call save_analysis.
+    """
+    _check_name(analysis_id)
+    held = getattr(_held, 'depth', None)
+    if held is None:
+        held = _held.depth = {}
+
+    with _thread_lock(analysis_id):
+        # Only the outermost acquisition in this thread takes the file lock
+        depth = held.get(analysis_id, 0)
+        held[analysis_id] = depth + 1
+        lock_file = None
+        try:
+            if depth == 0 and fcntl is not None:
+                os.makedirs(LOCK_DIR, exist_ok=True)
+                lock_file = open(os.path.join(LOCK_DIR, f"{analysis_id}.lock"), 'a')
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            yield
+        finally:
+            if lock_file is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+                lock_file.close()
+            if depth:
+                held[analysis_id] = depth
+            else:
+                del held[analysis_id]
+
+
+def _fsync_dir(directory):
+    # Persist renames and unlinks in the directory itself
+    if hasattr(os, 'O_DIRECTORY'):
+        dir_fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+
+def atomic_write(filepath, payload, sync_dir=True):
+    """Write bytes to filepath via temp file + fsync + rename."""
+    directory = os.path.dirname(filepath)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, filepath)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+    if sync_dir:
+        _fsync_dir(directory)
+
+
+def compression_method(name):
+    """Validate a compression name, falling back to gzip when zstandard is missing."""
+    name = (name or 'none').lower()
+    if name not in COMPRESSION_METHODS:
+        raise ValueError(f"Unknown ANALYSIS_COMPRESSION: {name}")
+    if name == 'zstd' and zstandard is None:
+        logger.warning("zstandard is not installed, compressing analyses with gzip")
+        return 'gzip'
+    return name
+
+
+COMPRESSION = compression_method(os.environ.get('ANALYSIS_COMPRESSION', 'none'))
+_COMPRESSION_LEVEL = os.environ.get('ANALYSIS_COMPRESSION_LEVEL')
+
+
+def compress(payload, method=None):
+    """Compress a JSON payload with ``method`` (default: ANALYSIS_COMPRESSION)."""
+    method = method or COMPRESSION
+    if method == 'none' or len(payload) < _COMPRESS_MIN_BYTES:
+        return payload
+    level = int(_COMPRESSION_LEVEL or _DEFAULT_LEVELS[method])
+    if method == 'zstd':
+        return zstandard.ZstdCompressor(level=level).compress(payload)
+    # mtime=0 keeps the output deterministic
+    return gzip.compress(payload, compresslevel=level, mtime=0)
+
+
+def decompress(payload):
+    """The JSON in a stored record, whether it was written compressed or not."""
+    if payload[:2] == _GZIP_MAGIC:
+        return gzip.decompress(payload)
+    if payload[:4] == _ZSTD_MAGIC:
+        if zstandard is None:
+            raise RuntimeError("Analysis record is zstd-compressed but zstandard is not installed")
+        return zstandard.ZstdDecompressor().decompressobj().decompress(payload)
+    return payload
+
+
+def _encode(value):
+    return json_codec.dumps(value)
+
+
+class RecordCache:
+    """
+    Thread-safe LRU of parsed JSON files, bounded by the total size of their JSON.
+
+    Files may be compressed (see ``decompress``); sizes are those of the JSON.
+
+    Each entry remembers the (mtime, size, inode) it was parsed from and is
+    re-read when the file no longer matches. Atomic renames always change the
+    inode, so a rewrite is detected even within the filesystem's mtime
+    resolution. A max_bytes of 0 disables caching.
+
+    Values are returned without copying (a deepcopy of a large record costs
+    more than parsing it again), so they must be treated as read-only.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def load(self, filepath):
+        """Parsed JSON file (shared, read-only), or None if it does not exist."""
+        try:
+            st = os.stat(filepath)
+            with self._lock:
+                entry = self._entries.get(filepath)
+                if entry is not None and entry[0] == (st.st_mtime_ns, st.st_size, st.st_ino):
+                    self._entries.move_to_end(filepath)
+                    self.hits += 1
+                    return entry[1]
+                if entry is not None:
+                    self.stale += 1
+                self.misses += 1
+
+            with open(filepath, 'rb') as f:
+                # Sign what was actually read, in case the file was replaced since the stat
+                st = os.fstat(f.fileno())
+                payload = f.read()
+        except FileNotFoundError:
+            self.discard(filepath)
+            return None
+
+        payload = decompress(payload)
+        value = json_codec.loads(payload)
+        self._store(filepath, (st.st_mtime_ns, st.st_size, st.st_ino), value, len(payload))
+        return value
+
+    def _store(self, filepath, signature, value, size):
+        if not self.max_bytes or size > self.max_bytes:
+            return False
+        with self._lock:
+            old = self._entries.pop(filepath, None)
+            if old is not None:
+                self.bytes -= old[2]
+            self._entries[filepath] = (signature, value, size)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                _, (_, _, evicted_size) = self._entries.popitem(last=False)
+                self.bytes -= evicted_size
+                self.evictions += 1
+        return True
+
+    def discard(self, filepath):
+        with self._lock:
+            entry = self._entries.pop(filepath, None)
+            if entry is not None:
+                self.bytes -= entry[2]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "stale": self.stale,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes
+            }
+
+
+record_cache = RecordCache(int(float(os.environ.get('ANALYSIS_CACHE_MAX_MB', 64)) * 1024 * 1024))
+
+
+def _read_record(analysis_id, relpath):
+    """Parsed record, or None if it does not exist."""
+    return record_cache.load(os.path.join(DATA_DIR, analysis_id, relpath))
+
+
+def _split_materials(materials):
+    """Map a course_materials dict to {relative path: record value}."""
+    records = {}
+    module_numbers = []
+    for module in materials.get('modules', []):
+        number = module['number']
+        module_numbers.append(number)
+        components = module.get('components') or {}
+        for component, value in components.items():
+            records[_component_record(number, component)] = value
+        records[_module_record(number)] = {
+            **{k: v for k, v in module.items() if k != 'components'},
+            'components': list(components)
+        }
+    records[MATERIALS_RECORD] = {
+        **{k: v for k, v in materials.items() if k != 'modules'},
+        'modules': module_numbers
+    }
+    return records
+
+
+def _split(data):
+    """Map a full analysis dict to {relative path: record value}."""
+    records = {}
+    root = {}
+    for key, value in data.items():
+        if key in RECORD_FIELDS:
+            records[f"{key}.json"] = value
+        elif key == MATERIALS_FIELD:
+            records.update(_split_materials(value))
+        else:
+            root[key] = value
+    records[ROOT_RECORD] = root
+    return records
+
+
+def _existing_records(analysis_id, subdir=''):
+    """Relative paths of the records currently stored under analysis_dir/subdir."""
+    base = os.path.join(DATA_DIR, analysis_id)
+    found = []
+    for dirpath, _, filenames in os.walk(os.path.join(base, subdir)):
+        for name in filenames:
+            if name.endswith('.json') and not name.startswith('.tmp-'):
+                found.append(os.path.relpath(os.path.join(dirpath, name), base))
+    return found
+
+
+def _write_order(relpath):
+    # Content records first, then the indexes that list them, then the root
+    if relpath == ROOT_RECORD:
+        return 2
+    if relpath == MATERIALS_RECORD or relpath.endswith(MODULE_RECORD):
+        return 1
+    return 0
+
+
+def _write_records(analysis_id, records, previous=None, remove=()):
+    """
+    Write records (skipping any unchanged from ``previous``) and delete ``remove``.
+
+    ``previous`` maps paths to their uncompressed ``_encode`` payloads. The
+    root record is written last so it never describes records that are not on
+    disk yet. Caller must hold the analysis lock.
+    """
+    base = os.path.join(DATA_DIR, analysis_id)
+    touched = set()
+    changed = []
+    for relpath in sorted(records, key=_write_order):
+        payload = _encode(records[relpath])
+        if previous is not None and previous.get(relpath) == payload:
+            continue
+        filepath = os.path.join(base, relpath)
+        os.makedirs(os.path.dirname(filepath), exist_ok=True)
+        atomic_write(filepath, compress(payload), sync_dir=False)
+        record_cache.discard(filepath)
+        touched.add(os.path.dirname(filepath))
+        changed.append(relpath)
+
+    for relpath in remove:
+        if relpath in records:
+            continue
+        filepath = os.path.join(base, relpath)
+        record_cache.discard(filepath)
+        try:
+            os.unlink(filepath)
+            touched.add(os.path.dirname(filepath))
+            changed.append(relpath)
+        except FileNotFoundError:
+            pass
+
+    for directory in touched:
+        _fsync_dir(directory)
+    _prune_empty_module_dirs(base)
+    if any(relpath.startswith(MATERIALS_DIR + os.sep) for relpath in changed):
+        export_cache.invalidate(analysis_id)
+
+
+def _prune_empty_module_dirs(base):
+    materials_dir = os.path.join(base, MATERIALS_DIR)
+    if not os.path.isdir(materials_dir):
+        return
+    for name in os.listdir(materials_dir):
+        path = os.path.join(materials_dir, name)
+        if os.path.isdir(path) and not any(not f.startswith('.tmp-') for f in os.listdir(path)):
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def _migrate_legacy(analysis_id):
+    """Convert a single-file analysis to the record layout. Caller must hold the lock."""
+    legacy_path = legacy_analysis_path(analysis_id)
+    if os.path.exists(os.path.join(DATA_DIR, analysis_id, ROOT_RECORD)) or not os.path.exists(legacy_path):
+        return
+    data = _load_legacy(analysis_id)
+    _write_records(analysis_id, _split(data))
+    record_cache.discard(legacy_path)
+    os.unlink(legacy_path)
+    _fsync_dir(DATA_DIR)
+    logger.info(f"Converted analysis {analysis_id} to per-record storage")
+
+
+def _database_store():
+    """The PostgreSQL store when ANALYSIS_STORAGE_BACKEND=postgres, else None (files)."""
+    global _store
+    if _store is None:
+        backend = os.environ.get('ANALYSIS_STORAGE_BACKEND', 'files').lower()
+        if backend == 'postgres':
+            if os.environ.get('ANALYSIS_STORAGE_EXPERIMENTAL', 'false').lower() != 'true':
+                raise ValueError("ANALYSIS_STORAGE_BACKEND=postgres is experimental; "
+                                 "set ANALYSIS_STORAGE_EXPERIMENTAL=true to use it")
+            logger.warning("Using the experimental PostgreSQL analysis storage backend")
+            from app.pg_storage import PostgresAnalysisStore
+            _store = PostgresAnalysisStore(RECORD_FIELDS, MATERIALS_FIELD)
+        elif backend == 'files':
+            _store = False
+        else:
+            raise ValueError(f"Unknown ANALYSIS_STORAGE_BACKEND: {backend}")
+    return _store or None
+
+
+def file_analysis_ids():
+    """Ids of every analysis stored under data/ (record directories and legacy files)."""
+    ids = set()
+    for name in os.listdir(DATA_DIR):
+        path = os.path.join(DATA_DIR, name)
+        if name.endswith('.json') and os.path.isfile(path):
+            ids.add(name[:-len('.json')])
+        elif os.path.exists(os.path.join(path, ROOT_RECORD)):
+            ids.add(name)
+    return sorted(i for i in ids if _NAME_RE.match(i))
+
+
+def analysis_exists(analysis_id):
+    store = _database_store()
+    if store is not None:
+        return store.analysis_exists(analysis_id)
+    try:
+        return (os.path.exists(os.path.join(analysis_dir(analysis_id), ROOT_RECORD))
+                or os.path.exists(legacy_analysis_path(analysis_id)))
+    except ValueError:
+        return False
+
+
+class AnalysisExistsError(Exception):
+    """Raised when creating an analysis whose id is already taken."""
+
+
+def create_analysis(data, useremail, attempts=5):
+    """
+    Store a new analysis under a freshly allocated id and return the id.
+
+    The analysis_log entry for the user who started it is written too. Ids are
+    claimed exclusively (directory creation / the unique constraint), so
+    concurrent submissions never share or overwrite an analysis.
+    """
+    store = _database_store()
+    for attempt in range(attempts):
+        analysis_id = new_analysis_id()
+        try:
+            if store is not None:
+                return store.create_analysis(analysis_id, data, useremail)
+            return _create_analysis_file(analysis_id, data, useremail)
+        except AnalysisExistsError:
+            logger.warning(f"Analysis id {analysis_id} already taken, allocating another")
+    raise AnalysisExistsError(f"Could not allocate an analysis id after {attempts} attempts")
+
+
+def _create_analysis_file(analysis_id, data, useremail):
+    from app.analysis_log import AnalysisLog
+    with analysis_lock(analysis_id):
+        if os.path.exists(legacy_analysis_path(analysis_id)):
+            raise AnalysisExistsError(analysis_id)
+        try:
+            # mkdir is atomic across processes, so only one creator wins the id
+            os.mkdir(analysis_dir(analysis_id))
+        except FileExistsError:
+            raise AnalysisExistsError(analysis_id)
+        save_analysis(analysis_id, data)
+    AnalysisLog.create(useremail=useremail, analysis_id=analysis_id, data=data)
+    return analysis_id
+
+
+def save_analysis(analysis_id, data):
+    """Save a complete analysis, replacing whatever was stored for it."""
+    store = _database_store()
+    if store is not None:
+        export_cache.invalidate(analysis_id)
+        return store.save_analysis(analysis_id, data)
+    with analysis_lock(analysis_id):
+        _write_records(analysis_id, _split(data), remove=_existing_records(analysis_id))
+        legacy_path = legacy_analysis_path(analysis_id)
+        if os.path.exists(legacy_path):
+            record_cache.discard(legacy_path)
+            os.unlink(legacy_path)
+    return analysis_id
+
+
+def _load_materials(analysis_id, modules=None, components=None):
+    index = _read_record(analysis_id, MATERIALS_RECORD)
+    if index is None:
+        return None
+    materials = {k: v for k, v in index.items() if k != 'modules'}
+    materials['modules'] = []
+    for number in index.get('modules', []):
+        if modules is not None and number not in modules:
+            continue
+        module = _load_module(analysis_id, number, components)
+        if module is not None:
+            materials['modules'].append(module)
+    return materials
+
+
+def _load_module(analysis_id, module_number, components=None):
+    module = _read_record(analysis_id, _module_record(module_number))
+    if module is None:
+        return None
+    module = dict(module)
+    loaded = {}
+    for component in module.get('components', []):
+        if components is not None and component not in components:
+            continue
+        value = _read_record(analysis_id, _component_record(module_number, component))
+        if value is not None:
+            loaded[component] = value
+    module['components'] = loaded
+    return module
+
+
+def _load_legacy(analysis_id):
+    """A single-file analysis with its own document, materials and module dicts."""
+    data = record_cache.load(legacy_analysis_path(analysis_id))
+    if data is None:
+        return None
+    data = dict(data)
+    if isinstance(data.get(MATERIALS_FIELD), dict):
+        materials = data[MATERIALS_FIELD] = dict(data[MATERIALS_FIELD])
+        materials['modules'] = [_legacy_module(module) for module in materials.get('modules', [])]
+    return data
+
+
+def _legacy_module(module):
+    module = dict(module)
+    if isinstance(module.get('components'), dict):
+        module['components'] = dict(module['components'])
+    return module
+
+
+def load_analysis(analysis_id, fields=None):
+    """
+    Load analysis data, or None if it does not exist.
+
+    Small top-level fields are always returned. ``fields`` limits which of
+    RECORD_FIELDS / course_materials are read; by default the whole analysis
+    is loaded.
+    """
+    store = _database_store()
+    if store is not None:
+        return store.load_analysis(analysis_id, fields)
+    return load_analysis_file(analysis_id, fields)
+
+
+def load_analysis_file(analysis_id, fields=None):
+    """load_analysis from the data/ directory, whatever the configured backend."""
+    try:
+        _check_name(analysis_id)
+    except ValueError:
+        return None
+
+    data = _read_record(analysis_id, ROOT_RECORD)
+    if data is None:
+        # Analyses saved before the record layout are read whole
+        return _load_legacy(analysis_id)
+    data = dict(data)
+
+    for field in RECORD_FIELDS:
+        if fields is None or field in fields:
+            value = _read_record(analysis_id, f"{field}.json")
+            if value is not None:
+                data[field] = value
+    if fields is None or MATERIALS_FIELD in fields:
+        materials = _load_materials(analysis_id)
+        if materials is not None:
+            data[MATERIALS_FIELD] = materials
+    return data
+
+
+def load_module(analysis_id, module_number, components=None):
+    """
+    Load one course materials module, or None if it does not exist.
+
+    ``components`` limits which material components are read (default: all).
+    """
+    store = _database_store()
+    if store is not None:
+        return store.load_module(analysis_id, module_number, components)
+    try:
+        _check_name(analysis_id)
+        if components is not None:
+            components = [c for c in components if _NAME_RE.match(c)]
+    except ValueError:
+        return None
+
+    if _read_record(analysis_id, ROOT_RECORD) is None:
+        data = _load_legacy(analysis_id) or {}
+        for module in data.get(MATERIALS_FIELD, {}).get('modules', []):
+            if module['number'] == module_number:
+                if components is not None:
+                    module['components'] = {k: v for k, v in module.get('components', {}).items()
+                                            if k in components}
+                return module
+        return None
+    return _load_module(analysis_id, module_number, components)
+
+
+def load_material(analysis_id, module_number, component):
+    """Load a single material component, or None if it does not exist."""
+    store = _database_store()
+    if store is not None:
+        return store.load_material(analysis_id, module_number, component)
+    module = load_module(analysis_id, module_number, components=[component])
+    if module is None:
+        return None
+    return module['components'].get(component)
+
+
+def update_analysis(analysis_id, mutate):
+    """
+    Apply ``mutate(data)`` to the latest saved analysis and save it, under the analysis lock.
+
+    ``mutate`` changes the dict in place (or returns a replacement). Only the
+    records it changed are rewritten. Returns the saved data, or None if the
+    analysis does not exist.
+    """
+    store = _database_store()
+    if store is not None:
+        export_cache.invalidate(analysis_id)
+        return store.update_analysis(analysis_id, mutate)
+    with analysis_lock(analysis_id):
+        _migrate_legacy(analysis_id)
+        data = load_analysis_file(analysis_id)
+        if data is None:
+            return None
+        previous = {path: _encode(value) for path, value in _split(data).items()}
+        # mutate may change record values in place, which are shared with record_cache
+        data = copy.deepcopy(data)
+        result = mutate(data)
+        if result is not None:
+            data = result
+        records = _split(data)
+        _write_records(analysis_id, records, previous=previous,
+                       remove=[path for path in previous if path not in records])
+        return data
+
+
+def update_analysis_fields(analysis_id, fields):
+    """
+    Set top-level fields on the latest saved analysis.
+
+    Only the records holding those fields are read and rewritten. Returns True,
+    or None if the analysis does not exist.
+    """
+    store = _database_store()
+    if store is not None:
+        if MATERIALS_FIELD in fields:
+            export_cache.invalidate(analysis_id)
+        return store.update_analysis_fields(analysis_id, fields)
+    with analysis_lock(analysis_id):
+        _migrate_legacy(analysis_id)
+        root = _read_record(analysis_id, ROOT_RECORD)
+        if root is None:
+            return None
+        root = dict(root)
+
+        records = {}
+        remove = []
+        root_changed = False
+        for key, value in fields.items():
+            if key in RECORD_FIELDS:
+                records[f"{key}.json"] = value
+            elif key == MATERIALS_FIELD:
+                records.update(_split_materials(value))
+                remove.extend(_existing_records(analysis_id, MATERIALS_DIR))
+            else:
+                root[key] = value
+                root_changed = True
+        if root_changed:
+            records[ROOT_RECORD] = root
+        _write_records(analysis_id, records, remove=remove)
+        return True
+
+
+def save_material(analysis_id, module_number, component, material):
+    """
+    Store one material component, rewriting only that record.
+
+    Returns False if the analysis or module does not exist.
+    """
+    store = _database_store()
+    if store is not None:
+        export_cache.invalidate(analysis_id)
+        return store.save_material(analysis_id, module_number, component, material)
+    with analysis_lock(analysis_id):
+        _migrate_legacy(analysis_id)
+        module_record = _module_record(module_number)
+        module = _read_record(analysis_id, module_record)
+        if module is None:
+            return False
+
+        records = {_component_record(module_number, component): material}
+        if component not in module.get('components', []):
+            records[module_record] = {**module, 'components': module.get('components', []) + [component]}
+        _write_records(analysis_id, records)
+        return True
+
+
+def _recompress_analysis(analysis_id, method):
+    """Rewrite every record of one analysis with ``method``; returns (bytes before, bytes after)."""
+    before = after = 0
+    with analysis_lock(analysis_id):
+        legacy_path = legacy_analysis_path(analysis_id)
+        migrated = os.path.exists(legacy_path)
+        if migrated:
+            before += os.path.getsize(legacy_path)
+            _migrate_legacy(analysis_id)
+        base = analysis_dir(analysis_id)
+        touched = set()
+        for relpath in _existing_records(analysis_id):
+            filepath = os.path.join(base, relpath)
+            with open(filepath, 'rb') as f:
+                stored = f.read()
+            if not migrated:
+                before += len(stored)
+            payload = compress(decompress(stored), method)
+            if payload != stored:
+                atomic_write(filepath, payload, sync_dir=False)
+                record_cache.discard(filepath)
+                touched.add(os.path.dirname(filepath))
+            after += len(payload)
+        for directory in touched:
+            _fsync_dir(directory)
+    return before, after
+
+
+@click.command('compress-analyses')
+@click.option('--method', type=click.Choice(COMPRESSION_METHODS), default=None,
+              help='Format to store records in (default: ANALYSIS_COMPRESSION).')
+def compress_analyses_command(method):
+    """Rewrite the analyses in data/ in one storage format, converting legacy files."""
+    method = compression_method(method or COMPRESSION)
+    before = after = 0
+    ids = file_analysis_ids()
+    for analysis_id in ids:
+        old_size, new_size = _recompress_analysis(analysis_id, method)
+        before += old_size
+        after += new_size
+    click.echo(f"Rewrote {len(ids)} analyses as {method}: "
+               f"{before / 1024 / 1024:.1f} MB -> {after / 1024 / 1024:.1f} MB")
+
+
+os.makedirs(DATA_DIR, exist_ok=True)
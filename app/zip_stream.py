@@ -0,0 +1,67 @@
+"""
+Streaming ZIP archives.
+
+``stream_zip`` writes an archive to an unseekable buffer (zipfile then uses
+data descriptors instead of seeking back to patch headers) and yields the
+compressed bytes as soon as each entry - or each chunk of a large file - is
+written. Memory use stays bounded by one chunk and the first bytes reach the
+client before the rest of the archive has been built.
+"""
+
+import os
+import zipfile
+
+CHUNK_SIZE = 64 * 1024
+
+
+class _ChunkBuffer:
+    """Write-only sink collecting zipfile output until it is drained."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        if self._chunks:
+            data = b''.join(self._chunks)
+            self._chunks.clear()
+            yield data
+
+
+def stream_zip(entries, compression=zipfile.ZIP_DEFLATED, chunk_size=CHUNK_SIZE):
+    """
+    Yield a ZIP archive of ``entries`` in chunks.
+
+    ``entries`` is an iterable of ``(arcname, source)`` pairs, where source is
+    str/bytes content or an ``os.PathLike`` file to copy in chunks. Entries
+    are consumed lazily, so they can be produced while the archive streams.
+    Later entries with an arcname already written are skipped.
+    """
+    buffer = _ChunkBuffer()
+    written = set()
+    with zipfile.ZipFile(buffer, 'w', compression) as archive:
+        for arcname, source in entries:
+            if arcname in written:
+                continue
+            written.add(arcname)
+            if isinstance(source, os.PathLike):
+                info = zipfile.ZipInfo.from_file(source, arcname)
+                info.compress_type = compression
+                with open(source, 'rb') as src, archive.open(info, 'w') as dest:
+                    while True:
+                        chunk = src.read(chunk_size)
+                        if not chunk:
+                            break
+                        dest.write(chunk)
+                        yield from buffer.drain()
+            else:
+                archive.writestr(arcname, source)
+            yield from buffer.drain()
+    # Central directory, written when the archive is closed
+    yield from buffer.drain()
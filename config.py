@@ -1,3 +1,4 @@
+import json
 import os
 from dotenv import load_dotenv
 from sqlalchemy.engine import URL
@@ -10,6 +11,16 @@ class Config:
     # Groq Configuration
     GROQ_API_KEY = os.environ.get('GROQ_API_KEY')
     GROQ_MODEL = os.environ.get('GROQ_MODEL', 'llama3-8b-8192')
+    # Run background generation jobs on an asyncio event loop instead of a thread per call
+    ASYNC_GENERATION = os.environ.get('ASYNC_GENERATION', 'true').lower() == 'true'
+    # USD per million tokens, used by /analysis/<id>/usage; override with LLM_PRICING_JSON
+    LLM_PRICING = json.loads(os.environ.get('LLM_PRICING_JSON') or 'null') or {
+        'meta-llama/llama-4-scout-17b-16e-instruct': {'input': 0.11, 'output': 0.34},
+        'default': {'input': 0.11, 'output': 0.34}
+    }
+    # The Groq client, caches, analysis storage and image services run outside the app
+    # context and read their settings (GROQ_RPM, LLM_CACHE_*, IMAGE_*, ...) straight
+    # from the environment; the defaults live next to the code that uses them.
     AZURE_CLIENT_ID = os.environ.get('AZURE_CLIENT_ID')
     AZURE_CLIENT_SECRET = os.environ.get('AZURE_CLIENT_SECRET')
     AZURE_TENANT_ID = os.environ.get('AZURE_TENANT_ID')
@@ -24,4 +35,15 @@ class Config:
         port=5432,
         database="ASID"
     )
-    SQLALCHEMY_TRACK_MODIFICATIONS = False
\ No newline at end of file
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    # Background generation jobs
+    JOB_QUEUE_ENABLED = os.environ.get('JOB_QUEUE_ENABLED', 'true').lower() == 'true'
+    JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))
+    JOB_POLL_INTERVAL = float(os.environ.get('JOB_POLL_INTERVAL', 2))
+    JOB_STALE_AFTER = int(os.environ.get('JOB_STALE_AFTER', 120))
+    JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', 3))
+    # Server-Sent Events progress stream. Each connection holds a sync worker, so it
+    # ends after the max duration and the browser reconnects from Last-Event-ID.
+    JOB_EVENTS_POLL_INTERVAL = float(os.environ.get('JOB_EVENTS_POLL_INTERVAL', 1))
+    JOB_EVENTS_MAX_SECONDS = int(os.environ.get('JOB_EVENTS_MAX_SECONDS', 25))
\ No newline at end of file
@@ -1,4 +1,4 @@
-from models.groq_client import GroqClient
+from models.groq_client import get_groq_client, llm_context
 
 def generate_audience_analysis(course_topic, audience_type, terminal_objectives, job_titles="", 
                               industry_context="", audience_challenges="", prior_knowledge=""):
@@ -69,8 +69,9 @@ IMPORTANT RULES:
 """
 
     # Generate the analysis
-    client = GroqClient()
-    response = client.generate(prompt, system_prompt)
+    client = get_groq_client()
+    with llm_context(component='audience_analysis'):
+        response = client.generate(prompt, system_prompt)
 
     # Clean up any potential issues with the response
     response = response.replace('# ', '## ')  # Ensure proper heading level
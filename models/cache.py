@@ -0,0 +1,172 @@
+# File: models/cache.py
+
+"""
+Persistent key/value cache backed by SQLite.
+
+Entries expire after a TTL and the table is kept under a byte budget by evicting
+the least recently used entries. SQLite in WAL mode lets every gunicorn worker
+share the same cache file; each thread gets its own connection.
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'cache')
+
+
+class SQLiteCache:
+    """TTL + size-bounded LRU cache stored in a SQLite table."""
+
+    def __init__(self, path: str, table: str = "cache", ttl: Optional[float] = None,
+                 max_bytes: Optional[int] = None):
+        """
+        Args:
+            path: SQLite database file (created if missing)
+            table: Table name, so several caches can share one file
+            ttl: Seconds an entry stays valid (None = never expires)
+            max_bytes: Total value size to keep before LRU eviction (None = unbounded)
+        """
+        if not table.isidentifier():
+            raise ValueError(f"Invalid cache table name: {table}")
+        self.path = path
+        self.table = table
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn().execute(
+            f"CREATE TABLE IF NOT EXISTS {self.table} ("
+            " key TEXT PRIMARY KEY,"
+            " value BLOB NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " expires_at REAL,"
+            " accessed_at REAL NOT NULL)"
+        )
+        self._conn().execute(
+            f"CREATE INDEX IF NOT EXISTS {self.table}_accessed ON {self.table} (accessed_at)"
+        )
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _count(self, hit: bool) -> None:
+        with self._stats_lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def get(self, key: str) -> Optional[bytes]:
+        """Return the cached value, or None if missing or expired."""
+        now = time.time()
+        try:
+            conn = self._conn()
+            row = conn.execute(
+                f"SELECT value, expires_at FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self._count(False)
+                return None
+            value, expires_at = row
+            if expires_at is not None and expires_at < now:
+                conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+                self._count(False)
+                return None
+            conn.execute(f"UPDATE {self.table} SET accessed_at = ? WHERE key = ?", (now, key))
+        except sqlite3.Error as e:
+            logger.warning(f"Cache read failed ({self.table}): {e}")
+            self._count(False)
+            return None
+
+        self._count(True)
+        return bytes(value)
+
+    def set(self, key: str, value: bytes, ttl: Optional[float] = None) -> None:
+        """Store a value, then evict expired and least recently used entries if over budget."""
+        now = time.time()
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = now + ttl if ttl is not None else None
+        try:
+            conn = self._conn()
+            conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, size, expires_at, accessed_at)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (key, sqlite3.Binary(value), len(value), expires_at, now)
+            )
+            self._evict(conn, now)
+        except sqlite3.Error as e:
+            logger.warning(f"Cache write failed ({self.table}): {e}")
+
+    def delete(self, key: str) -> None:
+        try:
+            self._conn().execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+        except sqlite3.Error as e:
+            logger.warning(f"Cache delete failed ({self.table}): {e}")
+
+    def items(self) -> Iterator[Tuple[str, bytes]]:
+        """Every (key, value) pair, including expired ones not yet evicted."""
+        rows = self._conn().execute(f"SELECT key, value FROM {self.table}").fetchall()
+        for key, value in rows:
+            yield key, bytes(value)
+
+    def clear(self) -> None:
+        self._conn().execute(f"DELETE FROM {self.table}")
+
+    def _evict(self, conn: sqlite3.Connection, now: float) -> None:
+        conn.execute(f"DELETE FROM {self.table} WHERE expires_at IS NOT NULL AND expires_at < ?", (now,))
+        if self.max_bytes is None:
+            return
+
+        total = conn.execute(f"SELECT COALESCE(SUM(size), 0) FROM {self.table}").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        # Walk entries oldest-access first until enough bytes are freed
+        excess = total - self.max_bytes
+        victims = []
+        for key, size in conn.execute(f"SELECT key, size FROM {self.table} ORDER BY accessed_at"):
+            victims.append((key,))
+            excess -= size
+            if excess <= 0:
+                break
+        conn.executemany(f"DELETE FROM {self.table} WHERE key = ?", victims)
+        logger.debug(f"Evicted {len(victims)} entries from cache table {self.table}")
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters for this process plus current table size."""
+        with self._stats_lock:
+            hits, misses = self.hits, self.misses
+        try:
+            entries, size = self._conn().execute(
+                f"SELECT COUNT(*), COALESCE(SUM(size), 0) FROM {self.table}"
+            ).fetchone()
+        except sqlite3.Error:
+            entries, size = None, None
+        lookups = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / lookups, 3) if lookups else 0.0,
+            "entries": entries,
+            "bytes": size,
+            "max_bytes": self.max_bytes,
+            "ttl": self.ttl
+        }
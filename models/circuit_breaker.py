@@ -0,0 +1,191 @@
+# File: models/circuit_breaker.py
+
+"""
+Circuit breakers for external APIs.
+
+Each breaker keeps a rolling window of recent calls. When enough calls in the
+window failed or were slow, the breaker opens and callers skip the API at once
+instead of waiting out its timeout. After a cool-down it lets a probe call
+through (half-open): success closes it again, failure re-opens it.
+
+Breakers are shared per process by name (``get_breaker("unsplash")``) and
+configured from the environment:
+
+    CIRCUIT_BREAKER_WINDOW       seconds of history considered (default 60)
+    CIRCUIT_BREAKER_MIN_CALLS    calls in the window before it can trip (default 5)
+    CIRCUIT_BREAKER_ERROR_RATE   failed-or-slow fraction that trips it (default 0.5)
+    CIRCUIT_BREAKER_SLOW_CALL    seconds after which a call counts as slow (default 5)
+    CIRCUIT_BREAKER_OPEN_SECONDS cool-down before probing again (default 30)
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an API whose circuit is open."""
+
+
+class CircuitBreaker:
+    """Rolling-window circuit breaker for one external dependency."""
+
+    def __init__(self, name: str, window: float = 60, min_calls: int = 5, error_rate: float = 0.5,
+                 slow_call: float = 5, open_seconds: float = 30, half_open_probes: int = 1):
+        """
+        Args:
+            name: Dependency name, used in logs and status
+            window: Seconds of call history used for the error rate
+            min_calls: Calls needed in the window before the breaker can open
+            error_rate: Fraction of failed or slow calls that opens the breaker
+            slow_call: Calls taking longer than this many seconds count as failed
+            open_seconds: How long the breaker stays open before probing
+            half_open_probes: Concurrent probe calls allowed while half-open
+        """
+        self.name = name
+        self.window = window
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.slow_call = slow_call
+        self.open_seconds = open_seconds
+        self.half_open_probes = half_open_probes
+        self.state = CLOSED
+        self.opened_at: Optional[float] = None
+        self.rejected = 0
+        self.times_opened = 0
+        self._calls = deque()  # (finished_at, failed, duration)
+        self._probes = 0
+        self._lock = threading.Lock()
+
+    def _refresh(self, now: float) -> None:
+        while self._calls and self._calls[0][0] < now - self.window:
+            self._calls.popleft()
+        if self.state == OPEN and now - self.opened_at >= self.open_seconds:
+            self.state = HALF_OPEN
+            self._probes = 0
+            logger.info(f"Circuit for {self.name} half-open, probing")
+
+    def available(self) -> bool:
+        """Whether a call might be let through, without claiming a half-open probe."""
+        with self._lock:
+            self._refresh(time.monotonic())
+            return self.state == CLOSED or (self.state == HALF_OPEN and self._probes < self.half_open_probes)
+
+    def allow(self) -> bool:
+        """Claim permission for one call; every allowed call must be followed by record()."""
+        with self._lock:
+            self._refresh(time.monotonic())
+            if self.state == CLOSED:
+                return True
+            if self.state == HALF_OPEN and self._probes < self.half_open_probes:
+                self._probes += 1
+                return True
+            self.rejected += 1
+            return False
+
+    def record(self, failed: bool, duration: float) -> None:
+        """Record the outcome of an allowed call."""
+        failed = failed or duration > self.slow_call
+        now = time.monotonic()
+        with self._lock:
+            self._refresh(now)
+            if self.state == HALF_OPEN:
+                self._probes = max(0, self._probes - 1)
+                if failed:
+                    self._open(now)
+                else:
+                    self.state = CLOSED
+                    self._calls.clear()
+                    logger.info(f"Circuit for {self.name} closed")
+                return
+            self._calls.append((now, failed, duration))
+            if self.state == CLOSED and len(self._calls) >= self.min_calls:
+                failures = sum(1 for _, bad, _ in self._calls if bad)
+                if failures / len(self._calls) >= self.error_rate:
+                    self._open(now)
+
+    def _open(self, now: float) -> None:
+        self.state = OPEN
+        self.opened_at = now
+        self.times_opened += 1
+        logger.warning(f"Circuit for {self.name} opened for {self.open_seconds:.0f}s")
+
+    def call(self, fn: Callable, *args, is_failure: Optional[Callable[[Any], bool]] = None, **kwargs) -> Any:
+        """
+        Run ``fn`` through the breaker.
+
+        Raises CircuitOpenError without calling ``fn`` while the circuit is
+        open. Exceptions count as failures, as do results for which
+        ``is_failure(result)`` is true.
+        """
+        if not self.allow():
+            raise CircuitOpenError(f"{self.name} is unavailable (circuit open)")
+        started = time.monotonic()
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException:
+            self.record(True, time.monotonic() - started)
+            raise
+        self.record(bool(is_failure and is_failure(result)), time.monotonic() - started)
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            now = time.monotonic()
+            self._refresh(now)
+            calls = len(self._calls)
+            failures = sum(1 for _, bad, _ in self._calls if bad)
+            durations = sorted(duration for _, _, duration in self._calls)
+            return {
+                "state": self.state,
+                "calls": calls,
+                "failures": failures,
+                "error_rate": round(failures / calls, 3) if calls else 0.0,
+                "p50_seconds": round(durations[len(durations) // 2], 3) if durations else None,
+                "max_seconds": round(durations[-1], 3) if durations else None,
+                "rejected": self.rejected,
+                "times_opened": self.times_opened,
+                "retry_in_seconds": (round(max(0.0, self.opened_at + self.open_seconds - now), 1)
+                                     if self.state == OPEN else None)
+            }
+
+
+def http_failure(response) -> bool:
+    """Responses meaning the API cannot serve us right now (server errors, rate limits, auth)."""
+    return response.status_code >= 500 or response.status_code in (401, 403, 429)
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(name: str) -> CircuitBreaker:
+    """Process-wide breaker for a dependency, created from the environment on first use."""
+    with _breakers_lock:
+        breaker = _breakers.get(name)
+        if breaker is None:
+            breaker = _breakers[name] = CircuitBreaker(
+                name,
+                window=float(os.environ.get('CIRCUIT_BREAKER_WINDOW', 60)),
+                min_calls=int(os.environ.get('CIRCUIT_BREAKER_MIN_CALLS', 5)),
+                error_rate=float(os.environ.get('CIRCUIT_BREAKER_ERROR_RATE', 0.5)),
+                slow_call=float(os.environ.get('CIRCUIT_BREAKER_SLOW_CALL', 5)),
+                open_seconds=float(os.environ.get('CIRCUIT_BREAKER_OPEN_SECONDS', 30)),
+            )
+        return breaker
+
+
+def breaker_status() -> Dict[str, Dict[str, Any]]:
+    """Stats of every breaker created in this process."""
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    return {breaker.name: breaker.stats() for breaker in breakers}
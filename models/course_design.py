@@ -1,3 +1,4 @@
+import asyncio
 import os
 import sys
 import json
@@ -11,7 +12,7 @@ logger = logging.getLogger(__name__)
 
 # Import Groq client
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from models.groq_client import GroqClient
+from models.groq_client import get_groq_client, get_async_groq_client, async_groq_session, llm_context
 
 def extract_task_structure(task_analysis):
     """
@@ -221,6 +222,136 @@ def extract_task_structure(task_analysis):
     
     return modules
 
+def build_course_structure_prompt(course_topic, audience_type, terminal_objectives, audience_analysis, task_analysis, module_count=None):
+    """Build the course structure prompt from the modules found in the task analysis."""
+    # Extract task structure from task analysis
+    modules = extract_task_structure(task_analysis)
+
+    # If no modules were found, log an error
+    if not modules:
+        raise Exception("No modules could be extracted from the task analysis")
+
+    # If module_count is specified and different from extracted count, adjust
+    if module_count and module_count != len(modules):
+        if module_count < len(modules):
+            # Combine modules
+            logger.info(f"Combining {len(modules)} modules into {module_count} modules")
+            new_modules = []
+            modules_per_group = len(modules) // module_count
+            remaining = len(modules) % module_count
+
+            start_idx = 0
+            for i in range(module_count):
+                # Calculate how many modules to include in this group
+                count = modules_per_group + (1 if i < remaining else 0)
+                end_idx = start_idx + count
+
+                # Combine module titles
+                module_titles = [modules[j]["title"] for j in range(start_idx, end_idx)]
+                combined_title = " & ".join(module_titles)
+
+                # Combine subtasks
+                combined_subtasks = []
+                for j in range(start_idx, end_idx):
+                    for subtask in modules[j]["subtasks"]:
+                        combined_subtasks.append({
+                            "id": f"{modules[j]['id']}{subtask['id']}",
+                            "title": f"{modules[j]['title']}: {subtask['title']}",
+                            "content": subtask['content']
+                        })
+
+                new_modules.append({
+                    "id": f"Group {i+1}",
+                    "title": combined_title,
+                    "subtasks": combined_subtasks
+                })
+
+                start_idx = end_idx
+
+            modules = new_modules
+
+        elif module_count > len(modules):
+            # Add additional modules
+            logger.info(f"Adding {module_count - len(modules)} additional modules")
+            additional_modules = [
+                {
+                    "id": "Extra1",
+                    "title": "Review and Practice",
+                    "subtasks": [{"id": "1", "title": "Review Exercises", "content": "Comprehensive review and practice."}]
+                },
+                {
+                    "id": "Extra2",
+                    "title": "Advanced Applications",
+                    "subtasks": [{"id": "1", "title": "Advanced Projects", "content": "Complex projects and applications."}]
+                },
+                {
+                    "id": "Extra3",
+                    "title": "Specialized Topics",
+                    "subtasks": [{"id": "1", "title": "Special Interest Areas", "content": "Deeper dive into specialized areas."}]
+                },
+                {
+                    "id": "Extra4",
+                    "title": "Future Directions",
+                    "subtasks": [{"id": "1", "title": "Emerging Trends", "content": "Future developments and trends."}]
+                }
+            ]
+
+            modules.extend(additional_modules[:module_count - len(modules)])
+
+    # Prepare the module information for the prompt
+    modules_text = ""
+    for i, module in enumerate(modules):
+        modules_text += f"MODULE {i+1}: {module['title']}\n"
+        modules_text += "Subtasks:\n"
+
+        for subtask in module["subtasks"]:
+            modules_text += f"- {subtask['title']}\n"
+
+        modules_text += "\n"
+
+    # Create a bullet list of module titles for the critical requirements
+    module_list = "\n".join([f"- Module {i+1}: {module['title']}" for i, module in enumerate(modules)])
+
+    # Prepare the prompt for generating course structure
+    prompt = f"""
+    As an instructional design expert, create a detailed course structure for:
+
+    COURSE TOPIC: {course_topic}
+    AUDIENCE LEVEL: {audience_type}
+
+    TERMINAL OBJECTIVES:
+    {terminal_objectives}
+
+    I have analyzed the task analysis and identified these exact modules and subtasks:
+
+    {modules_text}
+
+    Please create a detailed course structure with these EXACT SAME MODULES that includes:
+
+    1. Course title (be specific and creative)
+    2. Course description (1-2 paragraphs)
+    3. Learning objectives (5-7 objectives using Bloom's taxonomy, organized by cognitive levels)
+    4. Module structure (using EXACTLY the {len(modules)} modules I identified):
+       For each module, include:
+       - Module title (use EXACTLY the module titles I provided)
+       - Module learning objectives (2-3 per module, using Bloom's taxonomy)
+       - Topics covered (include ALL the subtasks I listed for each module)
+       - Key activities (practical exercises based on the subtasks)
+
+    Format the output in markdown with proper headings and bullet points.
+
+    CRITICAL REQUIREMENTS:
+    1. You MUST use EXACTLY the modules I provided:
+    {module_list}
+    2. Maintain the EXACT SAME ORDER of modules as I listed them
+    3. Include ALL the subtasks I listed under each module
+    4. Do not add any modules that I didn't list
+    5. Do not remove any modules that I listed
+    6. Do not reorder or rename the modules
+    """
+    
+    return prompt
+
 def generate_course_structure(course_topic, audience_type, terminal_objectives, audience_analysis, task_analysis, module_count=None):
     """
     Generate a course structure based on task analysis sections.
@@ -237,136 +368,12 @@ def generate_course_structure(course_topic, audience_type, terminal_objectives,
         str: A markdown-formatted course structure
     """
     try:
-        client = GroqClient()
-        
-        # Extract task structure from task analysis
-        modules = extract_task_structure(task_analysis)
-        
-        # If no modules were found, log an error
-        if not modules:
-            raise Exception("No modules could be extracted from the task analysis")
-        
-        # If module_count is specified and different from extracted count, adjust
-        if module_count and module_count != len(modules):
-            if module_count < len(modules):
-                # Combine modules
-                logger.info(f"Combining {len(modules)} modules into {module_count} modules")
-                new_modules = []
-                modules_per_group = len(modules) // module_count
-                remaining = len(modules) % module_count
-                
-                start_idx = 0
-                for i in range(module_count):
-                    # Calculate how many modules to include in this group
-                    count = modules_per_group + (1 if i < remaining else 0)
-                    end_idx = start_idx + count
-                    
-                    # Combine module titles
-                    module_titles = [modules[j]["title"] for j in range(start_idx, end_idx)]
-                    combined_title = " & ".join(module_titles)
-                    
-                    # Combine subtasks
-                    combined_subtasks = []
-                    for j in range(start_idx, end_idx):
-                        for subtask in modules[j]["subtasks"]:
-                            combined_subtasks.append({
-                                "id": f"{modules[j]['id']}{subtask['id']}",
-                                "title": f"{modules[j]['title']}: {subtask['title']}",
-                                "content": subtask['content']
-                            })
-                    
-                    new_modules.append({
-                        "id": f"Group {i+1}",
-                        "title": combined_title,
-                        "subtasks": combined_subtasks
-                    })
-                    
-                    start_idx = end_idx
-                
-                modules = new_modules
-            
-            elif module_count > len(modules):
-                # Add additional modules
-                logger.info(f"Adding {module_count - len(modules)} additional modules")
-                additional_modules = [
-                    {
-                        "id": "Extra1",
-                        "title": "Review and Practice",
-                        "subtasks": [{"id": "1", "title": "Review Exercises", "content": "Comprehensive review and practice."}]
-                    },
-                    {
-                        "id": "Extra2",
-                        "title": "Advanced Applications",
-                        "subtasks": [{"id": "1", "title": "Advanced Projects", "content": "Complex projects and applications."}]
-                    },
-                    {
-                        "id": "Extra3",
-                        "title": "Specialized Topics",
-                        "subtasks": [{"id": "1", "title": "Special Interest Areas", "content": "Deeper dive into specialized areas."}]
-                    },
-                    {
-                        "id": "Extra4",
-                        "title": "Future Directions",
-                        "subtasks": [{"id": "1", "title": "Emerging Trends", "content": "Future developments and trends."}]
-                    }
-                ]
-                
-                modules.extend(additional_modules[:module_count - len(modules)])
-        
-        # Prepare the module information for the prompt
-        modules_text = ""
-        for i, module in enumerate(modules):
-            modules_text += f"MODULE {i+1}: {module['title']}\n"
-            modules_text += "Subtasks:\n"
-            
-            for subtask in module["subtasks"]:
-                modules_text += f"- {subtask['title']}\n"
-            
-            modules_text += "\n"
-        
-        # Create a bullet list of module titles for the critical requirements
-        module_list = "\n".join([f"- Module {i+1}: {module['title']}" for i, module in enumerate(modules)])
-        
-        # Prepare the prompt for generating course structure
-        prompt = f"""
-        As an instructional design expert, create a detailed course structure for:
-        
-        COURSE TOPIC: {course_topic}
-        AUDIENCE LEVEL: {audience_type}
-        
-        TERMINAL OBJECTIVES:
-        {terminal_objectives}
-        
-        I have analyzed the task analysis and identified these exact modules and subtasks:
-        
-        {modules_text}
-        
-        Please create a detailed course structure with these EXACT SAME MODULES that includes:
-        
-        1. Course title (be specific and creative)
-        2. Course description (1-2 paragraphs)
-        3. Learning objectives (5-7 objectives using Bloom's taxonomy, organized by cognitive levels)
-        4. Module structure (using EXACTLY the {len(modules)} modules I identified):
-           For each module, include:
-           - Module title (use EXACTLY the module titles I provided)
-           - Module learning objectives (2-3 per module, using Bloom's taxonomy)
-           - Topics covered (include ALL the subtasks I listed for each module)
-           - Key activities (practical exercises based on the subtasks)
-           
-        Format the output in markdown with proper headings and bullet points.
-        
-        CRITICAL REQUIREMENTS:
-        1. You MUST use EXACTLY the modules I provided:
-        {module_list}
-        2. Maintain the EXACT SAME ORDER of modules as I listed them
-        3. Include ALL the subtasks I listed under each module
-        4. Do not add any modules that I didn't list
-        5. Do not remove any modules that I listed
-        6. Do not reorder or rename the modules
-        """
+        client = get_groq_client()
+        prompt = build_course_structure_prompt(course_topic, audience_type, terminal_objectives, audience_analysis, task_analysis, module_count)
         
         # Generate content
-        response = client.generate(prompt)
+        with llm_context(component='course_structure'):
+            response = client.generate(prompt)
         logger.info("Course structure generated successfully")
         return response
         
@@ -374,6 +381,49 @@ def generate_course_structure(course_topic, audience_type, terminal_objectives,
         logger.error(f"Error generating course structure: {str(e)}")
         raise Exception(f"Failed to generate course structure: {str(e)}")
 
+def build_instructional_strategies_prompt(course_topic, audience_type, course_structure):
+    """Build the instructional strategies prompt for the modules in a course structure."""
+    # Extract module titles from course structure for reference
+    module_titles = re.findall(r'#+\s+Module \d+:[\s]+([^\n]+)', course_structure)
+    if not module_titles:
+        # Try alternative pattern
+        module_titles = re.findall(r'Module \d+:[\s]+([^\n]+)', course_structure)
+
+    # Create module list text
+    if module_titles:
+        modules_list = "\n".join([f"- Module {i+1}: {title}" for i, title in enumerate(module_titles)])
+    else:
+        modules_list = "(Please refer to the modules in the course structure)"
+
+    # Prepare prompt for generating instructional strategies
+    prompt = f"""
+    As an instructional design expert, develop effective instructional strategies for:
+
+    COURSE TOPIC: {course_topic}
+    AUDIENCE LEVEL: {audience_type}
+
+    For these specific modules:
+    {modules_list}
+
+    Please create a detailed instructional strategies document that includes:
+
+    1. Overall instructional approach (based on audience level and subject matter)
+    2. Engagement strategies (how to maintain learner interest and motivation)
+    3. Specific strategies for EACH module:
+       - Recommended instructional methods for content delivery
+       - Interactive elements (discussions, activities, case studies)
+       - Technology tools and resources to support learning
+       - Strategies for addressing different learning styles
+    4. Implementation recommendations
+
+    Format the output in markdown with proper headings and bullet points.
+
+    IMPORTANT: Create specific strategies for EACH module listed above, maintaining the same module titles and order.
+    Do not combine, rename, or reorder the modules.
+    """
+    
+    return prompt
+
 def generate_instructional_strategies(course_topic, audience_type, course_structure):
     """
     Generate instructional strategies based on course structure.
@@ -387,49 +437,12 @@ def generate_instructional_strategies(course_topic, audience_type, course_struct
         str: A markdown-formatted instructional strategies document
     """
     try:
-        client = GroqClient()
-        
-        # Extract module titles from course structure for reference
-        module_titles = re.findall(r'#+\s+Module \d+:[\s]+([^\n]+)', course_structure)
-        if not module_titles:
-            # Try alternative pattern
-            module_titles = re.findall(r'Module \d+:[\s]+([^\n]+)', course_structure)
-        
-        # Create module list text
-        if module_titles:
-            modules_list = "\n".join([f"- Module {i+1}: {title}" for i, title in enumerate(module_titles)])
-        else:
-            modules_list = "(Please refer to the modules in the course structure)"
-        
-        # Prepare prompt for generating instructional strategies
-        prompt = f"""
-        As an instructional design expert, develop effective instructional strategies for:
-        
-        COURSE TOPIC: {course_topic}
-        AUDIENCE LEVEL: {audience_type}
-        
-        For these specific modules:
-        {modules_list}
-        
-        Please create a detailed instructional strategies document that includes:
-        
-        1. Overall instructional approach (based on audience level and subject matter)
-        2. Engagement strategies (how to maintain learner interest and motivation)
-        3. Specific strategies for EACH module:
-           - Recommended instructional methods for content delivery
-           - Interactive elements (discussions, activities, case studies)
-           - Technology tools and resources to support learning
-           - Strategies for addressing different learning styles
-        4. Implementation recommendations
-        
-        Format the output in markdown with proper headings and bullet points.
-        
-        IMPORTANT: Create specific strategies for EACH module listed above, maintaining the same module titles and order.
-        Do not combine, rename, or reorder the modules.
-        """
+        client = get_groq_client()
+        prompt = build_instructional_strategies_prompt(course_topic, audience_type, course_structure)
         
         # Generate content
-        response = client.generate(prompt)
+        with llm_context(component='instructional_strategies'):
+            response = client.generate(prompt)
         logger.info("Instructional strategies generated successfully")
         return response
         
@@ -437,6 +450,50 @@ def generate_instructional_strategies(course_topic, audience_type, course_struct
         logger.error(f"Error generating instructional strategies: {str(e)}")
         raise Exception(f"Failed to generate instructional strategies: {str(e)}")
 
+def build_assessment_plan_prompt(course_topic, audience_type, course_structure):
+    """Build the assessment plan prompt for the modules in a course structure."""
+    # Extract module titles from course structure for reference
+    module_titles = re.findall(r'#+\s+Module \d+:[\s]+([^\n]+)', course_structure)
+    if not module_titles:
+        # Try alternative pattern
+        module_titles = re.findall(r'Module \d+:[\s]+([^\n]+)', course_structure)
+
+    # Create module list text
+    if module_titles:
+        modules_list = "\n".join([f"- Module {i+1}: {title}" for i, title in enumerate(module_titles)])
+    else:
+        modules_list = "(Please refer to the modules in the course structure)"
+
+    # Prepare prompt for generating assessment plan
+    prompt = f"""
+    As an instructional design expert, create a comprehensive assessment plan for:
+
+    COURSE TOPIC: {course_topic}
+    AUDIENCE LEVEL: {audience_type}
+
+    For these specific modules:
+    {modules_list}
+
+    Please create a detailed assessment plan that includes:
+
+    1. Assessment philosophy and approach (aligned with audience level)
+    2. Pre-assessment strategies (to gauge prior knowledge)
+    3. Formative assessment methods for EACH module:
+       - Specific activities or questions to check understanding
+       - Feedback mechanisms
+    4. Summative assessment methods:
+       - Final projects or assessments
+       - Evaluation criteria and rubrics
+    5. Self-assessment opportunities for learners
+
+    Format the output in markdown with proper headings and bullet points.
+
+    IMPORTANT: Create specific formative assessments for EACH module listed above, maintaining the same module titles and order.
+    Do not combine, rename, or reorder the modules.
+    """
+    
+    return prompt
+
 def generate_assessment_plan(course_topic, audience_type, course_structure, instructional_strategies=None):
     """
     Generate an assessment plan based on course structure.
@@ -451,50 +508,12 @@ def generate_assessment_plan(course_topic, audience_type, course_structure, inst
         str: A markdown-formatted assessment plan
     """
     try:
-        client = GroqClient()
-        
-        # Extract module titles from course structure for reference
-        module_titles = re.findall(r'#+\s+Module \d+:[\s]+([^\n]+)', course_structure)
-        if not module_titles:
-            # Try alternative pattern
-            module_titles = re.findall(r'Module \d+:[\s]+([^\n]+)', course_structure)
-        
-        # Create module list text
-        if module_titles:
-            modules_list = "\n".join([f"- Module {i+1}: {title}" for i, title in enumerate(module_titles)])
-        else:
-            modules_list = "(Please refer to the modules in the course structure)"
-        
-        # Prepare prompt for generating assessment plan
-        prompt = f"""
-        As an instructional design expert, create a comprehensive assessment plan for:
-        
-        COURSE TOPIC: {course_topic}
-        AUDIENCE LEVEL: {audience_type}
-        
-        For these specific modules:
-        {modules_list}
-        
-        Please create a detailed assessment plan that includes:
-        
-        1. Assessment philosophy and approach (aligned with audience level)
-        2. Pre-assessment strategies (to gauge prior knowledge)
-        3. Formative assessment methods for EACH module:
-           - Specific activities or questions to check understanding
-           - Feedback mechanisms
-        4. Summative assessment methods:
-           - Final projects or assessments
-           - Evaluation criteria and rubrics
-        5. Self-assessment opportunities for learners
-        
-        Format the output in markdown with proper headings and bullet points.
-        
-        IMPORTANT: Create specific formative assessments for EACH module listed above, maintaining the same module titles and order.
-        Do not combine, rename, or reorder the modules.
-        """
+        client = get_groq_client()
+        prompt = build_assessment_plan_prompt(course_topic, audience_type, course_structure)
         
         # Generate content
-        response = client.generate(prompt)
+        with llm_context(component='assessment_plan'):
+            response = client.generate(prompt)
         logger.info("Assessment plan generated successfully")
         return response
         
@@ -564,4 +583,89 @@ def generate_comprehensive_course_design(analysis_data, components=None, module_
         
     except Exception as e:
         logger.error(f"Error generating comprehensive course design: {str(e)}")
-        raise Exception(f"Failed to generate comprehensive course design: {str(e)}")
\ No newline at end of file
+        raise Exception(f"Failed to generate comprehensive course design: {str(e)}")
+
+
+async def generate_comprehensive_course_design_async(analysis_data, components=None, module_count=None, max_concurrency=None):
+    """
+    asyncio version of generate_comprehensive_course_design.
+    
+    The course structure is generated first; instructional strategies and the
+    assessment plan only depend on it, so they are then requested together.
+    A semaphore caps in-flight requests at max_concurrency (default: COURSE_DESIGN_MAX_CONCURRENCY).
+    
+    Args:
+        analysis_data (dict): The complete analysis data including audience and task analyses
+        components (list, optional): List of components to generate: 'structure', 'strategies', 'assessment'
+        module_count (int, optional): Number of modules to generate
+        max_concurrency (int, optional): Maximum concurrent LLM requests
+        
+    Returns:
+        dict: Updated analysis data with course design components
+    """
+    if max_concurrency is None:
+        max_concurrency = int(os.environ.get('COURSE_DESIGN_MAX_CONCURRENCY', 2))
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+    client = get_async_groq_client()
+    
+    async def generate(key, label, build_prompt):
+        try:
+            prompt = build_prompt()
+            async with semaphore:
+                with llm_context(component=key):
+                    response = await client.generate(prompt)
+            logger.info(f"{label.capitalize()} generated successfully")
+            return key, response
+        except Exception as e:
+            logger.error(f"Error generating {label}: {str(e)}")
+            raise Exception(f"Failed to generate {label}: {str(e)}")
+    
+    # One connection pool for the whole run, closed before the caller's loop ends
+    async with async_groq_session():
+        try:
+            # If components is not specified, generate all
+            if not components:
+                components = ['structure', 'strategies', 'assessment']
+        
+            # Check which components already exist in analysis_data
+            existing = {
+                'structure': 'course_structure' in analysis_data,
+                'strategies': 'instructional_strategies' in analysis_data,
+                'assessment': 'assessment_plan' in analysis_data
+            }
+        
+            # Step 1: Generate course structure (if requested)
+            if 'structure' in components and not existing['structure']:
+                _, analysis_data['course_structure'] = await generate(
+                    'course_structure', 'course structure', lambda: build_course_structure_prompt(
+                        analysis_data['course_topic'],
+                        analysis_data['audience_type'],
+                        analysis_data.get('terminal_objectives', 'No terminal objectives provided.'),
+                        analysis_data['audience_analysis'],
+                        analysis_data.get('task_analysis', 'No task analysis provided.'),
+                        module_count
+                    ))
+        
+            # Step 2: Strategies and assessment plan both build on the course structure only
+            pending = []
+            if 'course_structure' in analysis_data:
+                if 'strategies' in components and not existing['strategies']:
+                    pending.append(generate(
+                        'instructional_strategies', 'instructional strategies', lambda: build_instructional_strategies_prompt(
+                            analysis_data['course_topic'], analysis_data['audience_type'], analysis_data['course_structure'])))
+                if 'assessment' in components and not existing['assessment']:
+                    pending.append(generate(
+                        'assessment_plan', 'assessment plan', lambda: build_assessment_plan_prompt(
+                            analysis_data['course_topic'], analysis_data['audience_type'], analysis_data['course_structure'])))
+        
+            for key, response in await asyncio.gather(*pending):
+                analysis_data[key] = response
+        
+            # Update the generation date
+            analysis_data['course_design_generated_date'] = datetime.now().strftime("%B %d, %Y at %H:%M")
+        
+            return analysis_data
+        
+        except Exception as e:
+            logger.error(f"Error generating comprehensive course design: {str(e)}")
+            raise Exception(f"Failed to generate comprehensive course design: {str(e)}")
@@ -6,10 +6,16 @@ detailed explanations, multiple examples, REAL assessment questions, and integra
 Maintains all existing functionality while adding professional image integration.
 """
 
+import asyncio
+import contextvars
+import functools
 import json
 import re
 import os
-from typing import Dict, List, Any, Optional, Tuple
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, Dict, Generator, List, Any, Optional, Tuple
 from datetime import datetime
 import logging
 
@@ -18,8 +24,65 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Import Groq client and Image Service
-from models.groq_client import GroqClient
-from models.image_service import EducationalImageService, ImageTracker, ImageData                                                                                 
+from models import json_codec
+from models.groq_client import get_groq_client, get_async_groq_client, async_groq_session, llm_context, track_usage
+from models.image_service import EducationalImageService, ImageTracker, ImageData, image_url_key                                                                                 
+
+
+# A generation workflow is a generator that yields requests and receives their results:
+# a prompt (str) -> its completion, a list of prompts -> their completions (may run
+# concurrently), or a zero-argument callable for blocking non-LLM work -> its return value.
+LLMSteps = Generator[Any, Any, Dict[str, Any]]
+
+def llm_steps(method: Callable[..., LLMSteps]) -> Callable[..., Dict[str, Any]]:
+    """
+    Turn a generator method describing an LLM workflow into a regular method.
+    
+    Calling the decorated method runs the workflow synchronously on the shared
+    GroqClient. The undecorated generator is kept as ``.steps`` so
+    generate_all_materials_async can drive the same prompts on an event loop.
+    """
+    @functools.wraps(method)
+    def run(self, *args, **kwargs):
+        return _run_steps(method(self, *args, **kwargs))
+    run.steps = method
+    return run
+
+def _run_steps(steps: LLMSteps) -> Dict[str, Any]:
+    client = get_groq_client()
+    result = None
+    try:
+        while True:
+            request = steps.send(result)
+            if isinstance(request, str):
+                result = client.generate(request)
+            elif isinstance(request, list):
+                result = [client.generate(prompt) for prompt in request]
+            else:
+                result = request()
+    except StopIteration as done:
+        return done.value
+
+async def _run_steps_async(steps: LLMSteps, semaphore: asyncio.Semaphore) -> Dict[str, Any]:
+    client = get_async_groq_client()
+    
+    async def complete(prompt: str) -> str:
+        async with semaphore:
+            return await client.generate(prompt)
+    
+    result = None
+    try:
+        while True:
+            request = steps.send(result)
+            if isinstance(request, str):
+                result = await complete(request)
+            elif isinstance(request, list):
+                result = list(await asyncio.gather(*(complete(prompt) for prompt in request)))
+            else:
+                # Image lookups use blocking HTTP; keep them off the event loop
+                result = await asyncio.to_thread(request)
+    except StopIteration as done:
+        return done.value
 
                                  
 class TextbookStyleCourseMaterialsGenerator:
@@ -49,6 +112,12 @@ class TextbookStyleCourseMaterialsGenerator:
         # Image configuration
         self.images_per_module = 3
         self.figure_counter = 1  # Global figure counter across all modules
+        # Concurrency configuration: max LLM calls in flight per generation
+        self.max_workers = int(os.environ.get('MATERIALS_MAX_WORKERS', 4))
+        # Guards reserving images in the tracker so parallel modules never pick the same image;
+        # a module whose search raced another's reservation searches again, up to this many times
+        self._image_lock = threading.Lock()
+        self.image_reserve_attempts = 4
     def get_tone_instructions(self, tone: str) -> str:
         """
         Get specific instructions for the selected tone.
@@ -347,7 +416,8 @@ class TextbookStyleCourseMaterialsGenerator:
             logger.warning(f"Error extracting corrected course topic: {e}, using original")
             return self.course_topic
                                                                         
-    def _embed_images_in_content(self, content: str, module_number: int, module_title: str) -> str:
+    def _embed_images_in_content(self, content: str, module_number: int, module_title: str,
+                                 figure_start: Optional[int] = None) -> str:
         """
         Embed images strategically throughout the content.
         
@@ -355,6 +425,7 @@ class TextbookStyleCourseMaterialsGenerator:
             content: The markdown content
             module_number: Module number for tracking
             module_title: Module title for image search
+            figure_start: First figure number to use; defaults to the shared figure counter
             
         Returns:
             Content with embedded images
@@ -362,23 +433,43 @@ class TextbookStyleCourseMaterialsGenerator:
         # Get the corrected course topic from audience analysis
         corrected_topic = self._extract_corrected_course_topic_from_audience_analysis()
                                                                
-        # Search for relevant images
+        # Search for relevant images; only reserving them needs the lock, so
+        # modules running in parallel search concurrently
         try:
-            images = self.image_service.search_educational_images(
-                topic= corrected_topic,
-                context="education tutorial learning",
-                count=self.images_per_module,
-                tracker=self.image_tracker
-            )
+            images = []
+            for attempt in range(self.image_reserve_attempts):
+                with self._image_lock:
+                    used_before = set(self.image_tracker.used_urls)
+                
+                images = self.image_service.search_educational_images(
+                    topic= corrected_topic,
+                    context="education tutorial learning",
+                    count=self.images_per_module,
+                    tracker=self.image_tracker
+                )
+                
+                if not images:
+                    break
+                
+                with self._image_lock:
+                    # Images that were already used are deliberate reuse once the topic runs
+                    # out; ones another module took while we searched mean searching again
+                    raced = any(
+                        self.image_tracker.is_image_used(image.url) and image_url_key(image.url) not in used_before
+                        for image in images
+                    )
+                    if raced and attempt + 1 < self.image_reserve_attempts:
+                        continue
+                    
+                    # Track the images for this module
+                    for image in images:
+                        self.image_tracker.add_image(module_number, image)
+                break
             
             if not images:
                 logger.warning(f"No images found for corrected topic '{corrected_topic}' for Module {module_number}: {module_title}")
                 return content
             
-            # Track the images for this module
-            for image in images:
-                self.image_tracker.add_image(module_number, image)
-            
         except Exception as e:
             logger.error(f"Failed to fetch images for corrected topic '{corrected_topic}' for Module {module_number}: {e}")
             return content
@@ -389,21 +480,27 @@ class TextbookStyleCourseMaterialsGenerator:
         # Split content into lines
         lines = content.split('\n')
         
+        # Figure numbers come from the shared counter unless the caller reserved a range
+        figure_number = self.figure_counter if figure_start is None else figure_start
+        
         # Insert images at strategic points (reverse order to maintain line numbers)
         for i, (image, (line_pos, context)) in enumerate(zip(images, insertion_points)):
             if line_pos < len(lines):
                 image_html = self._create_image_html(
                     image, 
-                    self.figure_counter, 
+                    figure_number, 
                     context, 
                     module_title
                 )
                 
                 # Insert the image HTML
                 lines.insert(line_pos + i, image_html)
-                self.figure_counter += 1
+                figure_number += 1
                 
-                logger.debug(f"Inserted Figure {self.figure_counter - 1} at line {line_pos} for Module {module_number}")
+                logger.debug(f"Inserted Figure {figure_number - 1} at line {line_pos} for Module {module_number}")
+        
+        if figure_start is None:
+            self.figure_counter = figure_number
         
         return '\n'.join(lines)                                                                             
     def generate_all_materials(self, 
@@ -411,10 +508,82 @@ class TextbookStyleCourseMaterialsGenerator:
                               components: List[str] = None,
                               detail_level: str = "comprehensive",
                               content_tone: str = "default",  # NEW: Tone parameter
-                              additional_notes: str = "") -> Dict[str, Any]:
+                              additional_notes: str = "",
+                              max_workers: Optional[int] = None,
+                              progress_callback: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
         """
         Generate comprehensive textbook-style materials for specified modules with selected tone.
+        
+        Components run on a bounded thread pool (``max_workers`` LLM calls in flight,
+        defaulting to ``MATERIALS_MAX_WORKERS``). Assessments are chained after the
+        module's content because they are written from it; modules are always
+        returned in the order requested. ``max_workers=1`` generates serially.
+        
+        If ``progress_callback`` is given it is called (possibly from worker threads)
+        with a structured event each time a module component finishes or fails.
         """
+        if max_workers is None:
+            max_workers = self.max_workers
+            
+        selected_modules, components, content_tone = self._normalize_request(
+            selected_modules, components, content_tone)
+        materials = self._new_materials(selected_modules, detail_level, content_tone, additional_notes)
+        
+        # Build the per-module task list up front so results keep module order
+        module_tasks = []
+        for module_idx in selected_modules:
+            if module_idx < 1 or module_idx > len(self.modules):
+                continue
+                
+            module = self.modules[module_idx - 1]
+            module_materials = {
+                "number": module_idx, 
+                "title": module["title"], 
+                "components": {}
+            }
+            materials["modules"].append(module_materials)
+            
+            # In parallel mode each module reserves its own block of figure numbers
+            figure_start = None
+            if max_workers > 1:
+                figure_start = 1 + (len(materials["modules"]) - 1) * self.images_per_module
+            
+            tasks = self._build_module_tasks(module_idx, components, detail_level,
+                                             content_tone, additional_notes, figure_start,
+                                             progress_callback)
+            module_tasks.append((module_materials, tasks))
+        
+        if max_workers <= 1:
+            # Image tracking is scoped to this generation and released when it finishes
+            with self.image_tracker:
+                for module_materials, tasks in module_tasks:
+                    logger.info(f"Generating comprehensive materials for Module {module_materials['number']}: {module_materials['title']} in {content_tone} tone")
+                    for task in tasks:
+                        module_materials["components"].update(task())
+            return materials
+        
+        logger.info(f"Generating materials for {len(module_tasks)} modules with up to {max_workers} concurrent requests in {content_tone} tone")
+        executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="materials")
+        try:
+            # Each task runs in a copy of this context so llm_context/record_llm_calls reach it
+            futures = [
+                (module_materials, executor.submit(contextvars.copy_context().run, task))
+                for module_materials, tasks in module_tasks
+                for task in tasks
+            ]
+            # Collect in submission order so component ordering matches serial generation
+            for module_materials, future in futures:
+                module_materials["components"].update(future.result())
+        finally:
+            # On failure, drop queued work instead of paying for calls we will discard
+            executor.shutdown(wait=True, cancel_futures=True)
+            self.image_tracker.release()
+            
+        return materials
+    
+    def _normalize_request(self, selected_modules: Optional[List[int]], components: Optional[List[str]],
+                           content_tone: str) -> Tuple[List[int], List[str], str]:
+        """Apply the defaults shared by the threaded and asyncio generation paths."""
         if selected_modules is None:
             selected_modules = list(range(1, len(self.modules) + 1))
             
@@ -424,10 +593,15 @@ class TextbookStyleCourseMaterialsGenerator:
         # Validate tone
         valid_tones = ['default', 'optimistic', 'entertaining', 'humanized']
         if content_tone not in valid_tones:
-            content_tone = 'default'               
+            content_tone = 'default'
+        return selected_modules, components, content_tone
+    
+    def _new_materials(self, selected_modules: List[int], detail_level: str, content_tone: str,
+                       additional_notes: str) -> Dict[str, Any]:
+        """Create the empty materials document for a generation run."""
         # Reset figure counter for this generation
         self.figure_counter = 1                                          
-        materials = {
+        return {
             "metadata": {
                 "course_topic": self.course_topic,
                 "audience_type": self.audience_type,
@@ -442,7 +616,34 @@ class TextbookStyleCourseMaterialsGenerator:
             },
             "modules": []
         }
+    
+    async def generate_all_materials_async(self,
+                                           selected_modules: List[int] = None,
+                                           components: List[str] = None,
+                                           detail_level: str = "comprehensive",
+                                           content_tone: str = "default",
+                                           additional_notes: str = "",
+                                           max_concurrency: Optional[int] = None,
+                                           progress_callback: Optional[Callable[[Dict[str, Any]], None]] = None
+                                           ) -> Dict[str, Any]:
+        """
+        asyncio version of generate_all_materials.
+        
+        Every module component runs as a coroutine on the current event loop and
+        all of them are gathered at once; a semaphore keeps at most
+        ``max_concurrency`` LLM requests in flight (default ``MATERIALS_MAX_WORKERS``).
+        Only image lookups use worker threads. The result matches the threaded
+        parallel mode, including figure numbering.
+        """
+        if max_concurrency is None:
+            max_concurrency = self.max_workers
+            
+        selected_modules, components, content_tone = self._normalize_request(
+            selected_modules, components, content_tone)
+        materials = self._new_materials(selected_modules, detail_level, content_tone, additional_notes)
+        semaphore = asyncio.Semaphore(max(1, max_concurrency))
         
+        module_coroutines = []
         for module_idx in selected_modules:
             if module_idx < 1 or module_idx > len(self.modules):
                 continue
@@ -453,42 +654,206 @@ class TextbookStyleCourseMaterialsGenerator:
                 "title": module["title"], 
                 "components": {}
             }
+            materials["modules"].append(module_materials)
+            figure_start = 1 + (len(materials["modules"]) - 1) * self.images_per_module
             
-            logger.info(f"Generating comprehensive materials for Module {module_idx}: {module['title']} in {content_tone} tone")
-            
-            # Generate content first (needed for assessments)
+            coroutines = self._build_module_coroutines(module_idx, components, detail_level,
+                                                       content_tone, additional_notes, figure_start,
+                                                       semaphore, progress_callback)
+            module_coroutines.extend((module_materials, coroutine) for coroutine in coroutines)
+        
+        logger.info(f"Generating materials for {len(materials['modules'])} modules on the event loop with up to {max_concurrency} concurrent requests in {content_tone} tone")
+        # One connection pool for the whole run, closed before the caller's loop ends
+        async with async_groq_session():
+            tasks = [asyncio.ensure_future(coroutine) for _, coroutine in module_coroutines]
+            try:
+                results = await asyncio.gather(*tasks)
+            except BaseException:
+                # On failure, stop the remaining calls instead of paying for results we discard
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                raise
+            finally:
+                self.image_tracker.release()
+        
+        # Merge in submission order so component ordering matches serial generation
+        for (module_materials, _), result in zip(module_coroutines, results):
+            module_materials["components"].update(result)
+        return materials
+    
+    def _build_module_coroutines(self, module_idx: int, components: List[str], detail_level: str,
+                                 content_tone: str, additional_notes: str, figure_start: int,
+                                 semaphore: asyncio.Semaphore,
+                                 progress_callback: Optional[Callable[[Dict[str, Any]], None]] = None
+                                 ) -> List[Awaitable[Dict[str, Any]]]:
+        """asyncio counterpart of _build_module_tasks."""
+        
+        def run(component: str, steps: LLMSteps) -> Awaitable[Dict[str, Any]]:
+            return self._run_component_async(module_idx, component, steps, semaphore, progress_callback)
+        
+        async def content_and_assessments():
+            results = {}
             module_content = None
             if "content" in components:
-                logger.info(f"  - Generating comprehensive textbook content with embedded images in {content_tone} tone...")
-                module_content = self.generate_comprehensive_content(module_idx, detail_level, content_tone, additional_notes)
-                module_materials["components"]["content"] = module_content
-            
-            # Generate assessments with real questions based on content
+                module_content = await run("content", self.generate_comprehensive_content.steps(
+                    self, module_idx, detail_level, content_tone, additional_notes, figure_start))
+                results["content"] = module_content
             if "assessments" in components:
-                logger.info(f"  - Generating real assessment questions in {content_tone} tone...")
-                module_materials["components"]["assessments"] = self.generate_real_assessments(
-                    module_idx, detail_level, module_content, content_tone, additional_notes
-                )
-            
-            # Generate other components
-            if "lesson_plans" in components:
-                logger.info(f"  - Generating detailed lesson plan in {content_tone} tone...")
-                module_materials["components"]["lesson_plan"] = self.generate_detailed_lesson_plan(module_idx, detail_level, content_tone, additional_notes)
-                
-            if "activities" in components:
-                logger.info(f"  - Generating extensive activities  in {content_tone} tone...")
-                module_materials["components"]["activities"] = self.generate_comprehensive_activities(module_idx, detail_level, content_tone, additional_notes)
+                results["assessments"] = await run("assessments", self.generate_real_assessments.steps(
+                    self, module_idx, detail_level, module_content, content_tone, additional_notes))
+            return results
+        
+        async def single(key: str, steps: LLMSteps):
+            return {key: await run(key, steps)}
+        
+        coroutines = []
+        if "content" in components or "assessments" in components:
+            coroutines.append(content_and_assessments())
+        if "lesson_plans" in components:
+            coroutines.append(single("lesson_plan", self.generate_detailed_lesson_plan.steps(
+                self, module_idx, detail_level, content_tone, additional_notes)))
+        if "activities" in components:
+            coroutines.append(single("activities", self.generate_comprehensive_activities.steps(
+                self, module_idx, detail_level, content_tone, additional_notes)))
+        if "instructor_guides" in components:
+            coroutines.append(single("instructor_guide", self.generate_comprehensive_instructor_guide.steps(
+                self, module_idx, detail_level, content_tone, additional_notes)))
+        return coroutines
+    
+    def _build_module_tasks(self, module_idx: int, components: List[str], detail_level: str,
+                            content_tone: str, additional_notes: str,
+                            figure_start: Optional[int] = None,
+                            progress_callback: Optional[Callable[[Dict[str, Any]], None]] = None
+                            ) -> List[Callable[[], Dict[str, Any]]]:
+        """
+        Build the independent units of work for one module.
+        
+        Each task returns a dict of component name -> generated material. Content and
+        assessments share one task because assessments consume the generated content.
+        """
+        tasks = []
+        
+        def run(component: str, generate: Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+            return self._run_component(module_idx, component, generate, progress_callback)
+        
+        if "content" in components or "assessments" in components:
+            def content_and_assessments():
+                results = {}
                 
-            if "instructor_guides" in components:
-                logger.info(f"  - Generating detailed instructor guide in {content_tone} tone...")
-                module_materials["components"]["instructor_guide"] = self.generate_comprehensive_instructor_guide(module_idx, detail_level, content_tone, additional_notes)
+                # Generate content first (needed for assessments)
+                module_content = None
+                if "content" in components:
+                    logger.info(f"  - Generating comprehensive textbook content with embedded images for Module {module_idx} in {content_tone} tone...")
+                    module_content = run("content", lambda: self.generate_comprehensive_content(
+                        module_idx, detail_level, content_tone, additional_notes, figure_start))
+                    results["content"] = module_content
                 
-            materials["modules"].append(module_materials)
+                # Generate assessments with real questions based on content
+                if "assessments" in components:
+                    logger.info(f"  - Generating real assessment questions for Module {module_idx} in {content_tone} tone...")
+                    results["assessments"] = run("assessments", lambda: self.generate_real_assessments(
+                        module_idx, detail_level, module_content, content_tone, additional_notes
+                    ))
+                return results
+            tasks.append(content_and_assessments)
+        
+        # Generate other components
+        if "lesson_plans" in components:
+            def lesson_plan():
+                logger.info(f"  - Generating detailed lesson plan for Module {module_idx} in {content_tone} tone...")
+                return {"lesson_plan": run("lesson_plan", lambda: self.generate_detailed_lesson_plan(
+                    module_idx, detail_level, content_tone, additional_notes))}
+            tasks.append(lesson_plan)
             
-        return materials
+        if "activities" in components:
+            def activities():
+                logger.info(f"  - Generating extensive activities for Module {module_idx} in {content_tone} tone...")
+                return {"activities": run("activities", lambda: self.generate_comprehensive_activities(
+                    module_idx, detail_level, content_tone, additional_notes))}
+            tasks.append(activities)
+            
+        if "instructor_guides" in components:
+            def instructor_guide():
+                logger.info(f"  - Generating detailed instructor guide for Module {module_idx} in {content_tone} tone...")
+                return {"instructor_guide": run("instructor_guide", lambda: self.generate_comprehensive_instructor_guide(
+                    module_idx, detail_level, content_tone, additional_notes))}
+            tasks.append(instructor_guide)
+            
+        return tasks
+    
+    def _run_component(self, module_idx: int, component: str, generate: Callable[[], Dict[str, Any]],
+                       progress_callback: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+        """
+        Run one component generator, timing it and reporting the outcome to progress_callback.
+        """
+        started = time.monotonic()
+        with track_usage() as usage, llm_context(component=component, module=module_idx):
+            try:
+                result = generate()
+            except Exception as e:
+                self._emit_progress(progress_callback, self._component_event(module_idx, component, started, error=e))
+                raise
+        
+        self._emit_progress(progress_callback, self._component_event(module_idx, component, started, usage))
+        return result
+    
+    async def _run_component_async(self, module_idx: int, component: str, steps: LLMSteps,
+                                   semaphore: asyncio.Semaphore,
+                                   progress_callback: Optional[Callable[[Dict[str, Any]], None]] = None
+                                   ) -> Dict[str, Any]:
+        """asyncio counterpart of _run_component; callbacks run in a worker thread."""
+        started = time.monotonic()
+        with track_usage() as usage, llm_context(component=component, module=module_idx):
+            try:
+                result = await _run_steps_async(steps, semaphore)
+            except Exception as e:
+                if progress_callback is not None:
+                    await asyncio.to_thread(self._emit_progress, progress_callback,
+                                            self._component_event(module_idx, component, started, error=e))
+                raise
+        
+        if progress_callback is not None:
+            await asyncio.to_thread(self._emit_progress, progress_callback,
+                                    self._component_event(module_idx, component, started, usage))
+        return result
+    
+    def _component_event(self, module_idx: int, component: str, started: float,
+                         usage: Optional[Dict[str, int]] = None,
+                         error: Optional[Exception] = None) -> Dict[str, Any]:
+        if error is not None:
+            return {
+                "event": "component_failed",
+                "module": module_idx,
+                "component": component,
+                "duration": round(time.monotonic() - started, 2),
+                "error": str(error)
+            }
+        return {
+            "event": "component_completed",
+            "module": module_idx,
+            "module_title": self.modules[module_idx - 1].get("title", f"Module {module_idx}"),
+            "component": component,
+            "duration": round(time.monotonic() - started, 2),
+            "prompt_tokens": usage["prompt_tokens"],
+            "completion_tokens": usage["completion_tokens"],
+            "total_tokens": usage["total_tokens"]
+        }
+    
+    @staticmethod
+    def _emit_progress(progress_callback: Optional[Callable[[Dict[str, Any]], None]], event: Dict[str, Any]) -> None:
+        """Deliver a progress event; a failing callback must never break generation."""
+        if progress_callback is None:
+            return
+        try:
+            progress_callback(event)
+        except Exception as e:
+            logger.warning(f"Progress callback failed: {e}")
     
+    @llm_steps
     def generate_comprehensive_content(self, module_idx: int,  detail_level: str = "comprehensive", 
-                                     content_tone: str = "default", additional_notes: str = "") -> Dict[str, Any]:
+                                     content_tone: str = "default", additional_notes: str = "",
+                                     figure_start: Optional[int] = None) -> Dict[str, Any]:
         """
         Generate comprehensive, textbook-style instructional content with embedded images.
         """
@@ -503,8 +868,6 @@ class TextbookStyleCourseMaterialsGenerator:
         
         # Get tone-specific instructions
         tone_instructions = self.get_tone_instructions(content_tone)
-        # Generate comprehensive content
-        client = GroqClient()
         
         # Generate main content with more detailed topic coverage
         main_content_prompt = f"""
@@ -654,17 +1017,14 @@ class TextbookStyleCourseMaterialsGenerator:
         NOTE: Images will be automatically inserted at strategic points in this content, so write flowing, continuous text that can accommodate image integration.
         """
         
-        main_content_response = client.generate(main_content_prompt)
+        main_content_response = yield main_content_prompt
         
         # Embed images in the content
-        content_with_images = self._embed_images_in_content(
+        content_with_images = yield lambda: self._embed_images_in_content(
             main_content_response, 
-                                
-                 
             module_idx, 
-                                      
-                                  
-            module_title
+            module_title,
+            figure_start
         )                                                               
         # Return structured content
         comprehensive_content = {
@@ -678,7 +1038,9 @@ class TextbookStyleCourseMaterialsGenerator:
                 "prerequisite_knowledge": self._determine_prerequisites(module_idx),
                 "learning_path": self._create_learning_path(module),
                 "images_included": self.images_per_module,
-                "figure_numbers": list(range(self.figure_counter - self.images_per_module, self.figure_counter))
+                "figure_numbers": (list(range(figure_start, figure_start + self.images_per_module))
+                                   if figure_start is not None else
+                                   list(range(self.figure_counter - self.images_per_module, self.figure_counter)))
             },
             "metadata": {
                 "module_number": module_idx,
@@ -693,6 +1055,7 @@ class TextbookStyleCourseMaterialsGenerator:
         
         return comprehensive_content
     
+    @llm_steps
     def generate_real_assessments(self, module_idx: int, detail_level: str = "comprehensive", 
                                  module_content: Dict[str, Any] = None, content_tone: str = "default",
                                  additional_notes: str = "") -> Dict[str, Any]:
@@ -715,7 +1078,6 @@ class TextbookStyleCourseMaterialsGenerator:
         
         # Get tone instructions
         tone_instructions = self.get_tone_instructions(content_tone)                               
-        client = GroqClient()
         
         # Generate assessment questions based on actual content
         assessment_prompt = f"""
@@ -885,8 +1247,6 @@ class TextbookStyleCourseMaterialsGenerator:
         8. Apply {content_tone} tone consistently in all instructions and feedback while maintaining assessment integrity
         """
         
-        assessments_response = client.generate(assessment_prompt)
-        
         # Generate additional practice questions
         practice_prompt = f"""
         Based on the same module content for Module {module_idx}: {module_title}, create 10 additional practice questions 
@@ -915,7 +1275,8 @@ class TextbookStyleCourseMaterialsGenerator:
         [Continue for all 10 questions, covering different aspects of the module content]
         """
         
-        practice_response = client.generate(practice_prompt)
+        # The two prompts are independent, so they are sent together
+        assessments_response, practice_response = yield [assessment_prompt, practice_prompt]
         
         return {
             "comprehensive_assessments": assessments_response,
@@ -954,6 +1315,7 @@ class TextbookStyleCourseMaterialsGenerator:
             }
         }
     
+    @llm_steps
     def generate_detailed_lesson_plan(self, module_idx: int, detail_level: str = "comprehensive",
                                     content_tone: str = "default", additional_notes: str = "") -> Dict[str, Any]:
         """
@@ -967,7 +1329,6 @@ class TextbookStyleCourseMaterialsGenerator:
         
         tone_instructions = self.get_tone_instructions(content_tone)
         
-        client = GroqClient()
         
         prompt = f"""
         Create a comprehensive lesson plan for delivering the extensive content of Module {module_idx}: {module_title}.
@@ -1158,7 +1519,7 @@ class TextbookStyleCourseMaterialsGenerator:
         Create a lesson plan that can effectively deliver comprehensive, textbook-level content while maintaining high engagement and the {content_tone} tone consistently.
         """
         
-        lesson_plan_response = client.generate(prompt)
+        lesson_plan_response = yield prompt
         
         return {
             "comprehensive_lesson_plan": lesson_plan_response,
@@ -1174,6 +1535,7 @@ class TextbookStyleCourseMaterialsGenerator:
             }
         }
     
+    @llm_steps
     def generate_comprehensive_activities(self, module_idx: int, detail_level: str = "comprehensive",
                                         content_tone: str = "default", additional_notes: str = "") -> Dict[str, Any]:
         """
@@ -1187,7 +1549,6 @@ class TextbookStyleCourseMaterialsGenerator:
         
         tone_instructions = self.get_tone_instructions(content_tone)
         
-        client = GroqClient()
         
         prompt = f"""
         Create a comprehensive collection of learning activities for Module {module_idx}: {module_title}.
@@ -1325,7 +1686,7 @@ class TextbookStyleCourseMaterialsGenerator:
         Create activities that are engaging, educationally sound, and appropriate for {self.audience_type} learners dealing with comprehensive content, all delivered in the {content_tone} tone.
         """
         
-        activities_response = client.generate(prompt)
+        activities_response = yield prompt
         
         return {
             "comprehensive_activities": activities_response,
@@ -1353,6 +1714,7 @@ class TextbookStyleCourseMaterialsGenerator:
             }
         }
     
+    @llm_steps
     def generate_comprehensive_instructor_guide(self, module_idx: int, detail_level: str = "comprehensive",
                                               content_tone: str = "default", additional_notes: str = "") -> Dict[str, Any]:
         """
@@ -1366,7 +1728,6 @@ class TextbookStyleCourseMaterialsGenerator:
         
         tone_instructions = self.get_tone_instructions(content_tone)
         
-        client = GroqClient()
         
         prompt = f"""
         Create a comprehensive instructor guide for delivering extensive, textbook-style content for Module {module_idx}: {module_title}.
@@ -1676,7 +2037,7 @@ class TextbookStyleCourseMaterialsGenerator:
         Create an instructor guide that empowers educators to deliver comprehensive, engaging, and effective instruction with extensive content while maintaining the {content_tone} tone consistently and ensuring real learning occurs.
         """
         
-        instructor_guide_response = client.generate(prompt)
+        instructor_guide_response = yield prompt
         
         return {
             "comprehensive_instructor_guide": instructor_guide_response,
@@ -1716,8 +2077,8 @@ class TextbookStyleCourseMaterialsGenerator:
             filepath: Path to save the materials to
         """
         os.makedirs(os.path.dirname(filepath), exist_ok=True)
-        with open(filepath, 'w', encoding='utf-8') as f:
-            json.dump(materials, f, indent=2)
+        with open(filepath, 'wb') as f:
+            f.write(json_codec.dumps(materials))
             
     @staticmethod
     def load_materials(filepath: str) -> Dict[str, Any]:
@@ -1730,8 +2091,8 @@ class TextbookStyleCourseMaterialsGenerator:
         Returns:
             Dictionary containing the loaded materials
         """
-        with open(filepath, 'r', encoding='utf-8') as f:
-            return json.load(f)
+        with open(filepath, 'rb') as f:
+            return json_codec.loads(f.read())
     
     # Helper Methods
     def _extract_task_content_for_module(self, module_idx: int) -> str:
@@ -1794,7 +2155,9 @@ def generate_course_materials(design_data: Dict[str, Any],
                              components: List[str] = None,
                              detail_level: str = "comprehensive",
                              content_tone: str = "default",
-                             additional_notes: str = "") -> Dict[str, Any]:
+                             additional_notes: str = "",
+                             max_workers: Optional[int] = None,
+                             progress_callback: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
     """
     Generate comprehensive, textbook-style course materials with real assessment questions, 
     tone selection, and integrated educational images.
@@ -1806,12 +2169,32 @@ def generate_course_materials(design_data: Dict[str, Any],
         detail_level: Level of detail for generation
         content_tone: Tone style for content generation ('default', 'optimistic', 'entertaining', 'humanized')
         additional_notes: Additional requirements or customization notes
+        max_workers: Maximum concurrent LLM calls (defaults to MATERIALS_MAX_WORKERS)
+        progress_callback: Called with a structured event as each module component finishes
         
     Returns:
         Dictionary containing comprehensive generated materials with specified tone and images
     """
     generator = TextbookStyleCourseMaterialsGenerator(design_data)
-    return generator.generate_all_materials(selected_modules, components, detail_level, content_tone, additional_notes)
+    return generator.generate_all_materials(selected_modules, components, detail_level, content_tone, additional_notes,
+                                            max_workers=max_workers, progress_callback=progress_callback)
+
+async def generate_course_materials_async(design_data: Dict[str, Any], 
+                                         selected_modules: List[int] = None,
+                                         components: List[str] = None,
+                                         detail_level: str = "comprehensive",
+                                         content_tone: str = "default",
+                                         additional_notes: str = "",
+                                         max_concurrency: Optional[int] = None,
+                                         progress_callback: Optional[Callable[[Dict[str, Any]], None]] = None
+                                         ) -> Dict[str, Any]:
+    """
+    asyncio version of generate_course_materials; see generate_all_materials_async.
+    """
+    generator = TextbookStyleCourseMaterialsGenerator(design_data)
+    return await generator.generate_all_materials_async(selected_modules, components, detail_level, content_tone,
+                                                        additional_notes, max_concurrency=max_concurrency,
+                                                        progress_callback=progress_callback)
 
 # Backward compatibility - keep the original class name as an alias
 class CourseMaterialsGenerator(TextbookStyleCourseMaterialsGenerator):
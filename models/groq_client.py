@@ -1,14 +1,430 @@
-from groq import Groq
+import groq
+from groq import Groq, AsyncGroq
+import httpx
+import asyncio
+from contextlib import asynccontextmanager, contextmanager
+import contextvars
+import hashlib
+import json
+import logging
+import threading
 import time
 import os
 
+from models.cache import SQLiteCache, DEFAULT_CACHE_DIR
+from models.rate_limiter import CompletionEstimate, TokenBucketLimiter, backoff_delay, estimate_tokens, parse_retry_after
+
+logger = logging.getLogger(__name__)
+
+# Token usage accumulator for the current context (see track_usage)
+_usage_scope = contextvars.ContextVar('groq_usage_scope', default=None)
+
+@contextmanager
+def track_usage():
+    """
+    Accumulate token usage of every GroqClient call made inside the block.
+    
+    Scopes are per thread/task, so concurrent generations each see only their own calls.
+    
+    Yields:
+        dict: Running totals (prompt_tokens, completion_tokens, total_tokens, calls, cached_calls)
+    """
+    totals = {'prompt_tokens': 0, 'completion_tokens': 0, 'total_tokens': 0, 'calls': 0, 'cached_calls': 0}
+    token = _usage_scope.set(totals)
+    try:
+        yield totals
+    finally:
+        _usage_scope.reset(token)
+
+# Labels (analysis_id, component, module, ...) attached to calls in the current context
+_call_labels = contextvars.ContextVar('groq_call_labels', default={})
+# Per-call records collected for the current context (see record_llm_calls)
+_call_log = contextvars.ContextVar('groq_call_log', default=None)
+
+@contextmanager
+def llm_context(**labels):
+    """
+    Label every GroqClient call made inside the block, e.g. llm_context(component='content').
+    
+    Labels nest: inner blocks add to or override the labels of outer ones.
+    """
+    token = _call_labels.set({**_call_labels.get(), **labels})
+    try:
+        yield
+    finally:
+        _call_labels.reset(token)
+
+@contextmanager
+def record_llm_calls():
+    """
+    Collect one record per GroqClient call made inside the block.
+    
+    Each record holds the current llm_context labels plus model, prompt/completion/total
+    tokens, latency_ms and whether it was served from the cache. Worker threads and
+    asyncio tasks see the block if they were started with a copy of its context.
+    
+    Yields:
+        list: The records, appended to as calls complete
+    """
+    calls = []
+    token = _call_log.set(calls)
+    try:
+        yield calls
+    finally:
+        _call_log.reset(token)
+
+def _record_usage(usage, cached=False, model=None, started=None):
+    calls = _call_log.get()
+    if calls is not None:
+        calls.append({
+            **_call_labels.get(),
+            'model': model,
+            'prompt_tokens': getattr(usage, 'prompt_tokens', 0) or 0,
+            'completion_tokens': getattr(usage, 'completion_tokens', 0) or 0,
+            'total_tokens': getattr(usage, 'total_tokens', 0) or 0,
+            'latency_ms': int((time.monotonic() - started) * 1000) if started is not None else 0,
+            'cached': cached
+        })
+    
+    totals = _usage_scope.get()
+    if totals is None:
+        return
+    totals['calls'] += 1
+    if cached:
+        totals['cached_calls'] += 1
+    if usage is None:
+        return
+    totals['prompt_tokens'] += getattr(usage, 'prompt_tokens', 0) or 0
+    totals['completion_tokens'] += getattr(usage, 'completion_tokens', 0) or 0
+    totals['total_tokens'] += getattr(usage, 'total_tokens', 0) or 0
+
+# Receiver for streamed tokens in the current context (see stream_tokens)
+_token_sink = contextvars.ContextVar('groq_token_sink', default=None)
+
+@contextmanager
+def stream_tokens(callback):
+    """
+    Stream every GroqClient.generate call made inside the block.
+    
+    generate() still returns the full response, but fetches it with
+    generate_stream() and passes each text delta to callback as it arrives.
+    This lets callers stream existing generators without changing them.
+    """
+    token = _token_sink.set(callback)
+    try:
+        yield
+    finally:
+        _token_sink.reset(token)
+
+# Set inside fresh_responses(): skip cached responses (see fresh_responses)
+_fresh_responses = contextvars.ContextVar('groq_fresh_responses', default=False)
+
+@contextmanager
+def fresh_responses():
+    """
+    Make every GroqClient/AsyncGroqClient call inside the block ask Groq again.
+    
+    Cached responses are not served, but new ones still replace them in the
+    cache. Use it for regeneration, where the user wants a different answer to
+    the same prompt.
+    """
+    token = _fresh_responses.set(True)
+    try:
+        yield
+    finally:
+        _fresh_responses.reset(token)
+
+class ResponseCache:
+    """
+    Interface for LLM response caches. This base class caches nothing; subclass it
+    and pass an instance to set_response_cache() to plug in another backend.
+    """
+    
+    def get(self, key):
+        return None
+    
+    def set(self, key, response):
+        pass
+    
+    def stats(self):
+        return {'backend': 'none'}
+
+class SQLiteResponseCache(ResponseCache):
+    """Response cache on local disk with TTL and size-based LRU eviction."""
+    
+    def __init__(self, path, ttl=None, max_bytes=None):
+        self.store = SQLiteCache(path, table='llm_responses', ttl=ttl, max_bytes=max_bytes)
+    
+    def get(self, key):
+        value = self.store.get(key)
+        return value.decode('utf-8') if value is not None else None
+    
+    def set(self, key, response):
+        self.store.set(key, response.encode('utf-8'))
+    
+    def stats(self):
+        return {'backend': 'sqlite', 'path': self.store.path, **self.store.stats()}
+
+_response_cache = None
+_response_cache_lock = threading.Lock()
+
+def get_response_cache():
+    """
+    Return the process-wide response cache, building it from the environment on first use.
+    
+    LLM_CACHE_BACKEND: 'sqlite' (default) or 'none'
+    LLM_CACHE_PATH: SQLite file (default: cache/llm_cache.sqlite3)
+    LLM_CACHE_TTL: Seconds before an entry expires (default: 7 days)
+    LLM_CACHE_MAX_MB: Size budget before least recently used entries are evicted (default: 256)
+    """
+    global _response_cache
+    if _response_cache is None:
+        with _response_cache_lock:
+            if _response_cache is None:
+                backend = os.environ.get('LLM_CACHE_BACKEND', 'sqlite').lower()
+                if backend == 'sqlite':
+                    _response_cache = SQLiteResponseCache(
+                        os.environ.get('LLM_CACHE_PATH', os.path.join(DEFAULT_CACHE_DIR, 'llm_cache.sqlite3')),
+                        ttl=float(os.environ.get('LLM_CACHE_TTL', 7 * 24 * 3600)),
+                        max_bytes=int(float(os.environ.get('LLM_CACHE_MAX_MB', 256)) * 1024 * 1024)
+                    )
+                else:
+                    _response_cache = ResponseCache()
+    return _response_cache
+
+def set_response_cache(cache):
+    """Replace the process-wide response cache (e.g. with ResponseCache() to disable caching)."""
+    global _response_cache
+    with _response_cache_lock:
+        _response_cache = cache
+
+def response_cache_key(model_name, prompt, system_prompt=None, max_tokens=None):
+    """Content hash of everything that determines a completion."""
+    parts = [model_name, system_prompt, prompt]
+    if max_tokens:
+        # Only part of the key when set, so existing entries stay valid
+        parts.append(max_tokens)
+    payload = json.dumps(parts, ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+DEFAULT_MODEL = "meta-llama/llama-4-scout-17b-16e-instruct"
+
+_sdk_clients = {}
+_groq_clients = {}
+_async_groq_clients = {}
+_registry_lock = threading.Lock()
+
+def _shared_sdk_client(api_key):
+    """
+    Return the process-wide Groq SDK client for an API key.
+    
+    All GroqClient instances share it, so they share one keep-alive HTTP
+    connection pool instead of paying connection and TLS setup per call.
+    Pool limits come from GROQ_MAX_CONNECTIONS, GROQ_MAX_KEEPALIVE,
+    GROQ_KEEPALIVE_EXPIRY and GROQ_TIMEOUT.
+    """
+    with _registry_lock:
+        sdk_client = _sdk_clients.get(api_key)
+        if sdk_client is None:
+            http_client = httpx.Client(limits=_pool_limits(), timeout=_pool_timeout())
+            sdk_client = Groq(api_key=api_key, http_client=http_client, max_retries=0)
+            _sdk_clients[api_key] = sdk_client
+        return sdk_client
+
+# AsyncGroq SDK clients of the current async_groq_session(), by API key
+_async_session = contextvars.ContextVar('groq_async_session', default=None)
+
+def _new_async_sdk_client(api_key):
+    http_client = httpx.AsyncClient(limits=_pool_limits(), timeout=_pool_timeout())
+    return AsyncGroq(api_key=api_key, http_client=http_client, max_retries=0)
+
+@asynccontextmanager
+async def async_groq_session():
+    """
+    Share one pooled AsyncGroq client per API key between every AsyncGroqClient call in the block.
+    
+    httpx.AsyncClient connections belong to the event loop that opened them and
+    each job runs on a loop of its own (asyncio.run), so the pool is opened for
+    one generation run and closed when the block exits, before its loop ends.
+    Tasks started inside the block share it. Nested blocks reuse the outer
+    session; calls made outside any session open and close a client per call.
+    """
+    if _async_session.get() is not None:
+        yield
+        return
+    clients = {}
+    token = _async_session.set(clients)
+    try:
+        yield
+    finally:
+        _async_session.reset(token)
+        for sdk_client in clients.values():
+            await sdk_client.close()
+
+@asynccontextmanager
+async def _async_sdk_client(api_key):
+    """The current session's AsyncGroq client, or a client for this call only."""
+    clients = _async_session.get()
+    if clients is None:
+        async with _new_async_sdk_client(api_key) as sdk_client:
+            yield sdk_client
+        return
+    sdk_client = clients.get(api_key)
+    if sdk_client is None:
+        sdk_client = clients[api_key] = _new_async_sdk_client(api_key)
+    yield sdk_client
+
+def _pool_limits():
+    return httpx.Limits(
+        max_connections=int(os.environ.get('GROQ_MAX_CONNECTIONS', 20)),
+        max_keepalive_connections=int(os.environ.get('GROQ_MAX_KEEPALIVE', 10)),
+        keepalive_expiry=float(os.environ.get('GROQ_KEEPALIVE_EXPIRY', 60))
+    )
+
+def _pool_timeout():
+    return httpx.Timeout(float(os.environ.get('GROQ_TIMEOUT', 120)), connect=10.0)
+
+def get_groq_client(model_name=DEFAULT_MODEL):
+    """
+    Return the shared GroqClient for a model, creating it on first use.
+    
+    Instances are thread-safe and reused process-wide; prefer this over
+    constructing GroqClient() at each call site.
+    
+    Args:
+        model_name (str): The model to use
+        
+    Returns:
+        GroqClient: Client bound to model_name
+    """
+    client = _groq_clients.get(model_name)
+    if client is None:
+        client = GroqClient(model_name)
+        with _registry_lock:
+            client = _groq_clients.setdefault(model_name, client)
+    return client
+
+def get_async_groq_client(model_name=DEFAULT_MODEL):
+    """
+    Return the shared AsyncGroqClient for a model, creating it on first use.
+    
+    Args:
+        model_name (str): The model to use
+        
+    Returns:
+        AsyncGroqClient: Client bound to model_name
+    """
+    client = _async_groq_clients.get(model_name)
+    if client is None:
+        client = AsyncGroqClient(model_name)
+        with _registry_lock:
+            client = _async_groq_clients.setdefault(model_name, client)
+    return client
+
+class GroqClientError(Exception):
+    """Base class for errors raised by GroqClient and AsyncGroqClient."""
+    
+    def __init__(self, message, status_code=None, retry_after=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+class GroqRateLimitError(GroqClientError):
+    """Groq kept answering 429 after every retry, or asked for a longer wait than GROQ_BACKOFF_MAX."""
+
+class GroqAPIError(GroqClientError):
+    """The request failed with a non-retryable error, or kept failing after every retry."""
+
+_rate_limiter = None
+_completion_estimate = None
+
+def get_rate_limiter():
+    """
+    Return the process-wide limiter shared by every Groq client.
+    
+    GROQ_RPM (requests per minute) and GROQ_TPM (tokens per minute) are the
+    account's quota; 0 disables a budget. Limiters are per process, so each
+    process takes an equal share: the quota is divided by GROQ_PROCESSES, which
+    defaults to gunicorn's WEB_CONCURRENCY (else 1). Count every process using
+    the API key, including ``flask run-jobs`` workers.
+    """
+    global _rate_limiter
+    if _rate_limiter is None:
+        with _registry_lock:
+            if _rate_limiter is None:
+                processes = max(1, int(os.environ.get('GROQ_PROCESSES') or os.environ.get('WEB_CONCURRENCY') or 1))
+                _rate_limiter = TokenBucketLimiter(
+                    requests_per_minute=float(os.environ.get('GROQ_RPM', 30)) / processes,
+                    tokens_per_minute=float(os.environ.get('GROQ_TPM', 30000)) / processes
+                )
+    return _rate_limiter
+
+def _get_completion_estimate():
+    """Running average of completion sizes, starting from GROQ_COMPLETION_TOKEN_ESTIMATE."""
+    global _completion_estimate
+    if _completion_estimate is None:
+        with _registry_lock:
+            if _completion_estimate is None:
+                _completion_estimate = CompletionEstimate(int(os.environ.get('GROQ_COMPLETION_TOKEN_ESTIMATE', 2048)))
+    return _completion_estimate
+
+def _reserve_tokens(prompt, system_prompt=None, max_tokens=None):
+    """Tokens to reserve for a call: the prompt plus max_tokens, or else the expected completion."""
+    return estimate_tokens(prompt, system_prompt) + (max_tokens or _get_completion_estimate().tokens())
+
+def _settle(reserved, usage):
+    """Give back what a call did not use and learn from the size of its completion."""
+    get_rate_limiter().settle(reserved, getattr(usage, 'total_tokens', None))
+    completion_tokens = getattr(usage, 'completion_tokens', None)
+    if completion_tokens is not None:
+        _get_completion_estimate().observe(completion_tokens)
+
+def _retry_delay(error, attempt, reserved_tokens):
+    """
+    Decide what to do after a failed request.
+    
+    Returns the seconds to wait before retrying, or raises the matching
+    GroqClientError when the error is not transient or retries are used up.
+    """
+    limiter = get_rate_limiter()
+    # The failed call did not consume its token reservation
+    limiter.settle(reserved_tokens, 0)
+    
+    status_code = getattr(error, 'status_code', None)
+    response = getattr(error, 'response', None)
+    retry_after = parse_retry_after(response.headers.get('retry-after')) if response is not None else None
+    
+    if isinstance(error, groq.RateLimitError):
+        retryable = True
+    elif isinstance(error, groq.APIStatusError):
+        retryable = status_code in (408, 409) or status_code >= 500
+    else:
+        retryable = isinstance(error, groq.APIConnectionError)
+    
+    cap = float(os.environ.get('GROQ_BACKOFF_MAX', 60))
+    # A retry-after beyond the cap (e.g. a daily quota) is not worth waiting out, let alone pausing everyone for
+    too_long = retry_after is not None and retry_after > cap
+    if not retryable or too_long or attempt >= int(os.environ.get('GROQ_MAX_RETRIES', 5)):
+        error_class = GroqRateLimitError if status_code == 429 else GroqAPIError
+        raise error_class(f"Groq API request failed: {str(error)}", status_code, retry_after) from error
+    
+    delay = backoff_delay(attempt,
+                          base=float(os.environ.get('GROQ_BACKOFF_BASE', 1)),
+                          cap=cap,
+                          retry_after=retry_after)
+    if status_code == 429:
+        # Everyone shares the quota, so every caller waits out the 429
+        limiter.pause(delay)
+    logger.warning(f"Groq request failed ({str(error)}); retry {attempt + 1} in {delay:.1f}s")
+    return delay
+
 class GroqClient:
-    def __init__(self, model_name="meta-llama/llama-4-scout-17b-16e-instruct"):
+    def __init__(self, model_name=DEFAULT_MODEL):
         """
         Initialize the Groq client.
         
         Args:
-            model_name (str): The model to use (default: llama3-8b-8192)
+            model_name (str): The model to use (default: llama-4-scout-17b-16e-instruct)
         """
         # Get API key from environment variables
         self.api_key = os.environ.get('GROQ_API_KEY')
@@ -16,42 +432,233 @@ class GroqClient:
             raise ValueError("GROQ_API_KEY environment variable is not set")
             
         self.model_name = model_name
-        self.client = Groq(api_key=self.api_key)
+        self.client = _shared_sdk_client(self.api_key)
     
-    def generate(self, prompt, system_prompt=None):
+    def generate(self, prompt, system_prompt=None, use_cache=True, max_tokens=None):
         """
         Generate a response using Groq.
         
+        Identical (model, system_prompt, prompt) requests are served from the
+        response cache; pass use_cache=False (or call inside fresh_responses())
+        to force a fresh completion.
+        Requests go through the shared rate limiter and transient failures are
+        retried with backoff.
+        
         Args:
             prompt (str): The user prompt
             system_prompt (str, optional): The system prompt
+            use_cache (bool): Serve this call from the response cache if possible
+            max_tokens (int, optional): Cap on the completion length; also sizes the rate limit reservation
             
         Returns:
             str: Generated response
+            
+        Raises:
+            GroqRateLimitError: Still rate limited after all retries, or told to wait longer than GROQ_BACKOFF_MAX
+            GroqAPIError: The request failed
+        """
+        sink = _token_sink.get()
+        if sink is not None:
+            chunks = []
+            for chunk in self.generate_stream(prompt, system_prompt, use_cache, max_tokens):
+                chunks.append(chunk)
+                sink(chunk)
+            return "".join(chunks)
+        
+        started = time.monotonic()
+        cache = get_response_cache()
+        cache_key = response_cache_key(self.model_name, prompt, system_prompt, max_tokens)
+        if use_cache and not _fresh_responses.get():
+            cached = cache.get(cache_key)
+            if cached is not None:
+                logger.debug(f"Serving cached Groq response for '{self.model_name}'")
+                _record_usage(None, cached=True, model=self.model_name, started=started)
+                return cached
+        
+        logger.info(f"Sending request to Groq for '{self.model_name}'")
+        reserved = _reserve_tokens(prompt, system_prompt, max_tokens)
+        response = self._create(reserved, max_tokens, messages=self._build_messages(prompt, system_prompt))
+        
+        usage = getattr(response, 'usage', None)
+        _settle(reserved, usage)
+        _record_usage(usage, model=self.model_name, started=started)
+        
+        # Extract and return the response content
+        content = response.choices[0].message.content
+        if content:
+            cache.set(cache_key, content)
+        return content
+    
+    def generate_stream(self, prompt, system_prompt=None, use_cache=True, max_tokens=None):
         """
+        Generate a response using Groq, yielding text deltas as they arrive.
+        
+        A cached response is yielded as a single chunk. The full response is
+        cached once the stream completes. Opening the stream is rate limited
+        and retried like generate(); a failure mid-stream is not retried.
+        
+        Args:
+            prompt (str): The user prompt
+            system_prompt (str, optional): The system prompt
+            use_cache (bool): Serve this call from the response cache if possible
+            max_tokens (int, optional): Cap on the completion length; also sizes the rate limit reservation
+            
+        Yields:
+            str: Successive pieces of the generated response
+            
+        Raises:
+            GroqRateLimitError: Still rate limited after all retries, or told to wait longer than GROQ_BACKOFF_MAX
+            GroqAPIError: The request failed
+        """
+        started = time.monotonic()
+        cache = get_response_cache()
+        cache_key = response_cache_key(self.model_name, prompt, system_prompt, max_tokens)
+        if use_cache and not _fresh_responses.get():
+            cached = cache.get(cache_key)
+            if cached is not None:
+                logger.debug(f"Serving cached Groq response for '{self.model_name}'")
+                _record_usage(None, cached=True, model=self.model_name, started=started)
+                yield cached
+                return
+        
+        logger.info(f"Streaming request to Groq for '{self.model_name}'")
+        reserved = _reserve_tokens(prompt, system_prompt, max_tokens)
+        stream = self._create(reserved, max_tokens, messages=self._build_messages(prompt, system_prompt), stream=True)
+        
+        chunks = []
+        usage = None
+        used = None
+        completed = False
         try:
-            # Prepare messages
-            messages = []
-            
-            # Add system prompt if provided
-            if system_prompt:
-                messages.append({"role": "system", "content": system_prompt})
-            
-            # Add user prompt
-            messages.append({"role": "user", "content": prompt})
-            
-            print(f"Sending request to Groq for '{self.model_name}'...")
-            
-            # Send request to Groq
-            response = self.client.chat.completions.create(
-                model=self.model_name,
-                messages=messages
-            )
-            
-            # Extract and return the response content
-            return response.choices[0].message.content
-                
-        except Exception as e:
-            error_msg = f"Error connecting to Groq API: {str(e)}"
-            print(error_msg)
-            return error_msg
\ No newline at end of file
+            for chunk in stream:
+                # Groq reports usage on the final chunk
+                x_groq = getattr(chunk, 'x_groq', None)
+                usage = getattr(x_groq, 'usage', None) or getattr(chunk, 'usage', None) or usage
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    chunks.append(delta)
+                    yield delta
+            completed = True
+        except groq.APIError as e:
+            used = 0
+            raise GroqAPIError(f"Groq stream interrupted: {str(e)}", getattr(e, 'status_code', None)) from e
+        finally:
+            # Also reached when the consumer stops early (GeneratorExit): release the
+            # connection and account for the call; an abandoned stream keeps its reservation
+            close = getattr(stream, 'close', None)
+            if close is not None:
+                close()
+            if completed:
+                _settle(reserved, usage)
+            else:
+                get_rate_limiter().settle(reserved, used)
+            _record_usage(usage, model=self.model_name, started=started)
+        
+        content = "".join(chunks)
+        if completed and content:
+            cache.set(cache_key, content)
+    
+    def _create(self, reserved_tokens, max_tokens=None, **kwargs):
+        """Send one chat completion request through the rate limiter, retrying transient failures."""
+        if max_tokens:
+            kwargs['max_tokens'] = max_tokens
+        attempt = 0
+        while True:
+            get_rate_limiter().acquire(reserved_tokens)
+            try:
+                return self.client.chat.completions.create(model=self.model_name, **kwargs)
+            except Exception as e:
+                delay = _retry_delay(e, attempt, reserved_tokens)
+            attempt += 1
+            time.sleep(delay)
+    
+    @staticmethod
+    def _build_messages(prompt, system_prompt=None):
+        messages = []
+        
+        # Add system prompt if provided
+        if system_prompt:
+            messages.append({"role": "system", "content": system_prompt})
+        
+        # Add user prompt
+        messages.append({"role": "user", "content": prompt})
+        return messages
+
+class AsyncGroqClient:
+    """
+    asyncio counterpart of GroqClient.
+    
+    Shares the response cache, usage tracking and rate limiter with GroqClient.
+    Calls made inside one async_groq_session() share a pooled AsyncGroq
+    client, so many requests can be in flight on a single thread.
+    """
+    
+    def __init__(self, model_name=DEFAULT_MODEL):
+        """
+        Initialize the async Groq client.
+        
+        Args:
+            model_name (str): The model to use (default: llama-4-scout-17b-16e-instruct)
+        """
+        self.api_key = os.environ.get('GROQ_API_KEY')
+        if not self.api_key:
+            raise ValueError("GROQ_API_KEY environment variable is not set")
+            
+        self.model_name = model_name
+    
+    async def generate(self, prompt, system_prompt=None, use_cache=True, max_tokens=None):
+        """
+        Generate a response using Groq without blocking the event loop.
+        
+        Args:
+            prompt (str): The user prompt
+            system_prompt (str, optional): The system prompt
+            use_cache (bool): Serve this call from the response cache if possible
+            max_tokens (int, optional): Cap on the completion length; also sizes the rate limit reservation
+            
+        Returns:
+            str: Generated response
+            
+        Raises:
+            GroqRateLimitError: Still rate limited after all retries, or told to wait longer than GROQ_BACKOFF_MAX
+            GroqAPIError: The request failed
+        """
+        started = time.monotonic()
+        cache = get_response_cache()
+        cache_key = response_cache_key(self.model_name, prompt, system_prompt, max_tokens)
+        if use_cache and not _fresh_responses.get():
+            # The cache is SQLite on disk; keep its I/O off the event loop
+            cached = await asyncio.to_thread(cache.get, cache_key)
+            if cached is not None:
+                logger.debug(f"Serving cached Groq response for '{self.model_name}'")
+                _record_usage(None, cached=True, model=self.model_name, started=started)
+                return cached
+        
+        logger.info(f"Sending async request to Groq for '{self.model_name}'")
+        reserved = _reserve_tokens(prompt, system_prompt, max_tokens)
+        response = await self._create(reserved, max_tokens, messages=GroqClient._build_messages(prompt, system_prompt))
+        
+        usage = getattr(response, 'usage', None)
+        _settle(reserved, usage)
+        _record_usage(usage, model=self.model_name, started=started)
+        
+        content = response.choices[0].message.content
+        if content:
+            await asyncio.to_thread(cache.set, cache_key, content)
+        return content
+    
+    async def _create(self, reserved_tokens, max_tokens=None, **kwargs):
+        if max_tokens:
+            kwargs['max_tokens'] = max_tokens
+        attempt = 0
+        async with _async_sdk_client(self.api_key) as sdk_client:
+            while True:
+                await get_rate_limiter().acquire_async(reserved_tokens)
+                try:
+                    return await sdk_client.chat.completions.create(model=self.model_name, **kwargs)
+                except Exception as e:
+                    delay = _retry_delay(e, attempt, reserved_tokens)
+                attempt += 1
+                await asyncio.sleep(delay)
@@ -0,0 +1,131 @@
+# File: models/image_downloader.py
+
+"""
+Concurrent image downloads for packaged course materials.
+
+Downloads run on a bounded thread pool sharing one pooled requests.Session.
+Requests for a URL that is already being fetched wait on the same download
+instead of starting another. Bodies are streamed to a temporary file next to
+the destination and renamed into place, and every download has an overall
+time budget (IMAGE_DOWNLOAD_TIMEOUT), not just a per-read timeout, so one slow
+server cannot hold up a package for longer than that.
+"""
+
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+
+
+class ImageDownloader:
+    """Bounded, deduplicating downloader of remote images to local files."""
+
+    def __init__(self, max_workers: int = 8, timeout: float = 30):
+        """
+        Args:
+            max_workers: Concurrent downloads (and pooled connections per host)
+            timeout: Seconds allowed for one download, from connect to last byte
+        """
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="image-download")
+        # URL -> (future, destination) of the download in progress
+        self._in_flight: Dict[str, Tuple[Future, str]] = {}
+        self._lock = threading.Lock()
+
+    def download(self, url: str, dest: str) -> Future:
+        """
+        Fetch ``url`` into ``dest`` in the background.
+
+        The future resolves to True once ``dest`` exists, or False if the
+        download failed. A URL already being fetched is not requested twice;
+        its file is copied to ``dest`` when that download finishes.
+        """
+        if os.path.exists(dest):
+            future = Future()
+            future.set_result(True)
+            return future
+
+        with self._lock:
+            in_flight = self._in_flight.get(url)
+            if in_flight is None:
+                future = self._executor.submit(self._fetch, url, dest)
+                self._in_flight[url] = (future, dest)
+        if in_flight is None:
+            # Outside the lock: the callback runs at once if the download already finished
+            future.add_done_callback(lambda _: self._finished(url, future))
+            return future
+
+        first, first_dest = in_flight
+        copied = Future()
+        first.add_done_callback(
+            lambda done: copied.set_result(done.result() and self._copy(first_dest, dest))
+        )
+        return copied
+
+    def _finished(self, url: str, future: Future) -> None:
+        with self._lock:
+            if self._in_flight.get(url, (None,))[0] is future:
+                del self._in_flight[url]
+
+    def _fetch(self, url: str, dest: str) -> bool:
+        deadline = time.monotonic() + self.timeout
+        directory = os.path.dirname(dest)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                with self.session.get(url, stream=True, timeout=self.timeout) as response:
+                    response.raise_for_status()
+                    for chunk in response.iter_content(CHUNK_SIZE):
+                        if time.monotonic() > deadline:
+                            raise TimeoutError(f"exceeded {self.timeout:.0f}s")
+                        f.write(chunk)
+            os.replace(tmp_path, dest)
+            return True
+        except Exception as e:
+            logger.warning(f"[Download Error] {url}: {e}")
+            return False
+        finally:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+
+    @staticmethod
+    def _copy(source: str, dest: str) -> bool:
+        if source == dest or os.path.exists(dest):
+            return True
+        try:
+            shutil.copyfile(source, dest)
+            return True
+        except OSError as e:
+            logger.warning(f"Could not copy downloaded image {source} to {dest}: {e}")
+            return False
+
+
+_downloader: Optional[ImageDownloader] = None
+_downloader_lock = threading.Lock()
+
+
+def get_image_downloader() -> ImageDownloader:
+    """Process-wide downloader configured from IMAGE_DOWNLOAD_WORKERS / IMAGE_DOWNLOAD_TIMEOUT."""
+    global _downloader
+    with _downloader_lock:
+        if _downloader is None:
+            _downloader = ImageDownloader(
+                max_workers=int(os.environ.get("IMAGE_DOWNLOAD_WORKERS", 8)),
+                timeout=float(os.environ.get("IMAGE_DOWNLOAD_TIMEOUT", 30)),
+            )
+        return _downloader
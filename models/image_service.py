@@ -13,14 +13,26 @@ import logging
 import time
 import hashlib
 import re
-from typing import Dict, List, Optional, Tuple, Any
-from dataclasses import dataclass
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeoutError
+from typing import Dict, List, Optional, Set, Tuple, Any
+from dataclasses import dataclass, asdict
 from urllib.parse import urlencode
 import json
 
+from models import json_codec
+from models.cache import SQLiteCache, DEFAULT_CACHE_DIR
+from models.circuit_breaker import CircuitOpenError, get_breaker, http_failure
+
 # Configure logging
 logger = logging.getLogger(__name__)
 
+# Provider searches run here so one search can query every API at once
+_provider_executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get('IMAGE_PROVIDER_WORKERS', 6)),
+    thread_name_prefix="image-search"
+)
+
 @dataclass
 class ImageData:
     """Data structure for image information."""
@@ -37,35 +49,128 @@ class ImageData:
     photographer_url: Optional[str] = None
 
 
+class PartialImageResults(list):
+    """Images a provider found before its circuit opened mid-search; used, but never cached."""
+
+
+def image_url_key(url: str) -> bytes:
+    """Compact 8-byte key for an image URL, so trackers need not keep the URLs themselves."""
+    return hashlib.blake2b(url.encode('utf-8'), digest_size=8).digest()
+
+
 class ImageTracker:
-    """Track used images to prevent duplicates across modules."""
+    """
+    Track used images to prevent duplicates across modules.
+    
+    A tracker is scoped to one generation: images are remembered by
+    ``image_url_key`` and everything is dropped by ``release()`` (or on leaving
+    a ``with`` block) when the generation finishes.
+    """
     
     def __init__(self):
-        self.used_images = set()
-        self.used_urls = set()
-        self.module_images = {}  # module_id -> [image_urls]
+        self.used_urls: Set[bytes] = set()
+        self.module_images: Dict[int, List[bytes]] = {}  # module_id -> [url keys]
+    
+    def __enter__(self) -> 'ImageTracker':
+        return self
+    
+    def __exit__(self, *exc_info) -> None:
+        self.release()
     
     def is_image_used(self, image_url: str) -> bool:
         """Check if an image URL has already been used."""
-        return image_url in self.used_urls
+        return image_url_key(image_url) in self.used_urls
     
     def add_image(self, module_id: int, image_data: ImageData) -> None:
         """Add an image to the tracker for a specific module."""
-        self.used_urls.add(image_data.url)
-        if module_id not in self.module_images:
-            self.module_images[module_id] = []
-        self.module_images[module_id].append(image_data.url)
+        key = image_url_key(image_data.url)
+        self.used_urls.add(key)
+        self.module_images.setdefault(module_id, []).append(key)
     
-    def get_module_images(self, module_id: int) -> List[str]:
-        """Get all image URLs used for a specific module."""
+    def get_module_images(self, module_id: int) -> List[bytes]:
+        """Get the URL keys (see image_url_key) of the images used for a specific module."""
         return self.module_images.get(module_id, [])
     
     def clear_module(self, module_id: int) -> None:
         """Clear images for a specific module (useful for regeneration)."""
-        if module_id in self.module_images:
-            for url in self.module_images[module_id]:
-                self.used_urls.discard(url)
-            del self.module_images[module_id]
+        for key in self.module_images.pop(module_id, []):
+            self.used_urls.discard(key)
+    
+    def release(self) -> None:
+        """Forget every tracked image; called when the generation finishes."""
+        self.used_urls.clear()
+        self.module_images.clear()
+
+
+class ImageSearchCache:
+    """
+    Search results cached in this process only (IMAGE_SEARCH_CACHE_BACKEND=memory).
+    Subclass it to plug in a shared backend.
+    """
+    
+    def __init__(self):
+        self._results = {}
+        self._lock = threading.Lock()
+    
+    def get(self, key: str) -> Optional[List[ImageData]]:
+        with self._lock:
+            return self._results.get(key)
+    
+    def set(self, key: str, images: List[ImageData]) -> None:
+        with self._lock:
+            self._results[key] = list(images)
+    
+    def stats(self) -> Dict[str, Any]:
+        return {'backend': 'memory', 'entries': len(self._results)}
+
+
+class SQLiteImageSearchCache(ImageSearchCache):
+    """Search results shared by every worker on local disk, with TTL and size-based LRU eviction."""
+    
+    def __init__(self, path: str, ttl: Optional[float] = None, max_bytes: Optional[int] = None):
+        self.store = SQLiteCache(path, table='image_search', ttl=ttl, max_bytes=max_bytes)
+    
+    def get(self, key: str) -> Optional[List[ImageData]]:
+        value = self.store.get(key)
+        if value is None:
+            return None
+        try:
+            return [ImageData(**image) for image in json_codec.loads(value)]
+        except (ValueError, TypeError) as e:
+            logger.warning(f"Ignoring unreadable cached image search {key}: {e}")
+            return None
+    
+    def set(self, key: str, images: List[ImageData]) -> None:
+        self.store.set(key, json_codec.dumps([asdict(image) for image in images]))
+    
+    def stats(self) -> Dict[str, Any]:
+        return {'backend': 'sqlite', 'path': self.store.path, **self.store.stats()}
+
+
+def get_image_search_cache() -> ImageSearchCache:
+    """
+    Build the image search cache from the environment.
+    
+    IMAGE_SEARCH_CACHE_BACKEND: 'sqlite' (default) or 'memory'
+    IMAGE_SEARCH_CACHE_PATH: SQLite file (default: cache/image_search.sqlite3)
+    IMAGE_SEARCH_CACHE_TTL: Seconds before a search is repeated (default: 3 days)
+    IMAGE_SEARCH_CACHE_MAX_MB: Size budget before least recently used searches are evicted (default: 64)
+    """
+    backend = os.environ.get('IMAGE_SEARCH_CACHE_BACKEND', 'sqlite').lower()
+    if backend == 'sqlite':
+        return SQLiteImageSearchCache(
+            os.environ.get('IMAGE_SEARCH_CACHE_PATH', os.path.join(DEFAULT_CACHE_DIR, 'image_search.sqlite3')),
+            ttl=float(os.environ.get('IMAGE_SEARCH_CACHE_TTL', 3 * 24 * 3600)),
+            max_bytes=int(float(os.environ.get('IMAGE_SEARCH_CACHE_MAX_MB', 64)) * 1024 * 1024)
+        )
+    return ImageSearchCache()
+
+
+def image_search_cache_key(search_terms: List[str], providers: List[str], limit: int) -> str:
+    """Hash of a normalized search: case and spacing of the terms do not matter."""
+    terms = [' '.join(term.lower().split()) for term in search_terms]
+    payload = json.dumps([terms, sorted(providers), limit])
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
 
 
 class EducationalImageService:
@@ -88,14 +193,18 @@ class EducationalImageService:
         self.pixabay_url = "https://pixabay.com/api/"
         self.pexels_url = "https://api.pexels.com/v1/search"
         
+        # Seconds per provider request, and for a whole search across providers
+        self.provider_timeout = float(os.environ.get('IMAGE_PROVIDER_TIMEOUT', 10))
+        self.search_deadline = float(os.environ.get('IMAGE_SEARCH_DEADLINE', 15))
+        
         # Session for connection pooling
         self.session = requests.Session()
         self.session.headers.update({
             'User-Agent': 'Educational-Course-Materials-Generator/1.0'
         })
         
-        # Cache for search results (optional)
-        self.cache = {}
+        # Search results, shared across workers and restarts (see get_image_search_cache)
+        self.cache = get_image_search_cache()
         
         logger.info("Educational Image Service initialized")
         self._log_api_status()
@@ -115,6 +224,15 @@ class EducationalImageService:
         else:
             logger.warning("No image API keys configured - will use placeholder images")
     
+    def _configured_providers(self) -> List[str]:
+        return [name for name, key in (('unsplash', self.unsplash_key), ('pexels', self.pexels_key),
+                                       ('pixabay', self.pixabay_key)) if key]
+    
+    def _provider_get(self, provider: str, url: str, **kwargs) -> requests.Response:
+        """GET through the provider's circuit breaker; raises CircuitOpenError while it is open."""
+        return get_breaker(provider).call(self.session.get, url, timeout=self.provider_timeout,
+                                          is_failure=http_failure, **kwargs)
+    
     def _generate_educational_search_terms(self, topic: str, context: str = "") -> List[str]:
         """
         Generate search terms that maintain topic integrity for educational content.
@@ -144,7 +262,9 @@ class EducationalImageService:
         
         images = []
         
-        for term in search_terms[:3]:  # Try top 3 search terms
+        for attempt, term in enumerate(search_terms[:3]):  # Try top 3 search terms
+            if attempt:
+                time.sleep(0.1)  # Rate limiting between terms
             try:
                 # Support higher limits for 12+ modules
                 params = {
@@ -159,12 +279,7 @@ class EducationalImageService:
                 }
                 
                 logger.info(f"🔍 DEBUGGING: Searching Unsplash for: '{term}' requesting {min(limit, 30)} images")
-                response = self.session.get(
-                    self.unsplash_url, 
-                    params=params, 
-                    headers=headers, 
-                    timeout=10
-                )
+                response = self._provider_get('unsplash', self.unsplash_url, params=params, headers=headers)
                 
                 if response.status_code == 200:
                     data = response.json()
@@ -210,11 +325,13 @@ class EducationalImageService:
                 else:
                     logger.warning(f"🔍 DEBUGGING: Unsplash API error for '{term}': {response.status_code}")
                     
+            except CircuitOpenError as e:
+                logger.warning(f"🔍 DEBUGGING: Unsplash circuit opened mid-search, keeping {len(images)} images: {e}")
+                images = PartialImageResults(images)
+                break
             except requests.RequestException as e:
                 logger.error(f"🔍 DEBUGGING: Unsplash request failed for '{term}': {e}")
                 continue
-            
-            time.sleep(0.1)  # Rate limiting
         
         logger.info(f"🔍 DEBUGGING: Final result - Found {len(images)} images from Unsplash (requested {limit})")
         return images
@@ -227,7 +344,9 @@ class EducationalImageService:
         
         images = []
         
-        for term in search_terms[:3]:  
+        for attempt, term in enumerate(search_terms[:3]):  
+            if attempt:
+                time.sleep(0.1)  # Rate limiting between terms
             try:
                 
                 params = {
@@ -244,7 +363,7 @@ class EducationalImageService:
                 }
                 
                 logger.info(f"🔍 DEBUGGING: Searching Pixabay for: '{term}' with params: {params}")
-                response = self.session.get(self.pixabay_url, params=params, timeout=10)
+                response = self._provider_get('pixabay', self.pixabay_url, params=params)
                 
                 if response.status_code == 200:
                     data = response.json()
@@ -296,11 +415,13 @@ class EducationalImageService:
                     logger.warning(f"🔍 DEBUGGING: Pixabay API error for '{term}': {response.status_code}")
                     logger.warning(f"🔍 DEBUGGING: Response content: {response.text[:200]}...")
                     
+            except CircuitOpenError as e:
+                logger.warning(f"🔍 DEBUGGING: Pixabay circuit opened mid-search, keeping {len(images)} images: {e}")
+                images = PartialImageResults(images)
+                break
             except requests.RequestException as e:
                 logger.error(f"🔍 DEBUGGING: Pixabay request failed for '{term}': {e}")
                 continue
-            
-            time.sleep(0.1)  # Rate limiting
         
         logger.info(f"🔍 DEBUGGING: Final result - Found {len(images)} images from Pixabay")
         return images
@@ -314,7 +435,9 @@ class EducationalImageService:
         images = []
         headers = {'Authorization': self.pexels_key}
         
-        for term in search_terms[:3]:  # Try top 3 search terms
+        for attempt, term in enumerate(search_terms[:3]):  # Try top 3 search terms
+            if attempt:
+                time.sleep(0.1)  # Rate limiting between terms
             try:
                 params = {
                     'query': term,
@@ -323,12 +446,7 @@ class EducationalImageService:
                 }
                 
                 logger.debug(f"Searching Pexels for: '{term}'")
-                response = self.session.get(
-                    self.pexels_url, 
-                    params=params, 
-                    headers=headers, 
-                    timeout=10
-                )
+                response = self._provider_get('pexels', self.pexels_url, params=params, headers=headers)
                 
                 if response.status_code == 200:
                     data = response.json()
@@ -368,11 +486,13 @@ class EducationalImageService:
                 else:
                     logger.warning(f"Pexels API error for '{term}': {response.status_code}")
                     
+            except CircuitOpenError as e:
+                logger.warning(f"Pexels circuit opened mid-search, keeping {len(images)} images: {e}")
+                images = PartialImageResults(images)
+                break
             except requests.RequestException as e:
                 logger.error(f"Pexels request failed for '{term}': {e}")
                 continue
-            
-            time.sleep(0.1)  # Rate limiting
         
         logger.info(f"Found {len(images)} images from Pexels")
         return images
@@ -402,6 +522,101 @@ class EducationalImageService:
         logger.info(f"Generated {len(placeholders)} placeholder images for '{topic}'")
         return placeholders
     
+    def _search_providers(self, search_terms: List[str], limit: int, enough, on_complete) -> List[ImageData]:
+        """
+        Query every configured provider concurrently, merging results as they arrive.
+        
+        Returns as soon as ``enough(images)`` is true, every provider has
+        answered, or the search deadline passes. Providers still running keep
+        going in the background; ``on_complete`` receives the results of all
+        providers (in provider order) once the last one finishes. Providers
+        whose circuit breaker is open are skipped (and ones whose circuit opens
+        mid-search return what they found so far); ``on_complete`` is then not
+        called, so the partial result is not cached.
+        """
+        configured = self._configured_providers()
+        providers = [name for name in configured if get_breaker(name).available()]
+        skipped = len(providers) < len(configured)
+        if skipped:
+            logger.warning(f"Skipping unhealthy image providers: "
+                           f"{', '.join(name for name in configured if name not in providers)}")
+        if not providers:
+            if not skipped:
+                on_complete([])
+            return []
+        
+        results = {}
+        results_lock = threading.Lock()
+        
+        def finished(name, future):
+            nonlocal skipped
+            try:
+                images = future.result()
+            except CircuitOpenError as e:
+                logger.warning(f"{name.title()} search skipped: {e}")
+                images = []
+                skipped = True
+            except Exception as e:
+                logger.error(f"{name.title()} search failed: {e}")
+                images = []
+            if isinstance(images, PartialImageResults):
+                skipped = True
+            with results_lock:
+                results[name] = images
+                complete = len(results) == len(providers) and not skipped
+            if complete:
+                on_complete([image for provider in providers for image in results[provider]])
+        
+        futures = {}
+        for name in providers:
+            future = _provider_executor.submit(getattr(self, f"_search_{name}"), search_terms, limit)
+            futures[future] = name
+            future.add_done_callback(lambda f, name=name: finished(name, f))
+        
+        merged = []
+        seen_urls = set()
+        try:
+            for future in as_completed(futures, timeout=self.search_deadline):
+                try:
+                    images = future.result()
+                except Exception:
+                    images = []  # logged by finished()
+                for image in images:
+                    if image.url not in seen_urls:
+                        seen_urls.add(image.url)
+                        merged.append(image)
+                logger.info(f"🔍 {futures[future].upper()}: Collected {len(images)} images")
+                if enough(merged):
+                    break
+        except FuturesTimeoutError:
+            logger.warning(f"Image search deadline of {self.search_deadline:.0f}s reached, "
+                           f"continuing with {len(merged)} images")
+        return merged
+    
+    def _unique_images(self, topic: str, all_images: List[ImageData], target: int) -> List[ImageData]:
+        """Drop duplicate URLs and pad with placeholders up to ``target`` images."""
+        # If no images found, use placeholders
+        if not all_images:
+            logger.warning(f"No images found for '{topic}', using placeholders")
+            all_images = self._generate_placeholder_images(topic, target)
+        
+        # Remove duplicates by URL
+        unique_images = []
+        seen_urls = set()
+        
+        for image in all_images:
+            if image.url not in seen_urls:
+                unique_images.append(image)
+                seen_urls.add(image.url)
+        
+        # If still not enough unique images, add placeholders to reach target
+        if len(unique_images) < target:
+            needed = target - len(unique_images)
+            logger.info(f"🔍 PADDING: Adding {needed} placeholder images to reach target of {target}")
+            placeholders = self._generate_placeholder_images(f"{topic}_additional", needed)
+            unique_images.extend(placeholders)
+        return unique_images
+    
     def search_educational_images(self, 
                                 topic: str, 
                                 context: str = "", 
@@ -416,11 +631,14 @@ class EducationalImageService:
         # Generate educational search terms (maintains topic integrity)
         search_terms = self._generate_educational_search_terms(topic, context)
         
-        # Create cache key
-        cache_key = f"{topic}_{context}_{count}"
-        if cache_key in self.cache:
+        # Calculate how many images we need to support 12 modules
+        images_needed_for_12_modules = 12 * count  # 12 * 3 = 36 images
+        
+        # Create cache key (context does not change the search terms, so it is not part of it)
+        cache_key = image_search_cache_key(search_terms, self._configured_providers(), images_needed_for_12_modules)
+        cached_images = self.cache.get(cache_key)
+        if cached_images is not None:
             logger.debug(f"Using cached results for '{topic}'")
-            cached_images = self.cache[cache_key]
             if tracker:
                 # Smart reuse logic
                 unused_images = [img for img in cached_images if not tracker.is_image_used(img.url)]
@@ -441,67 +659,25 @@ class EducationalImageService:
         
         logger.info(f"🔍 CACHE MISS: No cached results for '{topic}', fetching from APIs...")
         
-        
-        # Calculate how many images we need to support 12 modules
-        images_needed_for_12_modules = 12 * count  # 12 * 3 = 36 images
         per_api_target = images_needed_for_12_modules // 3  # 36 / 3 = 12 images per API
         
         logger.info(f"🔍 TARGETING: {images_needed_for_12_modules} total images ({per_api_target} per API) to support 12 modules")
         
-        # Collect images from all APIs with increased limits
-        all_images = []
-        
-        # Try each API with higher limits
-        try:
-            # Unsplash: Get more images (was 8, now 15)
-            unsplash_images = self._search_unsplash(search_terms, per_api_target + 3)  # 12 + 3 = 15
-            all_images.extend(unsplash_images)
-            logger.info(f"🔍 UNSPLASH: Collected {len(unsplash_images)} images")
-        except Exception as e:
-            logger.error(f"Unsplash search failed: {e}")
-        
-        
-        try:
-            # Pexels: Get more images (was 8, now 15)
-            pexels_images = self._search_pexels(search_terms, per_api_target + 3)  # 12 + 3 = 15
-            all_images.extend(pexels_images)
-            logger.info(f"🔍 PEXELS: Collected {len(pexels_images)} images")
-        except Exception as e:
-            logger.error(f"Pexels search failed: {e}")
-
-        try:
-            # Pixabay: Get more images (was 8, now 15)  
-            pixabay_images = self._search_pixabay(search_terms, per_api_target + 3)  # 12 + 3 = 15
-            all_images.extend(pixabay_images)
-            logger.info(f"🔍 PIXABAY: Collected {len(pixabay_images)} images")
-        except Exception as e:
-            logger.error(f"Pixabay search failed: {e}")
-        
-        # If no images found, use placeholders
-        if not all_images:
-            logger.warning(f"No images found for '{topic}', using placeholders")
-            all_images = self._generate_placeholder_images(topic, images_needed_for_12_modules)
-        
-        # Remove duplicates by URL
-        unique_images = []
-        seen_urls = set()
-        
-        for image in all_images:
-            if image.url not in seen_urls:
-                unique_images.append(image)
-                seen_urls.add(image.url)
-        
-        # If still not enough unique images, add placeholders to reach target
-        if len(unique_images) < images_needed_for_12_modules:
-            needed = images_needed_for_12_modules - len(unique_images)
-            logger.info(f"🔍 PADDING: Adding {needed} placeholder images to reach target of {images_needed_for_12_modules}")
-            placeholders = self._generate_placeholder_images(f"{topic}_additional", needed)
-            unique_images.extend(placeholders)
-        
-        # Cache ALL collected images (not just requested count)
-        cache_size = len(unique_images)  # Cache everything we found
-        self.cache[cache_key] = unique_images[:cache_size]
-        logger.info(f"🔍 CACHING: Stored {len(self.cache[cache_key])} images in cache for '{topic}' (target was {images_needed_for_12_modules})")
+        def enough(images):
+            unused = [img for img in images if not tracker or not tracker.is_image_used(img.url)]
+            return len(unused) >= count
+        
+        def cache_results(all_images):
+            # Runs once every provider has answered, possibly after this call returned
+            unique_images = self._unique_images(topic, all_images, images_needed_for_12_modules)
+            # Placeholders only mean every provider failed, so the search is retried next time instead
+            if any(image.source != 'placeholder' for image in unique_images):
+                self.cache.set(cache_key, unique_images)
+                logger.info(f"🔍 CACHING: Stored {len(unique_images)} images in cache for '{topic}' (target was {images_needed_for_12_modules})")
+        
+        # Collect images from all APIs at once with increased limits (12 + 3 = 15 each)
+        all_images = self._search_providers(search_terms, per_api_target + 3, enough, cache_results)
+        unique_images = self._unique_images(topic, all_images, images_needed_for_12_modules)
         
         # Return final images with tracker filtering
         if tracker:
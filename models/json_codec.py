@@ -0,0 +1,138 @@
+# File: models/json_codec.py
+
+"""
+Pluggable JSON serialization.
+
+Uses orjson when it is installed, then msgspec, and falls back to the standard
+library otherwise (set JSON_CODEC=orjson|msgspec|json to force one). Storage
+uses compact ``dumps``; ``dumps_pretty`` is only for files users download.
+
+Benchmark on the analyses in data/ with::
+
+    python -m models.json_codec [files...]
+"""
+
+import json
+import logging
+import os
+from typing import Any, Callable, Dict, Union
+
+logger = logging.getLogger(__name__)
+
+
+def _stdlib_codec() -> Dict[str, Callable]:
+    return {
+        "dumps": lambda obj: json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8"),
+        "dumps_pretty": lambda obj: json.dumps(obj, indent=2),
+        "loads": json.loads,
+    }
+
+
+def _orjson_codec() -> Dict[str, Callable]:
+    import orjson
+
+    def dumps(obj):
+        try:
+            return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+        except orjson.JSONEncodeError:
+            # e.g. integers wider than 64 bits, which the stdlib still handles
+            return _STDLIB["dumps"](obj)
+
+    def dumps_pretty(obj):
+        try:
+            return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_INDENT_2).decode("utf-8")
+        except orjson.JSONEncodeError:
+            return _STDLIB["dumps_pretty"](obj)
+
+    return {"dumps": dumps, "dumps_pretty": dumps_pretty, "loads": orjson.loads}
+
+
+def _msgspec_codec() -> Dict[str, Callable]:
+    import msgspec
+
+    encoder = msgspec.json.Encoder()
+    decoder = msgspec.json.Decoder()
+
+    def dumps_pretty(obj):
+        return msgspec.json.format(encoder.encode(obj), indent=2).decode("utf-8")
+
+    return {"dumps": encoder.encode, "dumps_pretty": dumps_pretty, "loads": decoder.decode}
+
+
+_STDLIB = _stdlib_codec()
+_BACKENDS = {"orjson": _orjson_codec, "msgspec": _msgspec_codec, "json": _stdlib_codec}
+
+
+def _select_codec(name: str):
+    names = ("orjson", "msgspec", "json") if name == "auto" else (name,)
+    for candidate in names:
+        if candidate not in _BACKENDS:
+            raise ValueError(f"Unknown JSON_CODEC: {candidate}")
+        try:
+            return candidate, _BACKENDS[candidate]()
+        except ImportError:
+            if name != "auto":
+                logger.warning(f"JSON codec {candidate} is not installed, using the standard library")
+    return "json", _STDLIB
+
+
+BACKEND, _codec = _select_codec(os.environ.get("JSON_CODEC", "auto").lower())
+
+
+def dumps(obj: Any) -> bytes:
+    """Compact UTF-8 JSON, for storage."""
+    return _codec["dumps"](obj)
+
+
+def dumps_pretty(obj: Any) -> str:
+    """Indented JSON text, for exported files people read."""
+    return _codec["dumps_pretty"](obj)
+
+
+def loads(data: Union[bytes, str]) -> Any:
+    return _codec["loads"](data)
+
+
+def _benchmark(paths, rounds: int = 50) -> None:
+    import glob
+    import time
+
+    if not paths:
+        data_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
+        candidates = (glob.glob(os.path.join(data_dir, "*.json"))
+                      + glob.glob(os.path.join(data_dir, "*", "**", "*.json"), recursive=True))
+        paths = sorted(candidates, key=os.path.getsize, reverse=True)[:3]
+
+    codecs = {}
+    for name in _BACKENDS:
+        try:
+            codecs[name] = _BACKENDS[name]()
+        except ImportError:
+            print(f"{name}: not installed")
+
+    def timed(fn, arg):
+        start = time.perf_counter()
+        for _ in range(rounds):
+            fn(arg)
+        return (time.perf_counter() - start) / rounds * 1000
+
+    for path in paths:
+        with open(path, "rb") as f:
+            raw = f.read()
+        obj = json.loads(raw)
+        print(f"\n{os.path.relpath(path)} ({len(raw) / 1024:.0f} KB), ms per call over {rounds} rounds")
+        print(f"  {'codec':<8} {'decode':>8} {'encode':>8} {'pretty':>8} {'size KB':>8}")
+        rows = {}
+        for name, codec in codecs.items():
+            rows[name] = (timed(codec["loads"], raw), timed(codec["dumps"], obj), timed(codec["dumps_pretty"], obj))
+            print(f"  {name:<8} {rows[name][0]:>8.2f} {rows[name][1]:>8.2f} {rows[name][2]:>8.2f}"
+                  f" {len(codec['dumps'](obj)) / 1024:>8.0f}")
+        for name, row in rows.items():
+            if name != "json":
+                print(f"  {name} vs json: decode x{rows['json'][0] / row[0]:.1f}, encode x{rows['json'][1] / row[1]:.1f}")
+
+
+if __name__ == "__main__":
+    import sys
+    print(f"Active codec: {BACKEND}")
+    _benchmark(sys.argv[1:])
@@ -0,0 +1,186 @@
+# File: models/rate_limiter.py
+
+"""
+Token-bucket rate limiting and retry backoff for LLM API calls.
+
+A TokenBucketLimiter enforces a requests-per-minute and a tokens-per-minute
+budget at the same time. One limiter is shared by every sync and async client
+in the process, so parallel generation stays inside the account quota instead
+of bouncing off 429s.
+"""
+
+import asyncio
+import email.utils
+import logging
+import random
+import threading
+import time
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """A single bucket refilled continuously at ``per_minute / 60`` units per second."""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.available = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now: float) -> None:
+        self.available = min(self.capacity, self.available + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until ``amount`` units are available (0 if they are now)."""
+        if self.available >= amount:
+            return 0.0
+        return (amount - self.available) / self.rate
+
+
+class TokenBucketLimiter:
+    """
+    Thread-safe limiter with separate request and token budgets.
+
+    Callers reserve one request plus an estimate of the tokens a call will use,
+    then settle() the difference once the real usage is known. A budget of 0
+    (or None) disables that bucket. pause() stops every caller, e.g. for the
+    retry-after period of a 429.
+    """
+
+    def __init__(self, requests_per_minute: Optional[float] = None,
+                 tokens_per_minute: Optional[float] = None):
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _reserve(self, tokens: int) -> float:
+        """Take the budget for one call if available; otherwise return how long to wait."""
+        with self._lock:
+            now = time.monotonic()
+            if now < self.paused_until:
+                return self.paused_until - now
+
+            if self.tokens is not None:
+                # A single call larger than the whole budget waits for a full bucket
+                tokens = min(tokens, self.tokens.capacity)
+
+            wait = 0.0
+            for bucket, amount in ((self.requests, 1), (self.tokens, tokens)):
+                if bucket is not None:
+                    bucket.refill(now)
+                    wait = max(wait, bucket.wait_time(amount))
+            if wait > 0:
+                return wait
+
+            if self.requests is not None:
+                self.requests.available -= 1
+            if self.tokens is not None:
+                self.tokens.available -= tokens
+            return 0.0
+
+    def acquire(self, tokens: int = 0) -> float:
+        """Block until one request and ``tokens`` tokens are available. Returns seconds waited."""
+        waited = 0.0
+        while True:
+            wait = self._reserve(tokens)
+            if wait <= 0:
+                return waited
+            time.sleep(wait)
+            waited += wait
+
+    async def acquire_async(self, tokens: int = 0) -> float:
+        """Like acquire(), but sleeps without blocking the event loop."""
+        waited = 0.0
+        while True:
+            wait = self._reserve(tokens)
+            if wait <= 0:
+                return waited
+            await asyncio.sleep(wait)
+            waited += wait
+
+    def settle(self, reserved: int, used: Optional[int]) -> None:
+        """Correct the token bucket once a call's real usage is known."""
+        if self.tokens is None or used is None:
+            return
+        with self._lock:
+            self.tokens.refill(time.monotonic())
+            self.tokens.available = min(self.tokens.capacity, self.tokens.available + reserved - used)
+
+    def pause(self, seconds: float) -> None:
+        """Hold back every caller for ``seconds`` (extends, never shortens, a pause)."""
+        with self._lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def stats(self):
+        with self._lock:
+            now = time.monotonic()
+            for bucket in (self.requests, self.tokens):
+                if bucket is not None:
+                    bucket.refill(now)
+            return {
+                "requests_per_minute": self.requests.capacity if self.requests else None,
+                "requests_available": round(self.requests.available, 2) if self.requests else None,
+                "tokens_per_minute": self.tokens.capacity if self.tokens else None,
+                "tokens_available": round(self.tokens.available) if self.tokens else None,
+                "paused_for": round(max(0.0, self.paused_until - now), 2)
+            }
+
+
+class CompletionEstimate:
+    """
+    Running estimate of the tokens a completion uses, for sizing reservations.
+
+    Starts at ``initial`` and moves ``weight`` of the way towards every observed
+    completion (an exponential moving average), so reservations follow what calls
+    really use rather than a worst case. Thread-safe.
+    """
+
+    def __init__(self, initial: float, weight: float = 0.2):
+        self.average = float(initial)
+        self.weight = weight
+        self._lock = threading.Lock()
+
+    def observe(self, tokens: int) -> None:
+        with self._lock:
+            self.average += self.weight * (tokens - self.average)
+
+    def tokens(self) -> int:
+        return int(self.average) + 1
+
+
+def backoff_delay(attempt: int, base: float = 1.0, cap: float = 60.0,
+                  retry_after: Optional[float] = None) -> float:
+    """
+    Delay before retry number ``attempt`` (0-based).
+
+    Uses the server's retry-after when given (plus a little jitter so waiting
+    callers do not all return at once), otherwise exponential backoff with
+    full jitter. Never more than ``cap``.
+    """
+    if retry_after is not None:
+        return min(cap, retry_after + random.uniform(0, min(1.0, base)))
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Parse a Retry-After header given in seconds or as an HTTP date."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+
+def estimate_tokens(*texts: Optional[str]) -> int:
+    """Rough token count of prompt text (about four characters per token)."""
+    return sum(len(text) for text in texts if text) // 4 + 1
@@ -1,4 +1,4 @@
-from models.groq_client import GroqClient
+from models.groq_client import get_groq_client, llm_context
 
 def generate_task_analysis(course_topic, audience_type, job_titles="", audience_analysis=""):
     """Generate a detailed task analysis based on the course topic and audience characteristics"""
@@ -88,8 +88,9 @@ IMPORTANT GUIDELINES:
 """
 
     # Generate the analysis
-    client = GroqClient()
-    response = client.generate(prompt, system_prompt)
+    client = get_groq_client()
+    with llm_context(component='task_analysis'):
+        response = client.generate(prompt, system_prompt)
     
     # Simple post-processing to ensure proper spacing
     response = response.replace("**I. Task/Goal:**", "\n**I. Task/Goal:**")
@@ -12,9 +12,20 @@ import os
 from typing import Dict, List, Optional, Set
 from urllib.parse import quote
 import hashlib
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from models.circuit_breaker import get_breaker, http_failure
 
 logger = logging.getLogger(__name__)
 
+# The sections of a module look up their images here in parallel
+_section_executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get('TEXTBOOK_IMAGE_WORKERS', 8)),
+    thread_name_prefix="textbook-image"
+)
+
 class TextbookImageService:
     """Service to embed exactly 4 unique images per module with no duplicates."""
     
@@ -29,9 +40,14 @@ class TextbookImageService:
             'User-Agent': 'ASID Course Materials Generator 1.0'
         })
         
-        # Track used images per module to prevent duplicates
-        self.used_images_per_module: Dict[str, Set[str]] = {}
+        # Track used images per module to prevent duplicates. Entries only live
+        # while embed_images_in_content runs for that module, and images are kept
+        # as 8-byte hashes of their identifiers
+        self.used_images_per_module: Dict[str, Set[bytes]] = {}
         self.images_added_per_module: Dict[str, int] = {}
+        self._embed_calls = itertools.count(1)
+        # Guards used_images_per_module while sections are resolved in parallel
+        self._reservation_lock = threading.Lock()
         
         # Debug logging
         active_apis = []
@@ -65,10 +81,19 @@ class TextbookImageService:
         # Create a unique module key for tracking
         module_key = self._create_module_key(module_title, content)
         
-        # Reset tracking for this module
-        self.used_images_per_module[module_key] = set()
-        self.images_added_per_module[module_key] = 0
-        
+        # Track this call's images only until it finishes
+        with self._reservation_lock:
+            self.used_images_per_module[module_key] = set()
+            self.images_added_per_module[module_key] = 0
+        try:
+            return self._embed_images(content, module_title, module_key)
+        finally:
+            with self._reservation_lock:
+                self.used_images_per_module.pop(module_key, None)
+                self.images_added_per_module.pop(module_key, None)
+    
+    def _embed_images(self, content: str, module_title: str, module_key: str) -> str:
+        """Place up to 4 images into the content, tracked under ``module_key``."""
         logger.info(f"🎯 Starting image embedding for module: {module_title}")
         logger.info(f"📄 Target: Exactly 4 unique images per module")
         
@@ -80,32 +105,32 @@ class TextbookImageService:
         sections_for_images = self._select_sections_for_images(sections, target_count=4)
         logger.info(f"🎯 Selected {len(sections_for_images)} sections for image placement")
         
+        # Look up every selected section's image at once; _reserve_image keeps them unique
+        lookups = {
+            i: _section_executor.submit(self._get_unique_image_for_section,
+                                        sections[i], module_title, module_key, i)
+            for i in sections_for_images[:4]
+        }
+        
         enhanced_sections = []
         
         for i, section in enumerate(sections):
             enhanced_section = section
             
-            # Only add image if this section was selected AND we haven't reached limit
-            if (i in sections_for_images and 
-                self.images_added_per_module[module_key] < 4):
-                
-                logger.info(f"🖼️ Adding image {self.images_added_per_module[module_key] + 1}/4 to section {i+1}")
-                
-                # Get a unique image for this section
-                image_data = self._get_unique_image_for_section(
-                    section, module_title, module_key, i
-                )
+            if i in lookups:
+                try:
+                    image_data = lookups[i].result()
+                except Exception as e:
+                    logger.error(f"Image lookup for section {i+1} failed: {e}")
+                    image_data = None
                 
                 if image_data:
                     image_html = self._create_textbook_image_html(image_data, section, i+1)
                     enhanced_section = self._insert_image_in_section(section, image_html)
-                    
-                    # Track this image to prevent duplicates
-                    image_id = self._get_image_identifier(image_data)
-                    self.used_images_per_module[module_key].add(image_id)
                     self.images_added_per_module[module_key] += 1
                     
-                    logger.info(f"✅ Image {self.images_added_per_module[module_key]}/4 added from {image_data['source']}")
+                    logger.info(f"✅ Image {self.images_added_per_module[module_key]}/4 added to section {i+1} "
+                                f"from {image_data['source']}")
                 else:
                     logger.warning(f"❌ No unique image found for section {i+1}")
             
@@ -119,9 +144,9 @@ class TextbookImageService:
     
     def _create_module_key(self, module_title: str, content: str) -> str:
         """Create a unique key for this module to track images."""
-        # Use module title + content hash to create unique key
+        # Use module title + content hash, plus a call number so concurrent calls for the same module stay apart
         content_hash = hashlib.md5(content[:500].encode()).hexdigest()[:8]
-        return f"{module_title}_{content_hash}"
+        return f"{module_title}_{content_hash}_{next(self._embed_calls)}"
     
     def _select_sections_for_images(self, sections: List[str], target_count: int = 4) -> List[int]:
         """
@@ -178,7 +203,6 @@ class TextbookImageService:
         """
         # Try multiple search strategies to get varied results
         max_attempts = 5
-        used_images = self.used_images_per_module.get(module_key, set())
         
         for attempt in range(max_attempts):
             # Generate varied search terms for each attempt
@@ -196,8 +220,8 @@ class TextbookImageService:
             if image_data:
                 image_id = self._get_image_identifier(image_data)
                 
-                # Check if we've already used this image in this module
-                if image_id not in used_images:
+                # Claim the image, unless this module (or a parallel lookup for it) already has
+                if self._reserve_image(module_key, image_id):
                     logger.info(f"✅ Found unique image: {image_id[:20]}...")
                     return image_data
                 else:
@@ -208,6 +232,17 @@ class TextbookImageService:
         logger.warning(f"⚠️ Could not find unique image after {max_attempts} attempts")
         return None
     
+    def _reserve_image(self, module_key: str, image_id: str) -> bool:
+        """Mark an image as used by a module; False if it already was."""
+        image_key = hashlib.blake2b(image_id.encode('utf-8'), digest_size=8).digest()
+        with self._reservation_lock:
+            used_images = self.used_images_per_module.get(module_key)
+            # None once the embed call has finished and released its tracking
+            if used_images is None or image_key in used_images:
+                return False
+            used_images.add(image_key)
+            return True
+    
     def _generate_varied_search_term(self, section: str, module_title: str, 
                                    section_index: int, attempt: int) -> str:
         """
@@ -384,18 +419,18 @@ class TextbookImageService:
         """Get a single image from available APIs."""
         enhanced_search = self._enhance_search_term(search_term, image_type)
         
-        # Try APIs in order of preference
-        if self.unsplash_access_key:
+        # Try APIs in order of preference, skipping any whose circuit breaker is open
+        if self.unsplash_access_key and get_breaker('unsplash').available():
             image = self._get_unsplash_image(enhanced_search)
             if image:
                 return image
         
-        if self.pixabay_key:
+        if self.pixabay_key and get_breaker('pixabay').available():
             image = self._get_pixabay_image(enhanced_search, image_type)
             if image:
                 return image
         
-        if self.pexels_key:
+        if self.pexels_key and get_breaker('pexels').available():
             image = self._get_pexels_image(enhanced_search)
             if image:
                 return image
@@ -425,6 +460,10 @@ class TextbookImageService:
     # Include all the existing API methods (_get_unsplash_image, _get_pixabay_image, etc.)
     # [Previous API methods remain the same - I'll include the key ones]
     
+    def _provider_get(self, provider: str, url: str, **kwargs) -> requests.Response:
+        """GET through the provider's circuit breaker (shared with image_service)."""
+        return get_breaker(provider).call(self.session.get, url, timeout=10, is_failure=http_failure, **kwargs)
+    
     def _get_unsplash_image(self, search_term: str) -> Optional[Dict]:
         """Get image from Unsplash API."""
         try:
@@ -440,7 +479,7 @@ class TextbookImageService:
                 'Authorization': f'Client-ID {self.unsplash_access_key}'
             }
             
-            response = self.session.get(url, params=params, headers=headers, timeout=10)
+            response = self._provider_get('unsplash', url, params=params, headers=headers)
             
             if response.status_code == 200:
                 data = response.json()
@@ -486,7 +525,7 @@ class TextbookImageService:
                 'safesearch': 'true'
             }
             
-            response = self.session.get(url, params=params, timeout=10)
+            response = self._provider_get('pixabay', url, params=params)
             
             if response.status_code == 200:
                 data = response.json()
@@ -520,7 +559,7 @@ class TextbookImageService:
                 'Authorization': self.pexels_key
             }
             
-            response = self.session.get(url, params=params, headers=headers, timeout=10)
+            response = self._provider_get('pexels', url, params=params, headers=headers)
             
             if response.status_code == 200:
                 data = response.json()
@@ -0,0 +1,93 @@
+import pytest
+
+from models import circuit_breaker
+from models.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(circuit_breaker, 'time', clock)
+    return clock
+
+
+@pytest.fixture
+def breaker(clock):
+    return CircuitBreaker('test', window=60, min_calls=4, error_rate=0.5, slow_call=5, open_seconds=30)
+
+
+def fail():
+    raise ConnectionError("down")
+
+
+def trip(breaker):
+    for _ in range(breaker.min_calls):
+        with pytest.raises(ConnectionError):
+            breaker.call(fail)
+
+
+def test_opens_after_error_rate_and_rejects_without_calling(breaker):
+    breaker.call(lambda: 'ok')
+    breaker.call(lambda: 'ok')
+    with pytest.raises(ConnectionError):
+        breaker.call(fail)
+    assert breaker.state == CLOSED  # 1 of 3 calls failed, below min_calls anyway
+
+    with pytest.raises(ConnectionError):
+        breaker.call(fail)
+    assert breaker.state == OPEN
+
+    calls = []
+    with pytest.raises(CircuitOpenError):
+        breaker.call(calls.append, 'x')
+    assert calls == []
+    assert breaker.stats()['rejected'] == 1
+
+
+def test_half_open_probe_success_closes(breaker, clock):
+    trip(breaker)
+    clock.now += 30
+    assert breaker.available()
+    assert breaker.state == HALF_OPEN
+
+    # Only one probe at a time
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record(False, 0.1)
+    assert breaker.state == CLOSED
+    assert breaker.stats()['calls'] == 0
+
+
+def test_half_open_probe_failure_reopens(breaker, clock):
+    trip(breaker)
+    clock.now += 30
+    with pytest.raises(ConnectionError):
+        breaker.call(fail)
+    assert breaker.state == OPEN
+    assert breaker.times_opened == 2
+    assert breaker.stats()['retry_in_seconds'] == 30
+
+
+def test_slow_calls_count_as_failures(breaker):
+    for _ in range(4):
+        assert breaker.allow()
+        breaker.record(False, 6.0)
+    assert breaker.state == OPEN
+
+
+def test_failures_outside_the_window_are_forgotten(breaker, clock):
+    for _ in range(3):
+        with pytest.raises(ConnectionError):
+            breaker.call(fail)
+    clock.now += 61
+    breaker.call(lambda: 'ok')
+    assert breaker.state == CLOSED
+    assert breaker.stats()['calls'] == 1
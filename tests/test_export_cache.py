@@ -0,0 +1,75 @@
+import pytest
+
+from app import routes, storage
+from app.export_cache import ExportCache
+from app.image_store import ImageStore
+from app.routes import materials_export_key
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, 'DATA_DIR', str(tmp_path / 'data'))
+    monkeypatch.setattr(storage, 'LOCK_DIR', str(tmp_path / 'data' / '.locks'))
+    monkeypatch.setattr(storage, '_store', False)
+    monkeypatch.setattr(routes, 'image_store', ImageStore(str(tmp_path / 'images')))
+    cache = ExportCache(str(tmp_path / 'exports'), 1024 * 1024)
+    monkeypatch.setattr(storage, 'export_cache', cache)
+    storage.record_cache.clear()
+    yield cache
+    storage.record_cache.clear()
+
+
+def analysis():
+    return {
+        'course_topic': 'Python Programming',
+        'audience_type': 'beginner',
+        'course_materials': {
+            'generated_date': 'today',
+            'modules': [
+                {'number': 1, 'title': 'Basics', 'components': {'lesson_plan': '# L1'}},
+            ]
+        }
+    }
+
+
+def export(cache, analysis_id):
+    """Build (a stand-in for) the materials download and return its cache key."""
+    key = materials_export_key(analysis_id, storage.load_analysis(analysis_id), include_scorm=False)
+    assert b''.join(cache.tee(analysis_id, key, [b'PK', b'zip'])) == b'PKzip'
+    assert cache.get(analysis_id, key) is not None
+    return key
+
+
+def test_saving_changed_materials_drops_the_cached_download(cache):
+    storage.save_analysis('analysis_1', analysis())
+    key = export(cache, 'analysis_1')
+
+    changed = analysis()
+    changed['course_materials']['modules'][0]['components']['lesson_plan'] = '# L1, revised'
+    storage.save_analysis('analysis_1', changed)
+
+    assert cache.get('analysis_1', key) is None
+    assert materials_export_key('analysis_1', storage.load_analysis('analysis_1'), False) != key
+
+
+def test_material_writes_drop_the_cached_download(cache):
+    storage.save_analysis('analysis_1', analysis())
+
+    key = export(cache, 'analysis_1')
+    storage.save_material('analysis_1', 1, 'activities', {'raw_content': '# A1'})
+    assert cache.get('analysis_1', key) is None
+
+    key = export(cache, 'analysis_1')
+    materials = storage.load_analysis('analysis_1')['course_materials']
+    storage.update_analysis_fields('analysis_1', {'course_materials': {**materials, 'generated_date': 'tomorrow'}})
+    assert cache.get('analysis_1', key) is None
+
+
+def test_unrelated_fields_keep_the_cached_download(cache):
+    storage.save_analysis('analysis_1', analysis())
+    key = export(cache, 'analysis_1')
+
+    storage.update_analysis_fields('analysis_1', {'task_analysis': '## Tasks'})
+
+    assert cache.get('analysis_1', key) is not None
+    assert materials_export_key('analysis_1', storage.load_analysis('analysis_1'), False) == key
@@ -0,0 +1,145 @@
+import asyncio
+import itertools
+from types import SimpleNamespace
+
+import pytest
+
+from models import groq_client
+from models.groq_client import (AsyncGroqClient, GroqClient, ResponseCache, async_groq_session,
+                                fresh_responses, set_response_cache, track_usage)
+
+
+class MemoryCache(ResponseCache):
+    def __init__(self):
+        self.entries = {}
+
+    def get(self, key):
+        return self.entries.get(key)
+
+    def set(self, key, response):
+        self.entries[key] = response
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setenv('GROQ_API_KEY', 'test')
+    set_response_cache(MemoryCache())
+    drafts = itertools.count(1)
+
+    def create(**kwargs):
+        message = SimpleNamespace(content=f"draft {next(drafts)}")
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=None)
+
+    client = GroqClient('test-model')
+    monkeypatch.setattr(client, 'client',
+                        SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create))))
+    yield client
+    set_response_cache(None)
+
+
+def test_identical_requests_are_served_from_cache(client):
+    assert client.generate("Write module 1") == "draft 1"
+    assert client.generate("Write module 1") == "draft 1"
+
+
+def test_regenerations_return_fresh_text(client):
+    client.generate("Write module 1")
+    with fresh_responses():
+        first = client.generate("Write module 1")
+        second = client.generate("Write module 1")
+    assert (first, second) == ("draft 2", "draft 3")
+    # The latest regeneration replaces the cached answer
+    assert client.generate("Write module 1") == second
+
+
+class FakeStream:
+    """Stands in for a streamed completion: yields word chunks and records whether it was closed."""
+
+    def __init__(self, words):
+        self.words = words
+        self.closed = False
+
+    def __iter__(self):
+        for word in self.words:
+            delta = SimpleNamespace(content=word)
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=delta)], x_groq=None, usage=None)
+
+    def close(self):
+        self.closed = True
+
+
+def test_abandoned_stream_is_closed_and_counted(client, monkeypatch):
+    streams = []
+
+    def create(**kwargs):
+        streams.append(FakeStream(["one ", "two ", "three"]))
+        return streams[-1]
+
+    monkeypatch.setattr(client.client.chat.completions, 'create', create)
+    with track_usage() as usage:
+        chunks = client.generate_stream("Write module 1")
+        assert next(chunks) == "one "
+        chunks.close()
+
+    assert streams[0].closed
+    assert usage['calls'] == 1
+    # A partial answer is never cached
+    assert "".join(client.generate_stream("Write module 1")) == "one two three"
+    assert len(streams) == 2
+
+
+class FakeAsyncSDK:
+    """Stands in for AsyncGroq: counts requests and whether it was closed."""
+
+    def __init__(self):
+        self.requests = 0
+        self.closed = False
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    async def create(self, **kwargs):
+        self.requests += 1
+        message = SimpleNamespace(content=f"async draft {self.requests}")
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=None)
+
+    async def close(self):
+        self.closed = True
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+
+@pytest.fixture
+def sdk_clients(monkeypatch):
+    monkeypatch.setenv('GROQ_API_KEY', 'test')
+    set_response_cache(MemoryCache())
+    created = []
+
+    def new_client(api_key):
+        created.append(FakeAsyncSDK())
+        return created[-1]
+
+    monkeypatch.setattr(groq_client, '_new_async_sdk_client', new_client)
+    yield created
+    set_response_cache(None)
+
+
+def test_async_session_shares_one_client_and_closes_it(sdk_clients):
+    client = AsyncGroqClient('test-model')
+
+    async def run():
+        async with async_groq_session():
+            await asyncio.gather(*(client.generate(f"prompt {i}") for i in range(3)))
+            assert not sdk_clients[0].closed
+
+    asyncio.run(run())
+    assert len(sdk_clients) == 1
+    assert sdk_clients[0].requests == 3
+    assert sdk_clients[0].closed
+
+
+def test_async_call_outside_session_closes_its_client(sdk_clients):
+    asyncio.run(AsyncGroqClient('test-model').generate("prompt"))
+    assert [sdk.closed for sdk in sdk_clients] == [True]
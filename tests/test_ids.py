@@ -0,0 +1,39 @@
+from datetime import datetime, timezone
+
+from app import ids
+from app.ids import analysis_id_time, new_analysis_id
+
+
+def test_ids_in_the_same_millisecond_are_strictly_increasing():
+    now = datetime(2026, 10, 17, 6, 30, 52, 123456, tzinfo=timezone.utc)
+    generated = [new_analysis_id(now) for _ in range(100)]
+    assert generated == sorted(generated)
+    assert len(set(generated)) == len(generated)
+    assert all(analysis_id.startswith('analysis_20261017063052123_') for analysis_id in generated)
+
+
+def test_ids_sort_by_creation_time():
+    earlier = new_analysis_id(datetime(2026, 10, 17, 6, 30, 52, 999000, tzinfo=timezone.utc))
+    later = new_analysis_id(datetime(2026, 10, 17, 6, 30, 53, 0, tzinfo=timezone.utc))
+    assert earlier < later
+
+
+def test_random_part_wrapping_starts_a_fresh_sequence(monkeypatch):
+    now = datetime(2026, 10, 17, 6, 30, 52, tzinfo=timezone.utc)
+    monkeypatch.setattr(ids, '_last', ('20261017063052000', (1 << ids._RANDOM_BITS) - 1))
+    assert ids._ID_RE.match(new_analysis_id(now))
+
+
+def test_generated_ids_carry_their_utc_time():
+    now = datetime(2026, 10, 17, 6, 30, 52, 123000, tzinfo=timezone.utc)
+    assert analysis_id_time(new_analysis_id(now)) == now
+
+
+def test_legacy_ids_parse_as_naive_local_time():
+    assert analysis_id_time('analysis_20250703125358') == datetime(2025, 7, 3, 12, 53, 58)
+    assert new_analysis_id() > 'analysis_20250703125358'
+
+
+def test_other_ids_have_no_time():
+    for analysis_id in ('analysis_smoke', 'analysis_2025070312535', 'analysis_20261017063052123_0J5X8Q2M4R7TU', '', None):
+        assert analysis_id_time(analysis_id) is None
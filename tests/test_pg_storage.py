@@ -0,0 +1,125 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy.dialects import postgresql, sqlite
+
+from app import pg_storage, storage
+from app.pg_storage import PostgresAnalysisStore
+
+
+class Result:
+    def __init__(self, rows=(), rowcount=1):
+        self.rows = list(rows)
+        self.rowcount = rowcount
+
+    def first(self):
+        return self.rows[0] if self.rows else None
+
+
+class RecordingSession:
+    """Stands in for db.session: compiles each statement for psycopg2 and answers from a script."""
+
+    def __init__(self):
+        self.statements = []
+        self.results = []
+        self.commits = self.rollbacks = 0
+
+    def execute(self, clause, params):
+        compiled = clause.compile(dialect=postgresql.psycopg2.dialect())
+        # Every bind parameter in the SQL is supplied, and nothing supplied goes unused
+        assert set(compiled.params) == set(params)
+        self.statements.append((str(compiled), params))
+        return self.results.pop(0) if self.results else Result()
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+
+@pytest.fixture
+def session(monkeypatch):
+    session = RecordingSession()
+    monkeypatch.setattr(pg_storage, 'db', SimpleNamespace(
+        engine=SimpleNamespace(dialect=postgresql.psycopg2.dialect()), session=session))
+    return session
+
+
+@pytest.fixture
+def store(session):
+    return PostgresAnalysisStore(storage.RECORD_FIELDS, storage.MATERIALS_FIELD)
+
+
+def test_load_analysis_leaves_unrequested_records_in_the_database(store, session):
+    session.results.append(Result([({'course_topic': 'Python'},)]))
+
+    assert store.load_analysis('analysis_1', fields=['task_analysis']) == {'course_topic': 'Python'}
+    sql, params = session.statements[0]
+    assert "data - CAST(%(skipped)s AS text[])" in sql
+    assert 'task_analysis' not in params['skipped']
+    assert set(params['skipped']) == set(storage.RECORD_FIELDS) - {'task_analysis'} | {'course_materials'}
+
+
+def test_update_analysis_fields_merges_a_jsonb_patch(store, session):
+    assert store.update_analysis_fields('analysis_1', {'course_topic': 'Rust'}) is True
+    sql, params = session.statements[0]
+    assert "data = data || CAST(%(patch)s AS jsonb)" in sql
+    assert json.loads(params['patch']) == {'course_topic': 'Rust'}
+
+    session.results.append(Result(rowcount=0))
+    assert store.update_analysis_fields('missing', {'course_topic': 'Rust'}) is None
+    assert session.commits == 2
+
+
+def test_save_material_writes_one_component_in_place(store, session):
+    # The module query returns the module's 0-based position in the modules array
+    session.results.append(Result([(1,)]))
+
+    assert store.save_material('analysis_1', 2, 'lesson_plan', {'raw_content': '# L2'}) is True
+    (select_sql, select_params), (update_sql, update_params) = session.statements
+    assert select_sql.startswith("SELECT m.idx - 1 FROM analysis_log")
+    assert select_sql.endswith("FOR UPDATE OF analysis_log")
+    assert select_params == {'id': 'analysis_1', 'number': 2}
+    assert "'{}'::jsonb" in update_sql
+    assert update_params['components_path'] == ['course_materials', 'modules', '1', 'components']
+    assert update_params['component_path'] == ['course_materials', 'modules', '1', 'components', 'lesson_plan']
+    assert json.loads(update_params['material']) == {'raw_content': '# L2'}
+    assert session.commits == 1
+
+
+def test_save_material_for_unknown_module_writes_nothing(store, session):
+    assert store.save_material('analysis_1', 9, 'lesson_plan', {}) is False
+    assert len(session.statements) == 1
+    assert session.rollbacks == 1
+
+
+def test_failed_update_rolls_back_without_writing(store, session):
+    session.results.append(Result([({'course_topic': 'Python'},)]))
+
+    def mutate(data):
+        raise KeyError('course_materials')
+
+    with pytest.raises(KeyError):
+        store.update_analysis('analysis_1', mutate)
+    assert session.statements[0][0].endswith("FOR UPDATE")
+    assert len(session.statements) == 1
+    assert (session.commits, session.rollbacks) == (0, 1)
+
+
+def test_refuses_databases_other_than_postgres(store, monkeypatch):
+    monkeypatch.setattr(pg_storage.db, 'engine', SimpleNamespace(dialect=sqlite.dialect()))
+    with pytest.raises(RuntimeError):
+        store.analysis_exists('analysis_1')
+
+
+def test_postgres_backend_must_be_opted_into(monkeypatch):
+    monkeypatch.setattr(storage, '_store', None)
+    monkeypatch.setenv('ANALYSIS_STORAGE_BACKEND', 'postgres')
+    monkeypatch.delenv('ANALYSIS_STORAGE_EXPERIMENTAL', raising=False)
+    with pytest.raises(ValueError):
+        storage._database_store()
+
+    monkeypatch.setenv('ANALYSIS_STORAGE_EXPERIMENTAL', 'true')
+    assert isinstance(storage._database_store(), PostgresAnalysisStore)
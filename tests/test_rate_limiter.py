@@ -0,0 +1,121 @@
+from types import SimpleNamespace
+
+import groq
+import httpx
+import pytest
+
+from models import groq_client, rate_limiter
+from models.groq_client import GroqRateLimitError, _reserve_tokens, _retry_delay, _settle, get_rate_limiter
+from models.rate_limiter import CompletionEstimate, TokenBucketLimiter, backoff_delay, estimate_tokens
+
+
+def rate_limit_error(retry_after):
+    response = httpx.Response(429, headers={'retry-after': str(retry_after)},
+                              request=httpx.Request('POST', 'https://api.groq.com/openai/v1/chat/completions'))
+    return groq.RateLimitError("rate limited", response=response, body=None)
+
+
+@pytest.fixture
+def limiter(monkeypatch):
+    limiter = TokenBucketLimiter(requests_per_minute=60, tokens_per_minute=0)
+    monkeypatch.setattr(groq_client, '_rate_limiter', limiter)
+    monkeypatch.setenv('GROQ_BACKOFF_MAX', '60')
+    return limiter
+
+
+def test_backoff_never_exceeds_cap():
+    assert all(backoff_delay(attempt, base=1, cap=5) <= 5 for attempt in range(10))
+    assert backoff_delay(0, cap=5, retry_after=30) == 5
+
+
+def test_short_retry_after_pauses_every_caller(limiter):
+    delay = _retry_delay(rate_limit_error(2), attempt=0, reserved_tokens=0)
+    assert 2 <= delay <= 3
+    assert 1.5 < limiter.stats()['paused_for'] <= 3
+
+
+def test_retry_after_beyond_cap_fails_without_pausing(limiter):
+    with pytest.raises(GroqRateLimitError) as excinfo:
+        _retry_delay(rate_limit_error(3600), attempt=0, reserved_tokens=0)
+    assert excinfo.value.retry_after == 3600
+    assert limiter.stats()['paused_for'] == 0
+
+
+class FakeClock:
+    """Stands in for the time module; sleeping just advances the clock."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(rate_limiter, 'time', clock)
+    return clock
+
+
+def test_bucket_refills_at_its_per_minute_rate(clock):
+    limiter = TokenBucketLimiter(requests_per_minute=60, tokens_per_minute=600)
+    for _ in range(60):
+        assert limiter.acquire() == 0
+    # Empty: the next request waits one second for a refill
+    assert limiter.acquire() == pytest.approx(1.0)
+
+    clock.now += 30
+    assert limiter.stats()['requests_available'] == pytest.approx(30)
+    clock.now += 600
+    assert limiter.stats()['requests_available'] == 60  # never above capacity
+
+
+def test_token_budget_waits_and_settle_returns_unused_tokens(clock):
+    limiter = TokenBucketLimiter(requests_per_minute=0, tokens_per_minute=600)
+    assert limiter.acquire(tokens=500) == 0
+    assert limiter.acquire(tokens=200) == pytest.approx(10.0)  # 100 missing at 10 tokens/s
+
+    limiter.settle(reserved=200, used=50)
+    assert limiter.stats()['tokens_available'] == 150
+
+
+def test_pause_holds_back_callers_and_never_shortens(clock):
+    limiter = TokenBucketLimiter(requests_per_minute=60, tokens_per_minute=0)
+    limiter.pause(5)
+    limiter.pause(2)
+    assert limiter.stats()['paused_for'] == 5
+    assert limiter.acquire() == pytest.approx(5.0)
+    assert limiter.stats()['paused_for'] == 0
+
+
+def test_completion_estimate_follows_observed_usage():
+    estimate = CompletionEstimate(2048, weight=0.5)
+    estimate.observe(400)
+    estimate.observe(400)
+    assert estimate.tokens() == 813
+
+
+def test_reservation_uses_max_tokens_else_observed_completions(monkeypatch):
+    monkeypatch.setattr(groq_client, '_completion_estimate', CompletionEstimate(2048, weight=1))
+    monkeypatch.setattr(groq_client, '_rate_limiter', TokenBucketLimiter(tokens_per_minute=30000))
+    prompt_tokens = estimate_tokens("Write module 1")
+    assert _reserve_tokens("Write module 1", max_tokens=500) == prompt_tokens + 500
+
+    reserved = _reserve_tokens("Write module 1")
+    assert reserved == prompt_tokens + 2049
+    _settle(reserved, SimpleNamespace(total_tokens=310, completion_tokens=300))
+    assert _reserve_tokens("Write module 1") == prompt_tokens + 301
+
+
+def test_quota_is_shared_between_worker_processes(monkeypatch):
+    monkeypatch.setattr(groq_client, '_rate_limiter', None)
+    monkeypatch.setenv('GROQ_RPM', '30')
+    monkeypatch.setenv('GROQ_TPM', '30000')
+    monkeypatch.setenv('WEB_CONCURRENCY', '3')
+    monkeypatch.delenv('GROQ_PROCESSES', raising=False)
+    stats = get_rate_limiter().stats()
+    assert (stats['requests_per_minute'], stats['tokens_per_minute']) == (10, 10000)
@@ -0,0 +1,127 @@
+import json
+import os
+
+import pytest
+
+from app import storage
+
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, 'DATA_DIR', str(tmp_path))
+    monkeypatch.setattr(storage, 'LOCK_DIR', str(tmp_path / '.locks'))
+    monkeypatch.setattr(storage, '_store', False)
+    storage.record_cache.clear()
+    yield tmp_path
+    storage.record_cache.clear()
+
+
+def analysis():
+    return {
+        'course_topic': 'Python Programming',
+        'audience_type': 'beginner',
+        'audience_analysis': '## Audience',
+        'task_analysis': '## Tasks',
+        'course_materials': {
+            'generated_date': 'today',
+            'modules': [
+                {'number': 1, 'title': 'Basics', 'components': {'lesson_plan': '# L1', 'activities': '# A1'}},
+                {'number': 2, 'title': 'Functions', 'components': {'lesson_plan': '# L2'}},
+            ]
+        }
+    }
+
+
+def test_save_and_load_round_trip(data_dir):
+    storage.save_analysis('analysis_1', analysis())
+
+    assert storage.load_analysis('analysis_1') == analysis()
+    assert (data_dir / 'analysis_1' / 'course_materials' / 'module_2' / 'lesson_plan.json').exists()
+    assert storage.load_analysis('analysis_1', fields=()) == {'course_topic': 'Python Programming',
+                                                              'audience_type': 'beginner'}
+    assert storage.load_module('analysis_1', 1, components=['activities'])['components'] == {'activities': '# A1'}
+    assert storage.load_material('analysis_1', 2, 'lesson_plan') == '# L2'
+
+
+def test_saving_again_removes_records_that_are_gone(data_dir):
+    storage.save_analysis('analysis_1', analysis())
+    smaller = analysis()
+    del smaller['task_analysis']
+    smaller['course_materials']['modules'].pop()
+    storage.save_analysis('analysis_1', smaller)
+
+    assert storage.load_analysis('analysis_1') == smaller
+    assert not (data_dir / 'analysis_1' / 'task_analysis.json').exists()
+    assert not (data_dir / 'analysis_1' / 'course_materials' / 'module_2').exists()
+
+
+def test_update_fields_rewrites_only_their_records(data_dir):
+    storage.save_analysis('analysis_1', analysis())
+    root = data_dir / 'analysis_1' / 'analysis.json'
+    before = os.stat(root).st_ino
+
+    assert storage.update_analysis_fields('analysis_1', {'task_analysis': '## New tasks'})
+    assert os.stat(root).st_ino == before
+    assert storage.load_analysis('analysis_1')['task_analysis'] == '## New tasks'
+    assert storage.update_analysis_fields('analysis_missing', {'task_analysis': 'x'}) is None
+
+
+def test_update_fields_keeps_root_fields_set_with_materials(data_dir):
+    storage.save_analysis('analysis_1', analysis())
+    materials = {'modules': [{'number': 1, 'title': 'Only', 'components': {'quiz': '# Q'}}]}
+
+    storage.update_analysis_fields('analysis_1', {'course_materials': materials,
+                                                  'materials_generated_date': 'now'})
+
+    loaded = storage.load_analysis('analysis_1')
+    assert loaded['materials_generated_date'] == 'now'
+    assert loaded['course_materials'] == materials
+
+
+def test_save_material_adds_and_replaces_components(data_dir):
+    storage.save_analysis('analysis_1', analysis())
+
+    assert storage.save_material('analysis_1', 1, 'lesson_plan', '# L1 v2')
+    assert storage.save_material('analysis_1', 2, 'quiz', '# Q2')
+    assert not storage.save_material('analysis_1', 9, 'quiz', '# Q9')
+
+    modules = storage.load_analysis('analysis_1')['course_materials']['modules']
+    assert modules[0]['components'] == {'lesson_plan': '# L1 v2', 'activities': '# A1'}
+    assert list(modules[1]['components']) == ['lesson_plan', 'quiz']
+
+
+def test_update_analysis_applies_mutation_under_lock(data_dir):
+    storage.save_analysis('analysis_1', analysis())
+
+    def mutate(data):
+        data['course_materials']['modules'][1]['components']['lesson_plan'] = '# L2 v2'
+        data['last_edited'] = 'now'
+
+    saved = storage.update_analysis('analysis_1', mutate)
+    assert storage.load_analysis('analysis_1') == saved
+    assert saved['last_edited'] == 'now'
+    assert storage.load_material('analysis_1', 2, 'lesson_plan') == '# L2 v2'
+
+
+def test_legacy_single_file_is_read_and_converted_on_write(data_dir):
+    (data_dir / 'analysis_20250703125358.json').write_text(json.dumps(analysis()))
+
+    assert storage.analysis_exists('analysis_20250703125358')
+    assert storage.load_analysis('analysis_20250703125358') == analysis()
+    assert storage.load_material('analysis_20250703125358', 1, 'activities') == '# A1'
+
+    assert storage.save_material('analysis_20250703125358', 1, 'activities', '# A1 v2')
+    assert not (data_dir / 'analysis_20250703125358.json').exists()
+    assert (data_dir / 'analysis_20250703125358' / 'analysis.json').exists()
+    assert storage.load_material('analysis_20250703125358', 1, 'activities') == '# A1 v2'
+
+
+def test_cached_records_survive_callers_changing_loaded_documents(data_dir):
+    storage.save_analysis('analysis_1', analysis())
+    data = storage.load_analysis('analysis_1')
+    data['course_topic'] = 'Changed'
+    data['course_materials']['modules'][0]['components']['lesson_plan'] = '# Changed'
+    data['course_materials']['modules'].pop()
+
+    assert storage.load_analysis('analysis_1') == analysis()
+    assert storage.record_cache.stats()['hits'] > 0
@@ -0,0 +1,60 @@
+import itertools
+import re
+import threading
+
+import pytest
+
+from models.textbook_image_service import TextbookImageService
+
+
+def module_content(sections=5):
+    return "\n".join(
+        f"## Topic {n}\n\n" + f"Topic {n} explains one idea of the module in enough words to be a section. " * 3
+        for n in range(1, sections + 1)
+    )
+
+
+def image(n):
+    return {'source': 'unsplash', 'id': str(n), 'url': f"https://images.example/{n}.jpg",
+            'alt_text': f"Image {n}", 'attribution': "Photo on Unsplash"}
+
+
+@pytest.fixture
+def service(monkeypatch):
+    for key in ('UNSPLASH_ACCESS_KEY', 'PIXABAY_API_KEY', 'PEXELS_API_KEY'):
+        monkeypatch.delenv(key, raising=False)
+    return TextbookImageService()
+
+
+def embedded_urls(content):
+    return re.findall(r'<img src="([^"]+)"', content)
+
+
+def test_parallel_sections_never_share_an_image(service, monkeypatch):
+    calls = itertools.count()
+    # Every section's first search runs at once and finds the same image
+    first_round = threading.Barrier(4, timeout=5)
+
+    def get_single_image(search_term, image_type="concept"):
+        n = next(calls)
+        if n < 4:
+            first_round.wait()
+            return image(0)
+        return image(n % 4)
+
+    monkeypatch.setattr(service, '_get_single_image', get_single_image)
+    urls = embedded_urls(service.embed_images_in_content(module_content(), "Module 1"))
+
+    assert len(urls) == len(set(urls)) == 4
+
+
+def test_sections_without_a_unique_image_stay_empty(service, monkeypatch):
+    # Searches only ever find two different images for four sections
+    lookups = itertools.count()
+    monkeypatch.setattr(service, '_get_single_image', lambda *args: image(next(lookups) % 2))
+
+    urls = embedded_urls(service.embed_images_in_content(module_content(), "Module 1"))
+
+    assert sorted(urls) == [image(0)['url'], image(1)['url']]
+    # Nothing is tracked once the call has finished
+    assert service.used_images_per_module == {}
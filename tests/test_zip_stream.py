@@ -0,0 +1,44 @@
+import io
+import zipfile
+
+from app.zip_stream import stream_zip
+
+
+def test_streamed_archive_round_trips(tmp_path):
+    large = tmp_path / 'figure.png'
+    large.write_bytes(bytes(range(256)) * 1024)  # several chunks
+    entries = [
+        ('module_1/lesson_plan.md', '# Lesson plan\n'),
+        ('module_1/slides.pptx', b'\x00binary\xff'),
+        ('module_1/images/figure.png', large),
+    ]
+
+    chunks = list(stream_zip(iter(entries), chunk_size=4096))
+    assert len(chunks) > 1
+
+    with zipfile.ZipFile(io.BytesIO(b''.join(chunks))) as archive:
+        assert archive.testzip() is None
+        assert archive.namelist() == [name for name, _ in entries]
+        assert archive.read('module_1/lesson_plan.md') == b'# Lesson plan\n'
+        assert archive.read('module_1/slides.pptx') == b'\x00binary\xff'
+        assert archive.read('module_1/images/figure.png') == large.read_bytes()
+
+
+def test_duplicate_arcnames_keep_the_first_entry():
+    data = b''.join(stream_zip([('notes.md', 'first'), ('notes.md', 'second'), ('other.md', 'x')]))
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        assert archive.namelist() == ['notes.md', 'other.md']
+        assert archive.read('notes.md') == b'first'
+
+
+def test_entries_are_consumed_lazily():
+    consumed = []
+
+    def entries():
+        for name in ('a.md', 'b.md'):
+            consumed.append(name)
+            yield name, name
+
+    stream = stream_zip(entries())
+    next(stream)
+    assert consumed == ['a.md']